@@ -1,78 +1,57 @@
 from __future__ import annotations
 import os
 import re
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, NamedTuple
 
+import numpy as np
 import pymongo
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from dotenv import load_dotenv
 
+from caching import page_cache
+from planner import DAYS, DEFAULT_PLANNER_CONFIG, PlanOutdated, plan_days, pool_key
+from planner_config import PlannerConfig, compile_config
+from plan_codec import CODEC_FIELDS, PLAN_FORMAT, FoodTable, decode_doc, encode_day, encode_plan
+from plan_events import plan_events, plan_diff
+from rebuild_lease import run_with_lease
+from rollups import rollup_plan, week_start_of
+from quantity import parse_quantity
+
 load_dotenv()
 
 cxn = pymongo.MongoClient(os.getenv("MONGO_URI"))
 food_db = cxn[os.getenv("MONGO_DBNAME")]
 
+# default time budget for the local-search pass after the greedy planner (0 = off),
+# for users who did not set their own optimize_ms
+PLAN_OPTIMIZE_MS = float(os.getenv("PLAN_OPTIMIZE_MS", "0"))
+# "daemon" leaves plan rebuilds after grocery list changes to plan_daemon.py
+PLAN_REBUILDS = os.getenv("PLAN_REBUILDS", "inline")
 
-DAYS: list[str] = [
-    "Monday",
-    "Tuesday",
-    "Wednesday",
-    "Thursday",
-    "Friday",
-    "Saturday",
-    "Sunday",
-]
-
-CALORIE_GOALS: dict[str, float] = {
-    "Breakfast": 450,
-    "Lunch": 650,
-    "Dinner": 650,
-}
 
-MEAL_COMPOSITION: dict[str, dict[str, int]] = {
-    "Breakfast": {
-        "Fruit": 1,
-        "Dairy": 1,
-        "Protein": 1,
-    },
-    "Lunch": {
-        "Protein": 1,
-        "Vegetable": 2,
-        "Grain": 1,
-        "Fruit": 1,
-        "Dairy": 1,
-    },
-    "Dinner": {
-        "Protein": 1,
-        "Vegetable": 2,
-        "Grain": 1,
-        "Fruit": 1,
-        "Dairy": 1,
-    },
-}
+MEAL_NAMES: tuple[str, ...] = ("Breakfast", "Lunch", "Dinner")
 
-MEAL_CALORIE_SPLITS: dict[str, dict[str, float]] = {
-    "Breakfast": {
-        "Protein": 0.35,
-        "Dairy": 0.40,
-        "Fruit": 0.25,
-    },
-    "Lunch": {
-        "Protein": 0.35,
-        "Vegetable": 0.30,
-        "Grain": 0.25,
-        "Fruit": 0.05,
-        "Dairy": 0.05,
-    },
-    "Dinner": {
-        "Protein": 0.35,
-        "Vegetable": 0.30,
-        "Grain": 0.25,
-        "Fruit": 0.05,
-        "Dairy": 0.05,
-    },
+NUTRIENTS: tuple[str, ...] = ("protein", "carbs", "fiber", "sugar", "fat")
+# foodstats fields (grams per 100 g) tried in order for each nutrient
+NUTRIENT_FIELDS: dict[str, tuple[str, ...]] = {
+    "protein": ("Protein",),
+    "carbs": ("Carbohydrate", "Carbohydrates", "Carbs"),
+    "fiber": ("Fiber", "Dietary Fiber"),
+    "sugar": ("Sugar", "Sugars"),
+    "fat": ("Fat", "Total Fat"),
 }
 
+PLANNER_CONFIG_CACHE_SIZE = int(os.getenv("PLANNER_CONFIG_CACHE_SIZE", "1000"))
+_planner_configs: OrderedDict[str, PlannerConfig] = OrderedDict()
+_planner_configs_lock = threading.Lock()
+# Newest plan input version this process has seen per user (see bump_list_version)
+_latest_inputs: dict[str, int] = {}
+
 
 def search_food_data(food_name):
     doc = food_db.foodstats.find_one({"Name": {"$regex": food_name, "$options": "i"}})
@@ -105,6 +84,89 @@ def get_usda_record(food_name: str) -> dict[str, Any] | None:
     return food_db.foodstats.find_one({"Name": {"$regex": food_name, "$options": "i"}})
 
 
+def resolve_food_records(
+    food_names: list[str], extra_fields: tuple[str, ...] = ()
+) -> dict[str, dict[str, Any] | None]:
+    """
+    Look up many foods in one foodstats query. Each name maps to the first
+    record (in natural order) whose Name contains it, like get_usda_record.
+    Names are matched ignoring case, so "Rice" and "rice" share one pattern.
+    """
+    keys = {name: name.casefold() for name in food_names if name}
+    if not keys:
+        return {}
+    patterns = {key: re.compile(re.escape(key), re.IGNORECASE) for key in dict.fromkeys(keys.values())}
+    resolved: dict[str, dict[str, Any] | None] = {key: None for key in patterns}
+    cursor = food_db.foodstats.find(
+        {"Name": {"$in": list(patterns.values())}},
+        {"Name": 1, "Category": 1, "Calories": 1, **{field: 1 for field in extra_fields}},
+    )
+    unresolved = len(patterns)
+    for record in cursor:
+        for key, pattern in patterns.items():
+            if resolved[key] is None and pattern.search(record.get("Name", "")):
+                resolved[key] = record
+                unresolved -= 1
+        if unresolved == 0:
+            break
+    return {name: resolved[key] for name, key in keys.items()}
+
+
+def nutrient_matrix(food_names: list[str]) -> np.ndarray:
+    """
+    Grams of each nutrient (columns, in NUTRIENTS order) per gram of each food
+    (rows), from one foodstats query. Unknown foods get a row of zeros.
+    """
+    fields = tuple(field for names in NUTRIENT_FIELDS.values() for field in names)
+    records = resolve_food_records(food_names, fields)
+    matrix = np.zeros((len(food_names), len(NUTRIENTS)))
+    for row, name in enumerate(food_names):
+        record = records.get(name) or {}
+        for col, nutrient in enumerate(NUTRIENTS):
+            values = [record[f] for f in NUTRIENT_FIELDS[nutrient] if isinstance(record.get(f), (int, float))]
+            matrix[row, col] = values[0] / 100 if values else 0.0
+    return matrix
+
+
+def nutrient_dict(vector: Any) -> dict[str, float]:
+    return {nutrient: round(float(value), 1) for nutrient, value in zip(NUTRIENTS, vector)}
+
+
+def sum_nutrients(parts: list[dict[str, float]]) -> dict[str, float]:
+    """Add up "nutrients" dicts (missing nutrients count as zero)."""
+    totals = np.zeros(len(NUTRIENTS))
+    for part in parts:
+        totals += [part.get(nutrient, 0.0) for nutrient in NUTRIENTS]
+    return nutrient_dict(totals)
+
+
+def attach_nutrients(plans: dict[str, Any], days: list[str]) -> dict[str, dict[str, float]]:
+    """
+    Join nutrient totals into a plan in place: every item and meal gets a
+    "nutrients" dict. Meal totals are one matrix product, the grams of each
+    food per meal slot times the nutrients per gram of each food.
+    Returns the totals for each of `days`.
+    """
+    slots = [(day, meal) for day in days for meal in MEAL_NAMES]
+    names = sorted({item["foodName"] for day, meal in slots
+                    for item in plans[day].get(meal, {}).get("items", [])})
+    index = {name: i for i, name in enumerate(names)}
+    per_gram = nutrient_matrix(names) if names else np.zeros((0, len(NUTRIENTS)))
+
+    grams = np.zeros((len(slots), len(names)))
+    for row, (day, meal) in enumerate(slots):
+        for item in plans[day].get(meal, {}).get("items", []):
+            grams[row, index[item["foodName"]]] += item["grams"]
+            item["nutrients"] = nutrient_dict(per_gram[index[item["foodName"]]] * item["grams"])
+    meal_totals = grams @ per_gram
+    for row, (day, meal) in enumerate(slots):
+        if meal in plans[day]:
+            plans[day][meal]["nutrients"] = nutrient_dict(meal_totals[row])
+
+    day_totals = meal_totals.reshape(len(days), len(MEAL_NAMES), len(NUTRIENTS)).sum(axis=1)
+    return {day: nutrient_dict(day_totals[i]) for i, day in enumerate(days)}
+
+
 def get_calories_per_gram(food_name: str) -> float:
     record = get_usda_record(food_name)
     if record and record.get("Calories") is not None:
@@ -119,16 +181,144 @@ def get_food_category(food_name: str) -> str:
     return "Unknown"
 
 
+def item_grams(item: dict[str, Any]) -> float:
+    """
+    Grams for a current_list row (or a merged pool row), parsing the amount
+    only for rows not yet migrated to the numeric grams field.
+    """
+    if "parts" in item:
+        return sum(item_grams({**part, "name": item["name"]}) for part in item["parts"])
+    grams = item.get("grams")
+    if isinstance(grams, (int, float)):
+        return float(grams)
+    return parse_quantity(item.get("amount", 0), item.get("name", ""))
+
+
+class PoolSnapshot(NamedTuple):
+    """A user's merged grocery rows and the versions they were read at."""
+    items: list[dict[str, Any]]
+    settings_version: int
+    input_version: int
+
+
+def fetch_pool_snapshot(user_id: str) -> PoolSnapshot:
+    """
+    Load a user's grocery list with duplicate entries (same food name and
+    breakfast flag) merged by a $group in Mongo. Each merged row keeps the
+    _id and grams of the entries it came from so consumption can be written
+    back to them. The user's planner settings version and plan input version
+    are looked up in the same aggregation, so planning needs no separate
+    version reads.
+    """
+    pipeline = [
+        {"$match": {"username": user_id}},
+        {"$group": {
+            "_id": {
+                "name": {"$trim": {"input": {"$toLower": "$name"}}},
+                "breakfast": {"$eq": [{"$toLower": {"$ifNull": ["$time_in_day", ""]}}, "breakfast"]},
+            },
+            "name": {"$first": "$name"},
+            "food_type": {"$first": "$food_type"},
+            "calories": {"$sum": "$calories"},
+            "parts": {"$push": {
+                "_id": "$_id",
+                "grams": {"$ifNull": ["$grams", None]},
+                "amount": {"$ifNull": ["$amount", ""]},
+            }},
+        }},
+        {"$sort": {"_id.name": 1, "_id.breakfast": 1}},
+        {"$project": {
+            "_id": 0,
+            "name": 1,
+            "food_type": 1,
+            "calories": 1,
+            "time_in_day": {"$cond": ["$_id.breakfast", "breakfast", "empty"]},
+            "parts": 1,
+        }},
+        # Fold the rows into one document so list_versions is looked up once
+        {"$group": {"_id": user_id, "items": {"$push": "$$ROOT"}}},
+        {"$lookup": {"from": "list_versions", "localField": "_id", "foreignField": "username", "as": "versions"}},
+    ]
+    result = next(food_db["current_list"].aggregate(pipeline), None)
+    if result is None:
+        return PoolSnapshot([], 0, 0)
+    versions = (result.get("versions") or [{}])[0]
+    input_version = versions.get("input_version", 0)
+    note_input_version(user_id, input_version)
+    return PoolSnapshot(result["items"], versions.get("settings_version", 0), input_version)
+
+
+def fetch_pool_items(user_id: str) -> list[dict[str, Any]]:
+    """The merged grocery rows from fetch_pool_snapshot, without the versions."""
+    return fetch_pool_snapshot(user_id).items
+
+
+#== PLANNER SETTINGS ==#
+def get_planner_config(user_id: str, settings_version: int) -> PlannerConfig:
+    """
+    The compiled planner config for a user. Compiled configs are cached in
+    this worker by settings version, so planner_settings is only read the
+    first time a version is seen. Users who never saved settings (version 0)
+    get the defaults.
+    """
+    if not settings_version:
+        return DEFAULT_PLANNER_CONFIG
+    with _planner_configs_lock:
+        config = _planner_configs.get(user_id)
+        if config is not None and config.version == settings_version:
+            _planner_configs.move_to_end(user_id)
+            return config
+
+    doc = food_db.planner_settings.find_one({"username": user_id}) or {}
+    try:
+        config = compile_config(
+            doc["calorie_goals"], doc["meal_composition"], doc["meal_calorie_splits"],
+            doc.get("settings_version", settings_version), doc.get("optimize_ms"),
+        )
+    except (KeyError, TypeError, ZeroDivisionError) as e:
+        print(f"Bad planner settings for {user_id}, using defaults: {e}")
+        return DEFAULT_PLANNER_CONFIG
+    with _planner_configs_lock:
+        _planner_configs[user_id] = config
+        _planner_configs.move_to_end(user_id)
+        while len(_planner_configs) > PLANNER_CONFIG_CACHE_SIZE:
+            _planner_configs.popitem(last=False)
+    return config
+
+
+def optimize_budget(config: PlannerConfig) -> float:
+    """Milliseconds of local search for a plan built with `config`."""
+    return PLAN_OPTIMIZE_MS if config.optimize_ms is None else config.optimize_ms
+
+
+def save_planner_settings(user_id: str, settings: dict[str, Any]) -> PlannerConfig:
+    """
+    Store a user's (already validated) planner settings under a new settings
+    version and rebuild their plan with them.
+    """
+    # New settings also make plans built with the old ones outdated
+    versions = inc_versions(user_id, {"settings_version": 1, "input_version": 1})
+    version = versions["settings_version"]
+    note_input_version(user_id, versions["input_version"])
+    food_db.planner_settings.update_one(
+        {"username": user_id},
+        {"$set": {**settings, "settings_version": version, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    request_plan_rebuild(user_id)
+    return get_planner_config(user_id, version)
+
+
 def build_food_pool(grocery_items: list[dict[str, Any]]) -> list[dict[str, Any]]:
     pool: list[dict[str, Any]] = []
     for item in grocery_items:
         name = item["name"]
-        total_grams = parse_grams(item.get("amount", 0))
+        total_grams = item_grams(item)
         total_calories = float(item.get("calories", 0))
         cal_per_gram = (total_calories / total_grams) if total_grams > 0 else 0.0
         pool.append(
             {
-                "_db_id": item["_id"],
+                "_db_parts": item.get("parts") or [{"_id": item["_id"], "grams": item.get("grams")}],
                 "foodName": name,
                 "foodCategory": item.get("food_type", "Unknown"),
                 "isBreakfast": item.get("time_in_day", "").lower() == "breakfast",
@@ -141,142 +331,389 @@ def build_food_pool(grocery_items: list[dict[str, Any]]) -> list[dict[str, Any]]
     return pool
 
 
-def update_current_list_amounts(pool: list[dict[str, Any]]) -> None:
+def update_current_list_amounts(user_id: str, pool: list[dict[str, Any]]) -> None:
+    """
+    Take the grams the plan used out of current_list in one bulk $inc write.
+    For merged pool rows the usage is taken from the original entries in turn.
+    """
+    operations = []
     for item in pool:
         grams_used = item["original_grams"] - item["remaining_grams"]
-        if grams_used > 0:
-            food_db["current_list"].update_one(
-                {"_id": item["_db_id"]},
-                {"$set": {"amount": str(int(round(item["remaining_grams"])))}}
-            )
+        for part in item["_db_parts"]:
+            if grams_used <= 0:
+                break
+            available = part.get("grams")
+            if not isinstance(available, (int, float)) or available <= 0:
+                continue
+            take = min(grams_used, available)
+            operations.append(UpdateOne(
+                {"_id": part["_id"], "grams": {"$exists": True}},
+                {"$inc": {"grams": -take}},
+            ))
+            grams_used -= take
+    if operations:
+        food_db["current_list"].bulk_write(operations, ordered=False)
+        bump_list_version(user_id)
+
+
+def bump_list_version(user_id: str, plan_input: bool = True) -> int:
+    """
+    Count a change to the user's grocery list. Changes plans are built from
+    (plan_input) also advance input_version, so rebuilds still working from
+    older inputs stop early and their plan writes are dropped.
+    """
+    doc = inc_versions(user_id, {"version": 1, "input_version": 1} if plan_input else {"version": 1})
+    if plan_input:
+        note_input_version(user_id, doc["input_version"])
+    page_cache.invalidate(user_id)
+    return doc["version"]
+
+
+def inc_versions(user_id: str, counters: dict[str, int]) -> dict[str, Any]:
+    """
+    Advance counters of the user's list_versions document and return it.
+    changed_at (indexed) is set to the server time, for plan_daemon.py's polling.
+    Two first-time upserts can race; the unique username index turns the
+    loser into a DuplicateKeyError, and retrying it updates the winner's document.
+    """
+    update = {"$inc": counters, "$currentDate": {"changed_at": True}}
+    try:
+        return food_db.list_versions.find_one_and_update(
+            {"username": user_id}, update, upsert=True, return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:
+        return food_db.list_versions.find_one_and_update(
+            {"username": user_id}, update, return_document=ReturnDocument.AFTER)
+
+
+def get_list_version(user_id: str) -> int:
+    doc = food_db.list_versions.find_one({"username": user_id}, {"version": 1})
+    return doc["version"] if doc else 0
+
+
+def get_input_version(user_id: str) -> int:
+    doc = food_db.list_versions.find_one({"username": user_id}, {"input_version": 1})
+    return (doc or {}).get("input_version", 0)
+
+
+def note_input_version(user_id: str, version: int) -> None:
+    if version > _latest_inputs.get(user_id, 0):
+        _latest_inputs[user_id] = version
+
+
+def input_outdated(user_id: str, version: int) -> bool:
+    """True if this process has seen newer plan inputs for the user than `version`."""
+    return _latest_inputs.get(user_id, 0) > version
+
+
+def apply_gram_changes(user_id: str, changes: dict[str, float]) -> int:
+    """
+    Add grams back to (or, for negative values, take grams from) the user's
+    current_list items by food name. Every change is an atomic $inc and all of
+    them go to Mongo in a single bulk_write. Returns the number of items changed.
+    """
+    operations = [
+        UpdateOne(
+            {"username": user_id, "name": food_name, "grams": {"$exists": True}},
+            # grams_restored_at tells plan_daemon.py this write came from a plan edit
+            {"$inc": {"grams": grams}, "$set": {"grams_restored_at": datetime.now(timezone.utc)}},
+        )
+        for food_name, grams in changes.items()
+        if grams
+    ]
+    if not operations:
+        return 0
+    result = food_db["current_list"].bulk_write(operations, ordered=False)
+    if result.modified_count:
+        # Grams handed back by a plan edit don't make running rebuilds outdated
+        bump_list_version(user_id, plan_input=False)
+    return result.modified_count
 
 
 def restore_grams_to_current_list(
     user_id: str, food_name: str, grams: float
 ) -> None:
-    item = food_db["current_list"].find_one({"username": user_id, "name": food_name})
-    if item:
-        current = parse_grams(item.get("amount", "0"))
-        food_db["current_list"].update_one(
-            {"_id": item["_id"]},
-            {"$set": {"amount": str(int(round(current + grams)))}}
-        )
-
-
-def fill_meal_slot(
-    pool: list[dict[str, Any]],
-    meal_name: str,
-    calorie_goal: float,
-    used_protein_today: set[str],
-) -> tuple[list[dict[str, Any]], float, list[str]]:
-    is_breakfast = meal_name == "Breakfast"
-    composition = MEAL_COMPOSITION[meal_name]
-    splits = MEAL_CALORIE_SPLITS[meal_name]
-
-    cat_budget: dict[str, float] = {
-        cat: calorie_goal * splits[cat] for cat in composition
-    }
-
-    selected: list[dict[str, Any]] = []
-    total_used = 0.0
-    missing_categories: list[str] = []
+    apply_gram_changes(user_id, {food_name: grams})
 
-    for category, quota in composition.items():
-        budget = cat_budget[category]
-        items_used = 0
 
-        candidates = [
-            f for f in pool
-            if f["foodCategory"] == category
-            and f["isBreakfast"] == is_breakfast
-            and f["remaining_grams"] > 0
-            and f["cal_per_gram"] > 0
-        ]
-
-        if not candidates:
-            missing_categories.append(category)
-            continue
-
-        candidates.sort(key=lambda f: f["remaining_grams"], reverse=True)
-
-        for food in candidates:
-            if budget <= 0 or items_used >= quota:
-                break
-
-            max_grams_by_calories = budget / food["cal_per_gram"]
-            grams_used = min(food["remaining_grams"], max_grams_by_calories)
-
-            if grams_used < 0.1:
-                continue
-
-            calories_used = grams_used * food["cal_per_gram"]
-
-            selected.append(
-                {
-                    "foodName": food["foodName"],
-                    "foodCategory": category,
-                    "grams": int(round(grams_used)),
-                    "calories": round(calories_used, 1),
-                }
-            )
-
-            food["remaining_grams"] -= grams_used
-            food["remaining_calories"] -= calories_used
-            budget -= calories_used
-            total_used += calories_used
-            items_used += 1
-
-            if category == "Protein Foods":
-                used_protein_today.add(food["foodName"])
-
-    return selected, round(total_used, 1), missing_categories
+def outdated_plan() -> dict[str, Any]:
+    """What a rebuild returns when newer inputs arrived before it could store its plan."""
+    return {"plan": {}, "missing_categories": [], "outdated": True}
 
 
 def build_meal_plan(user_id: str) -> dict[str, Any]:
-    grocery_items = list(food_db["current_list"].find({"username": user_id}))
-    if not grocery_items:
-        push_weekly_plan(user_id,{},[])
+    """
+    Build and store the user's plan for the current week. Returns
+    outdated_plan() if newer inputs arrived first (their rebuild wins).
+    """
+    snapshot = fetch_pool_snapshot(user_id)
+    if not snapshot.items:
+        push_weekly_plan(user_id, {}, [], input_version=get_input_version(user_id))
         return {}
 
-    pool = build_food_pool(grocery_items)
-    weekly_plan: dict[str, Any] = {}
-    all_missing: set[str] = set()
-
-    for day in DAYS:
-        daily_plan: dict[str, Any] = {}
-        used_protein_today: set[str] = set()
-
-        for meal in ("Breakfast", "Lunch", "Dinner"):
-            goal = CALORIE_GOALS[meal]
-            items, total_cal, missing = fill_meal_slot(
-                pool, meal, goal, used_protein_today)
-            all_missing.update(missing)
-            daily_plan[meal] = {
-                "items": items,
-                "total_calories": total_cal,
-                "calorie_goal": goal,
-            }
-
-        weekly_plan[day] = daily_plan
-
-    push_weekly_plan(user_id, weekly_plan, sorted(all_missing))
-    return {"plan": weekly_plan, "missing_categories": sorted(all_missing)}
+    pool = build_food_pool(snapshot.items)
+    config = get_planner_config(user_id, snapshot.settings_version)
+    try:
+        weekly_plan, missing_by_day, checkpoints = plan_days(
+            pool, DAYS, optimize_budget(config), config, lambda: input_outdated(user_id, snapshot.input_version))
+    except PlanOutdated:
+        print(f"Abandoned an outdated plan rebuild for {user_id} (input version {snapshot.input_version})")
+        return outdated_plan()
+    all_missing = sorted({cat for missing in missing_by_day.values() for cat in missing})
+    day_nutrients = attach_nutrients(weekly_plan, DAYS)
+
+    written = push_weekly_plan(user_id, weekly_plan, all_missing, {
+        "pool_keys": [pool_key(f) for f in pool],
+        "pool_grams": [round(f["original_grams"], 2) for f in pool],
+        "days": checkpoints,
+        "missing_by_day": missing_by_day,
+        "settings_version": snapshot.settings_version,
+    }, sum_nutrients(list(day_nutrients.values())), snapshot.input_version)
+    if not written:
+        return outdated_plan()
+    return {"plan": weekly_plan, "missing_categories": all_missing}
+
+
+def request_plan_rebuild(user_id: str) -> None:
+    """
+    Rebuild a user's plan after their grocery list changed, unless
+    plan_daemon.py does it. If another worker is rebuilding the user already,
+    it is asked to run once more instead.
+    """
+    if PLAN_REBUILDS == "daemon":
+        return
+    run_with_lease(food_db, user_id, lambda: build_meal_plan(user_id))
+
+
+def align_checkpoint(
+    pool: list[dict[str, Any]], checkpoint: dict[str, Any], day: str
+) -> list[float]:
+    """
+    Remaining grams before `day` for each entry of a freshly built pool. Grams
+    added to or removed from the grocery list since the checkpoint was taken
+    (e.g. restored by a delete) are applied on top; new foods are untouched.
+    """
+    saved = dict(zip(checkpoint["pool_keys"], zip(checkpoint["pool_grams"], checkpoint["days"][day])))
+    remaining: list[float] = []
+    for food in pool:
+        entry = saved.get(pool_key(food))
+        if entry is None:
+            remaining.append(round(food["original_grams"], 2))
+        else:
+            grams, left = entry
+            remaining.append(round(max(0.0, left + food["original_grams"] - grams), 2))
+    return remaining
+
+
+def replan_from_day(user_id: str, day: str) -> dict[str, Any]:
+    """
+    Recompute the plan from `day` to the end of the week, keeping earlier days.
+    The pool is restored from the checkpoint recorded before `day` instead of
+    replaying the days before it. Falls back to a full rebuild when there is
+    no usable checkpoint or the planner settings changed since it was taken.
+    """
+    start = DAYS.index(day)
+    projection = {"checkpoints": 1, "plan_format": 1, "foods": 1, **{
+        f"plan.{earlier}.{meal}.nutrients": 1 for earlier in DAYS[:start] for meal in MEAL_NAMES
+    }}
+    subscribed = plan_events.wants_diff(user_id)
+    if subscribed:
+        # The days being replaced, to work out the diff
+        projection.update({f"plan.{later}": 1 for later in DAYS[start:]})
+    doc = food_db.weeklymeals.find_one(plan_filter(user_id), projection)
+    checkpoint = (doc or {}).get("checkpoints") or {}
+    # Plans stored before the compact format are rebuilt (and so converted) whole
+    if start == 0 or day not in checkpoint.get("days", {}) or doc.get("plan_format") != PLAN_FORMAT:
+        return build_meal_plan(user_id)
+
+    snapshot = fetch_pool_snapshot(user_id)
+    config = get_planner_config(user_id, snapshot.settings_version)
+    if not snapshot.items or checkpoint.get("settings_version", 0) != snapshot.settings_version:
+        return build_meal_plan(user_id)
+    pool = build_food_pool(snapshot.items)
+
+    for food, remaining in zip(pool, align_checkpoint(pool, checkpoint, day)):
+        food["remaining_grams"] = remaining
+        food["remaining_calories"] = remaining * food["cal_per_gram"]
+
+    later_days = DAYS[start:]
+    try:
+        plans, missing_by_day, checkpoints = plan_days(
+            pool, later_days, optimize_budget(config), config, lambda: input_outdated(user_id, snapshot.input_version))
+    except PlanOutdated:
+        return outdated_plan()
+    missing_by_day = {**checkpoint.get("missing_by_day", {}), **missing_by_day}
+    all_missing = sorted({cat for missing in missing_by_day.values() for cat in missing})
+    day_nutrients = attach_nutrients(plans, later_days)
+    earlier_meals = [meal.get("nutrients", {}) for earlier in DAYS[:start]
+                     for meal in doc.get("plan", {}).get(earlier, {}).values()]
+
+    fields: dict[str, Any] = {
+        "missing_categories": all_missing,
+        "nutrition_week": sum_nutrients(earlier_meals + list(day_nutrients.values())),
+        "checkpoints.pool_keys": [pool_key(f) for f in pool],
+        "checkpoints.pool_grams": [round(f["original_grams"], 2) for f in pool],
+        "checkpoints.missing_by_day": missing_by_day,
+        "input_version": snapshot.input_version,
+        "updated_at": datetime.now(timezone.utc),
+        "rollups_stale": ObjectId(),
+    }
+    # Earlier checkpoints have to follow the new pool layout too
+    for earlier in DAYS[1:start]:
+        if earlier in checkpoint["days"]:
+            fields[f"checkpoints.days.{earlier}"] = align_checkpoint(pool, checkpoint, earlier)
+    table = FoodTable(doc.get("foods"))
+    for later in later_days:
+        fields[f"plan.{later}"] = encode_day(plans[later], table)
+        fields[f"checkpoints.days.{later}"] = checkpoints[later]
+    if table.grown:
+        fields["foods"] = table.foods
+    result = food_db.weeklymeals.update_one(
+        current_inputs(plan_filter(user_id), snapshot.input_version), {"$set": fields})
+    if not result.matched_count:
+        return outdated_plan()
+    if subscribed:
+        new = decode_doc({"plan": {later: fields[f"plan.{later}"] for later in later_days},
+                          "plan_format": PLAN_FORMAT, "foods": table.foods})
+        plan_events.publish(user_id, plan_diff(decode_doc(doc)["plan"], new["plan"], later_days))
+    page_cache.invalidate(user_id)
+    return {"replanned_days": later_days, "plan": plans, "missing_categories": all_missing}
 
 
 def push_weekly_plan(
-    user_id: str, plan: dict[str, Any], missing_categories: list[str]
-) -> None:
-    food_db.weeklymeals.update_one(
-        {"username": user_id},
-        {
-            "$set": {
-                "plan": plan,
-                "missing_categories": missing_categories,
-                "updated_at": datetime.now(timezone.utc),
-            }
-        },
-        upsert=True,
-    )
+    user_id: str,
+    plan: dict[str, Any],
+    missing_categories: list[str],
+    checkpoints: dict[str, Any] | None = None,
+    nutrition_week: dict[str, float] | None = None,
+    input_version: int | None = None,
+) -> bool:
+    """
+    Store a freshly built plan. With `input_version` (the list_versions
+    input_version it was built from) the write only replaces a plan built
+    from the same or older inputs. Returns False when the write was dropped.
+    """
+    encoded, table = encode_plan(plan)
+    fields = {
+        "plan": encoded,
+        "plan_format": PLAN_FORMAT,
+        "foods": table.foods,
+        "missing_categories": missing_categories,
+        "checkpoints": checkpoints or {},
+        "nutrition_week": nutrition_week or sum_nutrients([]),
+        "updated_at": datetime.now(timezone.utc),
+        "rollups_stale": ObjectId(),
+    }
+    query = plan_filter(user_id)
+    wants_diff = plan_events.wants_diff(user_id)
+    # Open pages (or a JSON response) get a diff, so fetch the plan being replaced in the same round trip
+    projection = {"plan": 1, **dict.fromkeys(CODEC_FIELDS, 1)} if wants_diff else {"_id": 1}
+    try:
+        if input_version is None:
+            old = food_db.weeklymeals.find_one_and_update(
+                query, {"$set": fields}, projection=projection, upsert=True, return_document=ReturnDocument.BEFORE)
+        else:
+            fields["input_version"] = input_version
+            # The version check is part of the filter, so a plan built from newer inputs is never matched
+            old = food_db.weeklymeals.find_one_and_update(
+                current_inputs(query, input_version), {"$set": fields},
+                projection=projection, return_document=ReturnDocument.BEFORE)
+            if old is None:
+                # Nothing older to replace: insert the week's plan only if it has none at all
+                inserted = food_db.weeklymeals.update_one(query, {"$setOnInsert": fields}, upsert=True)
+                if inserted.upserted_id is None:
+                    print(f"Dropped an outdated plan for {user_id} (input version {input_version})")
+                    return False
+    except DuplicateKeyError:
+        # Another rebuild inserted the week's plan between our filter and our insert
+        print(f"Dropped an outdated plan for {user_id} (input version {input_version})")
+        return False
+    if wants_diff:
+        new = decode_doc({"plan": encoded, "plan_format": PLAN_FORMAT, "foods": table.foods})
+        plan_events.publish(user_id, plan_diff((decode_doc(old) or {}).get("plan", {}), new["plan"]))
+    page_cache.invalidate(user_id)
+    return True
+
+
+def current_week_start() -> datetime:
+    """Midnight on Monday of the current week, the week whose plan is being edited."""
+    return week_start_of(datetime.utcnow())
+
+
+def plan_filter(user_id: str, week_start: datetime | None = None) -> dict[str, Any]:
+    """
+    Query for one week's weeklymeals document (the current week by default).
+    Only the current week's plan is ever written; earlier weeks are final.
+    """
+    return {"username": user_id, "week_start": week_start or current_week_start()}
+
+
+def current_inputs(query: dict[str, Any], input_version: int) -> dict[str, Any]:
+    """Narrow a plan query to plans built from inputs no newer than `input_version`."""
+    return {**query, "$or": [
+        {"input_version": {"$exists": False}},
+        {"input_version": {"$lte": input_version}},
+    ]}
+
+
+def ensure_plan_indexes() -> None:
+    """
+    Index plans by (username, week_start) and list_versions by username, both
+    unique, and list_versions by changed_at. Plans saved before plans were kept per week are filed under the
+    week they were last written in.
+    """
+    for doc in food_db.weeklymeals.find({"week_start": {"$exists": False}}, {"updated_at": 1}):
+        written = doc.get("updated_at") or datetime.utcnow()
+        food_db.weeklymeals.update_one({"_id": doc["_id"]}, {"$set": {"week_start": week_start_of(written)}})
+    food_db.weeklymeals.create_index([("username", 1), ("week_start", -1)], unique=True)
+    merge_duplicate_versions()
+    food_db.list_versions.create_index("username", unique=True)
+    food_db.list_versions.create_index("changed_at")
+
+
+def merge_duplicate_versions() -> None:
+    """
+    Fold users' duplicate list_versions documents (left by racing upserts
+    before the index was unique) into one holding the highest counters.
+    """
+    duplicates = food_db.list_versions.aggregate([
+        {"$group": {
+            "_id": "$username",
+            "ids": {"$push": "$_id"},
+            "version": {"$max": "$version"},
+            "input_version": {"$max": "$input_version"},
+            "settings_version": {"$max": "$settings_version"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    for duplicate in duplicates:
+        keep, *extra = duplicate["ids"]
+        food_db.list_versions.delete_many({"_id": {"$in": extra}})
+        # One past the highest version, so no ETag handed out from either document still matches
+        food_db.list_versions.update_one({"_id": keep}, {"$set": {
+            "version": (duplicate["version"] or 0) + 1,
+            "input_version": duplicate["input_version"] or 0,
+            "settings_version": duplicate["settings_version"] or 0,
+        }})
+
+
+def refresh_stale_rollups(user_id: str) -> None:
+    """
+    Update the dashboard rollups of a user's plans written since they were
+    last rolled up. Plan writes only mark the plan in the write itself
+    (rollups_stale, a new ObjectId per write), so the rollup pipelines run
+    when the dashboard is read. The mark is removed only if no other write
+    replaced it meanwhile.
+    """
+    try:
+        stale = list(food_db.weeklymeals.find(
+            {"username": user_id, "rollups_stale": {"$exists": True}}, {"week_start": 1, "rollups_stale": 1}))
+        for doc in stale:
+            rollup_plan(food_db, user_id, DAYS, doc["week_start"])
+            food_db.weeklymeals.update_one(
+                {"_id": doc["_id"], "rollups_stale": doc["rollups_stale"]}, {"$unset": {"rollups_stale": ""}})
+    except PyMongoError as e:
+        print(f"Could not update nutrition rollups for {user_id}: {e}")
 
 
 if __name__ == "__main__":
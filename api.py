@@ -0,0 +1,190 @@
+import os
+import queue
+import time
+from flask import Blueprint, Response, session, jsonify, request, stream_with_context
+from plan_store import PlanUnavailable, day_key, meal_key, plan_stamp, find_day_plan, find_meal_plan, read_was_stale
+from caching import page_etag, is_fresh, not_modified, with_etag, page_cache, past_page_cache
+from algorithm import DAYS, replan_from_day, get_planner_config, save_planner_settings, food_db
+from planner_config import merge_settings
+from what_if import compare_variants
+from plan_events import IDLE_SECONDS, KEEPALIVE_SECONDS, plan_events, sse
+'''
+This module defines the versioned JSON API blueprint. Each endpoint returns only the slice of the weekly plan the client asked for, so mobile clients don't download and parse the whole week to show one day or one meal.
+'''
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Users allowed to read /cache-stats (comma-separated); empty lets any logged-in user
+CACHE_STATS_USERS = {name.strip() for name in os.getenv("CACHE_STATS_USERS", "").split(",") if name.strip()}
+
+
+@api_bp.route("/plan/<day>")
+def plan_day(day):
+    """Return one day of the logged-in user's meal plan."""
+    username = session.get('username')
+    if not username:
+        return jsonify({"error": "Not logged in"}), 401
+    key = day_key(day)
+    if key is None:
+        return jsonify({"error": f"Unknown day: {day}"}), 404
+    etag = page_etag(username, f"api/plan/{key}", plan_stamp(username), True)
+    if is_fresh(etag):
+        return not_modified(etag)
+    day_plan = find_day_plan(username, key)
+    if day_plan is None:
+        return jsonify({"error": "No meal plan found"}), 404
+    return with_etag(jsonify({"day": key, "meals": day_plan, "stale": read_was_stale()}), etag)
+
+
+@api_bp.route("/plan/<day>/<meal>")
+def plan_meal(day, meal):
+    """Return one meal of one day of the logged-in user's meal plan."""
+    username = session.get('username')
+    if not username:
+        return jsonify({"error": "Not logged in"}), 401
+    key = day_key(day)
+    meal_name = meal_key(meal)
+    if key is None or meal_name is None:
+        return jsonify({"error": f"Unknown meal: {day}/{meal}"}), 404
+    etag = page_etag(username, f"api/plan/{key}/{meal_name}", plan_stamp(username), True)
+    if is_fresh(etag):
+        return not_modified(etag)
+    meal_plan = find_meal_plan(username, key, meal_name)
+    if meal_plan is None:
+        return jsonify({"error": "No meal plan found"}), 404
+    return with_etag(jsonify({"day": key, "meal": meal_name, **meal_plan, "stale": read_was_stale()}), etag)
+
+
+@api_bp.route("/plan/events")
+def plan_event_stream():
+    """
+    Server-Sent Events stream of the logged-in user's plan changes: a "diff"
+    event with the changed days and meals, or "reload" when the page should
+    fetch the plan again (it fell behind, or another process rebuilt the plan).
+    Idle streams, and the oldest of a user's streams past the per-user limit,
+    end with a "close" event (see plan_events.py).
+    """
+    username = session.get('username')
+    if not username:
+        return jsonify({"error": "Not logged in"}), 401
+
+    def current_stamp(known):
+        try:
+            return plan_stamp(username)
+        except PlanUnavailable:
+            # Plans can't be read right now; keep the stream open and check again later
+            return known
+
+    def stream():
+        events = plan_events.subscribe(username)
+        stamp = current_stamp(None)
+        try:
+            # Tell EventSource how long to wait before reconnecting
+            yield f"retry: {int(KEEPALIVE_SECONDS * 1000)}\n\n"
+            idle_until = time.monotonic() + IDLE_SECONDS
+            while True:
+                try:
+                    diff = events.get(timeout=max(0.0, min(KEEPALIVE_SECONDS, idle_until - time.monotonic())))
+                except queue.Empty:
+                    latest = current_stamp(stamp)
+                    if latest != stamp and not read_was_stale():
+                        stamp = latest
+                        yield sse("reload", {})
+                    elif time.monotonic() >= idle_until:
+                        yield sse("close", {})
+                        return
+                    else:
+                        yield ": keepalive\n\n"
+                    continue
+                if diff.get("close"):
+                    yield sse("close", {})
+                    return
+                stamp = current_stamp(stamp)
+                idle_until = time.monotonic() + IDLE_SECONDS
+                yield sse("reload", {}) if diff.get("reload") else sse("diff", diff)
+        finally:
+            plan_events.unsubscribe(username, events)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@api_bp.route("/plan/replan/<day>", methods=["POST"])
+def replan_day(day):
+    """Recompute the logged-in user's plan from one day to the end of the week."""
+    username = session.get('username')
+    if not username:
+        return jsonify({"error": "Not logged in"}), 401
+    key = day_key(day)
+    if key is None:
+        return jsonify({"error": f"Unknown day: {day}"}), 404
+    result = replan_from_day(username, key)
+    if not result:
+        return jsonify({"error": "No grocery items to plan with"}), 404
+    if result.get("outdated"):
+        return jsonify({"error": "The grocery list changed while planning; the newer plan is being built"}), 409
+    return jsonify({
+        "replanned_days": result.get("replanned_days", DAYS),
+        "plan": result["plan"],
+        "missing_categories": result["missing_categories"],
+    })
+
+
+@api_bp.route("/plan/what-if", methods=["POST"])
+def plan_what_if():
+    """
+    Compare plans for several variants of the planner settings, e.g.
+    {"variants": [{"name": "cut", "calorie_goals": {"Lunch": 500}}, ...]}.
+    Nothing is saved.
+    """
+    username = session.get('username')
+    if not username:
+        return jsonify({"error": "Not logged in"}), 401
+    payload = request.get_json(silent=True) or {}
+    try:
+        results = compare_variants(username, payload.get("variants"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not results:
+        return jsonify({"error": "No grocery items to plan with"}), 404
+    return jsonify({"variants": results})
+
+
+@api_bp.route("/planner-settings")
+def planner_settings():
+    """Return the logged-in user's planner settings (the defaults if never changed)."""
+    username = session.get('username')
+    if not username:
+        return jsonify({"error": "Not logged in"}), 401
+    versions = food_db.list_versions.find_one({"username": username}, {"settings_version": 1}) or {}
+    config = get_planner_config(username, versions.get("settings_version", 0))
+    return jsonify({**config.settings(), "settings_version": config.version})
+
+
+@api_bp.route("/planner-settings", methods=["PUT", "POST"])
+def update_planner_settings():
+    """
+    Change the logged-in user's calorie goals, meal composition or calorie
+    splits (only the meals given change) and rebuild their plan.
+    """
+    username = session.get('username')
+    if not username:
+        return jsonify({"error": "Not logged in"}), 401
+    versions = food_db.list_versions.find_one({"username": username}, {"settings_version": 1}) or {}
+    current = get_planner_config(username, versions.get("settings_version", 0))
+    try:
+        settings = merge_settings(current, request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    config = save_planner_settings(username, settings)
+    return jsonify({**config.settings(), "settings_version": config.version})
+
+
+@api_bp.route("/cache-stats")
+def cache_stats():
+    """Return hit/miss statistics for this worker's rendered-page caches (and open plan streams)."""
+    username = session.get('username')
+    if not username:
+        return jsonify({"error": "Not logged in"}), 401
+    if CACHE_STATS_USERS and username not in CACHE_STATS_USERS:
+        return jsonify({"error": "Not allowed"}), 403
+    return jsonify({**page_cache.stats(), "past_weeks": past_page_cache.stats(), "plan_events": plan_events.stats()})
@@ -8,13 +8,51 @@ See the README.md file for instructions how to set up and run the app in develop
 import os
 import datetime
 #from flask import Flask, render_template, request, redirect, url_for
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, session
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, session, make_response
 import pymongo
 from bson.objectid import ObjectId
 from dotenv import load_dotenv, dotenv_values
 from jinja2 import ChoiceLoader, FileSystemLoader
-from grocery import grocery_bp
-from algorithm import restore_grams_to_current_list
+from grocery import grocery_bp, grocery_history
+from api import api_bp
+from dashboard import dashboard_bp
+from plan_store import (
+    day_key,
+    meal_key,
+    find_weekly_doc,
+    find_week_doc,
+    adjacent_weeks,
+    plan_stamp,
+    find_day_plan,
+    find_meal_plan,
+    set_plan_slice,
+    set_plan,
+    meals_for_day,
+    day_nutrients,
+    read_was_stale
+)
+from algorithm import (
+    apply_gram_changes,
+    sum_nutrients,
+    request_plan_rebuild,
+    current_week_start,
+    ensure_plan_indexes
+)
+from rollups import week_start_of
+from plan_events import wants_json, capture_diffs, captured_diff
+from history_search import ensure_history_search_index
+from suggestions import ensure_purchase_stats_index
+from caching import (
+    weak_etag,
+    page_etag,
+    is_fresh,
+    not_modified,
+    with_etag,
+    immutable,
+    cached_page,
+    render_cached,
+    past_page_cache
+)
 import certifi
 from pymongo import MongoClient
 class Food:
@@ -66,7 +104,6 @@ def create_app():
     tlsCAFile=certifi.where()  # This fixes the SSL certificate error
 )
     db = cxn[os.getenv("MONGO_DBNAME")]
-    grocery_db = cxn['groceryfood']
    # Attach db to app for use in routes defined outside create_app
     app.db = db
 
@@ -92,10 +129,16 @@ def create_app():
             print(" *", f"Sample food '{sample_food.name}' created and stored in database!")
         else:
             print(" *", f"Sample food '{sample_food.name}' already exists in database.")
+        # Plans are stored per (username, week_start) and plan writes rely on these unique indexes
+        ensure_plan_indexes()
+        ensure_history_search_index(grocery_history)
+        ensure_purchase_stats_index(grocery_history)
     except Exception as e:
         print(" * MongoDB connection error:", e)
 
     app.register_blueprint(grocery_bp)
+    app.register_blueprint(api_bp)
+    app.register_blueprint(dashboard_bp)
     @app.route("/")
     @app.route("/week")
     def home():
@@ -109,8 +152,59 @@ def create_app():
         if not username:
             return redirect(url_for("login"))
 
-        # Read from weeklymeals collection generated by algorithm.py
-        weekly_doc = grocery_db["weeklymeals"].find_one({"username": username})
+        json_mode = request.headers.get('Content-Type') == 'application/json' or request.args.get('format') == 'json'
+        # ?start=YYYY-MM-DD picks an earlier week; anything else shows the current week
+        current_start = current_week_start()
+        try:
+            week_start = week_start_of(datetime.datetime.strptime(request.args.get("start", ""), "%Y-%m-%d"))
+        except ValueError:
+            week_start = current_start
+        past = week_start < current_start
+        if not past:
+            week_start = current_start
+
+        if past:
+            # Past weeks' plans never change: cache them without invalidation
+            page = f"week|{week_start.strftime('%Y-%m-%d')}"
+            keep = immutable
+            if not json_mode:
+                # The prev/next links are part of the page, so they are part of its version. The
+                # newest past week links to the current week, which becomes a past week next
+                # Monday, so clients revalidate that page instead of keeping it
+                prev_start, next_start = adjacent_weeks(username, week_start)
+                page = f"{page}|{prev_start}|{next_start}|{current_start.strftime('%Y-%m-%d')}"
+                if not (next_start and next_start < current_start):
+                    keep = with_etag
+            etag = weak_etag(username, page, "json" if json_mode else "html")
+            if is_fresh(etag):
+                return not_modified(etag)
+            if not json_mode:
+                entry = past_page_cache.get(username, page)
+                if entry is not None:
+                    return keep(make_response(entry[0]), etag)
+            weekly_doc = find_week_doc(username, week_start)
+            stale = False
+        else:
+            stamp = plan_stamp(username)
+            if stamp is None and not read_was_stale():
+                # A new week starts without a plan; the first visit builds it
+                request_plan_rebuild(username)
+                stamp = plan_stamp(username)
+
+            # Answer repeat visits with a 304 before building or rendering anything
+            etag = page_etag(username, "week", stamp, json_mode)
+            if is_fresh(etag):
+                return not_modified(etag)
+
+            # Serve the rendered page from the per-user page cache when possible
+            if not json_mode:
+                cached = cached_page(username, "week", etag)
+                if cached is not None:
+                    return cached
+
+            # Read from weeklymeals collection generated by algorithm.py
+            weekly_doc = find_weekly_doc(username, ["plan"])
+            stale = read_was_stale()
         if not weekly_doc or "plan" not in weekly_doc:
             # No meal plan available, show empty week
             week_days = []
@@ -134,55 +228,25 @@ def create_app():
                         })
 
         # Check if request wants JSON (API usage)
-        if request.headers.get('Content-Type') == 'application/json' or request.args.get('format') == 'json':
+        if json_mode:
             # Convert ObjectId to string for JSON serialization if needed
-            return jsonify({"foods": food_docs, "source": "weeklymeals"})
+            response = jsonify({"foods": food_docs, "source": "weeklymeals", "stale": stale,
+                                "week_start": week_start.strftime("%Y-%m-%d")})
+            return immutable(response, etag) if past else with_etag(response, etag)
 
         # Organize foods by weekday and meal time for weekly view
         week_days = []
         weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
         weekday_display = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         # Get current day for highlighting
-        today_weekday = datetime.datetime.now().strftime('%A').lower()
+        today_weekday = None if past else datetime.datetime.now().strftime('%A').lower()
         
         if weekly_doc and "plan" in weekly_doc:
             plan = weekly_doc["plan"]
             for i, weekday in enumerate(weekdays):
                 day_name = weekday_display[i]
                 day_plan = plan.get(day_name, {})
-                # Organize by meal time
-                meals = {
-                    'breakfast': [{
-                        'name': item['foodName'],
-                        'food_type': item['foodCategory'],
-                        'food_amount': item['grams'],
-                        'calorie_amount': item['calories'],
-                        'weekday': weekday,
-                        'time_in_day': 'breakfast',
-                        'username': username,
-                        'is_generated': True
-                    } for item in day_plan.get('Breakfast', {}).get('items', [])],
-                    'lunch': [{
-                        'name': item['foodName'],
-                        'food_type': item['foodCategory'],
-                        'food_amount': item['grams'],
-                        'calorie_amount': item['calories'],
-                        'weekday': weekday,
-                        'time_in_day': 'lunch',
-                        'username': username,
-                        'is_generated': True
-                    } for item in day_plan.get('Lunch', {}).get('items', [])],
-                    'dinner': [{
-                        'name': item['foodName'],
-                        'food_type': item['foodCategory'],
-                        'food_amount': item['grams'],
-                        'calorie_amount': item['calories'],
-                        'weekday': weekday,
-                        'time_in_day': 'dinner',
-                        'username': username,
-                        'is_generated': True
-                    } for item in day_plan.get('Dinner', {}).get('items', [])]
-                }
+                meals = meals_for_day(day_plan, weekday, username)
                 day_data = {
                     'name': day_name,
                     'full_name': weekday,
@@ -203,17 +267,41 @@ def create_app():
                 }
                 week_days.append(day_data)
 
-        # Week navigation data
+        # Week navigation data (already looked up for a past week)
+        if not past:
+            prev_start, next_start = adjacent_weeks(username, week_start)
+        prev_week_url = url_for("home", start=prev_start.strftime("%Y-%m-%d")) if prev_start else None
+        if next_start and next_start < current_start:
+            next_week_url = url_for("home", start=next_start.strftime("%Y-%m-%d"))
+        else:
+            # The current week is always reachable from a past one
+            next_week_url = url_for("home") if past else None
+        if past:
+            week_label = "Week of " + week_start.strftime("%B %d, %Y")
+            week_sub_label = "Past week"
+            body = render_template("simple-week.html",
+                                   week_days=week_days,
+                                   week_label=week_label,
+                                   week_sub_label=week_sub_label,
+                                   prev_week_url=prev_week_url,
+                                   next_week_url=next_week_url,
+                                   today_weekday=today_weekday,
+                                   read_only=True,
+                                   stale=stale).encode("utf-8")
+            past_page_cache.put(username, page, body, etag, past_page_cache.generation(username))
+            return keep(make_response(body), etag)
         week_label = "Current Week"
         week_sub_label = datetime.datetime.now().strftime("%B %d, %Y")
         # Return HTML template for web interface
-        return render_template("simple-week.html",
+        return render_cached(username, "week", etag, "simple-week.html",
                              week_days=week_days,
                              week_label=week_label,
                              week_sub_label=week_sub_label,
-                             prev_week_url="#",  # Placeholder for now
-                             next_week_url="#",  # Placeholder for now
-                             today_weekday=today_weekday)
+                             prev_week_url=prev_week_url,
+                             next_week_url=next_week_url,
+                             today_weekday=today_weekday,
+                             read_only=False,
+                             stale=stale)
 
     @app.route("/day", defaults={'weekday': None})
     @app.route("/day/<weekday>")
@@ -231,54 +319,29 @@ def create_app():
         if weekday is None:
             weekday = datetime.datetime.now().strftime('%A').lower()
 
-        # Read from weeklymeals collection generated by algorithm.py
-        weekly_doc = grocery_db["weeklymeals"].find_one({"username": username})
-        if weekly_doc and "plan" in weekly_doc:
-            plan = weekly_doc["plan"]
-            # Map weekday to title case for plan keys
-            weekday_title = weekday.title()
-            day_plan = plan.get(weekday_title, {})
-            # Organize by meal time
-            meals = {
-                'breakfast': [{
-                    'name': item['foodName'],
-                    'food_type': item['foodCategory'],
-                    'food_amount': item['grams'],
-                    'calorie_amount': item['calories'],
-                    'weekday': weekday.lower(),
-                    'time_in_day': 'breakfast',
-                    'username': username,
-                    'is_generated': True
-                } for item in day_plan.get('Breakfast', {}).get('items', [])],
-                'lunch': [{
-                    'name': item['foodName'],
-                    'food_type': item['foodCategory'],
-                    'food_amount': item['grams'],
-                    'calorie_amount': item['calories'],
-                    'weekday': weekday.lower(),
-                    'time_in_day': 'lunch',
-                    'username': username,
-                    'is_generated': True
-                } for item in day_plan.get('Lunch', {}).get('items', [])],
-                'dinner': [{
-                    'name': item['foodName'],
-                    'food_type': item['foodCategory'],
-                    'food_amount': item['grams'],
-                    'calorie_amount': item['calories'],
-                    'weekday': weekday.lower(),
-                    'time_in_day': 'dinner',
-                    'username': username,
-                    'is_generated': True
-                } for item in day_plan.get('Dinner', {}).get('items', [])]
-            }
-            # Calculate basic summary
+        # Answer repeat visits with a 304 before building or rendering anything
+        etag = page_etag(username, f"day/{weekday.lower()}", plan_stamp(username), False)
+        if is_fresh(etag):
+            return not_modified(etag)
+
+        # Serve the rendered page from the per-user page cache when possible
+        cached = cached_page(username, f"day/{weekday.lower()}", etag)
+        if cached is not None:
+            return cached
+
+        # Only fetch this day's slice of the weeklymeals document
+        day_plan = find_day_plan(username, weekday.title())
+        stale = read_was_stale()
+        if day_plan is not None:
+            meals = meals_for_day(day_plan, weekday, username)
+            # Calculate basic summary; nutrient totals were stored with the plan
             total_calories = sum(item['calorie_amount'] for meal_items in meals.values() for item in meal_items)
-            total_protein = sum(item['food_amount'] for meal_items in meals.values() for item in meal_items if item['food_type'] == 'Protein')
+            nutrients = day_nutrients(day_plan)
         else:
             # No plan available
             meals = {'breakfast': [], 'lunch': [], 'dinner': []}
             total_calories = 0
-            total_protein = 0
+            nutrients = day_nutrients({})
 
         weekday_display = weekday.title()
 
@@ -288,19 +351,21 @@ def create_app():
         prev_weekday = weekdays[(current_index - 1) % 7]
         next_weekday = weekdays[(current_index + 1) % 7]
         date_label = datetime.datetime.now().strftime("%B %d, %Y")
-        return render_template("simple-day.html",
+        return render_cached(username, f"day/{weekday.lower()}", etag, "simple-day.html",
                              weekday=weekday.lower(),
                              weekday_display=weekday_display,
                              date_label=date_label,
                              prev_weekday=prev_weekday,
                              next_weekday=next_weekday,
                              meals=meals,
-                             protein=total_protein,
-                             carbs=0,  # Placeholder
-                             fiber=0,  # Placeholder
-                             sugar=0,  # Placeholder
+                             protein=nutrients['protein'],
+                             carbs=nutrients['carbs'],
+                             fiber=nutrients['fiber'],
+                             sugar=nutrients['sugar'],
+                             fat=nutrients['fat'],
                              calories=total_calories,
-                             today_weekday=weekday.lower())
+                             today_weekday=weekday.lower(),
+                             stale=stale)
 
     @app.route("/add-item")
     def add_item():
@@ -469,6 +534,15 @@ def create_app():
         </html>
         '''
 
+    def plan_edited(endpoint, **values):
+        """
+        Finish a plan edit: JSON clients get only the changed plan slots,
+        browsers are redirected to the page.
+        """
+        if wants_json():
+            return jsonify({"plan": captured_diff()})
+        return redirect(url_for(endpoint, **values))
+
     @app.route("/delete-day/<weekday>", methods=["POST"])
     def delete_day(weekday):
         """
@@ -476,52 +550,38 @@ def create_app():
         Args:
             weekday (str): The weekday to clear
         Returns:
-            Redirect to home page
+            Redirect to home page, or the changed plan slots as JSON
         """
         username = session.get('username')
         if not username:
             return redirect(url_for("login"))
-        # Get the weekly plan to sum grams for each food in the day
-        weekly_doc = grocery_db["weeklymeals"].find_one({"username": username})
+        if wants_json():
+            capture_diffs()
+        # Only fetch this day's slice of the plan to sum grams for each food
+        day_name = day_key(weekday)
+        day_plan = find_day_plan(username, day_name, allow_stale=False) if day_name else None
         food_totals = {}
-        if weekly_doc and "plan" in weekly_doc:
-            plan = weekly_doc["plan"]
-            # Find the day
-            day_key = None
-            for key in plan.keys():
-                if key.lower() == weekday.lower():
-                    day_key = key
-                    break
-            if day_key:
-                day_plan = plan[day_key]
-                for meal_name in ['Breakfast', 'Lunch', 'Dinner']:
-                    meal_data = day_plan.get(meal_name, {})
-                    for item in meal_data.get("items", []):
-                        food_name = item['foodName']
-                        grams = item['grams']
-                        food_totals[food_name] = food_totals.get(food_name, 0) + grams
+        if day_plan is not None:
+            for meal_name in ['Breakfast', 'Lunch', 'Dinner']:
+                meal_data = day_plan.get(meal_name, {})
+                for item in meal_data.get("items", []):
+                    food_name = item['foodName']
+                    grams = item['grams']
+                    food_totals[food_name] = food_totals.get(food_name, 0) + grams
         db.foods.delete_many({"weekday": weekday.lower(), "username": username})
-        
-        # Also delete from weeklymeals if it exists
-        weekly_plan = db.weeklymeals.find_one({"username": username})
-        if weekly_plan and 'plan' in weekly_plan:
-            plan = weekly_plan['plan']
-            # Find the correct key (case-insensitive)
-            day_key = None
-            for key in plan.keys():
-                if key.lower() == weekday.lower():
-                    day_key = key
-                    break
-            if day_key:
-                # Set the day to empty meals instead of deleting
-                plan[day_key] = {
-                    'Breakfast': {'items': [], 'total_calories': 0},
-                    'Lunch': {'items': [], 'total_calories': 0},
-                    'Dinner': {'items': [], 'total_calories': 0}
-                }
-                db.weeklymeals.update_one({"username": username}, {"$set": {"plan": plan}})
-        
-        return redirect(url_for("home"))
+        # Give the day's grams back to the grocery list in one round trip
+        apply_gram_changes(username, food_totals)
+
+        # Also clear the day in weeklymeals if it exists
+        if day_plan is not None:
+            # Set the day to empty meals instead of deleting
+            set_plan_slice(username, day_name, {
+                'Breakfast': {'items': [], 'total_calories': 0},
+                'Lunch': {'items': [], 'total_calories': 0},
+                'Dinner': {'items': [], 'total_calories': 0}
+            }, day_nutrients(day_plan))
+
+        return plan_edited("home")
 
     @app.route("/delete-meal/<weekday>/<meal>", methods=["POST"])
     def delete_meal(weekday, meal):
@@ -531,15 +591,19 @@ def create_app():
             weekday (str): The weekday
             meal (str): The meal time (breakfast, lunch, dinner)
         Returns:
-            Redirect to day view
+            Redirect to day view, or the changed plan slots as JSON
         """
-        # Get the weekly plan to sum grams for each food in the meal
-        weekly_doc = grocery_db["weeklymeals"].find_one({"username": username})
+        username = session.get('username')
+        if not username:
+            return redirect(url_for("login"))
+        if wants_json():
+            capture_diffs()
+        # Only fetch this meal's slice of the plan to sum grams for each food
+        day_name = day_key(weekday)
+        meal_name = meal_key(meal)
+        meal_data = find_meal_plan(username, day_name, meal_name, allow_stale=False) if day_name and meal_name else None
         food_totals = {}
-        if weekly_doc and "plan" in weekly_doc:
-            plan = weekly_doc["plan"]
-            day_plan = plan.get(weekday.lower(), {})
-            meal_data = day_plan.get(meal.lower(), {})
+        if meal_data is not None:
             # Sum grams for each food
             for item in meal_data.get("items", []):
                 food_name = item['foodName']
@@ -548,10 +612,13 @@ def create_app():
             # Remove all items from the meal
             meal_data["items"] = []
             meal_data["total_calories"] = 0
-            # Update the plan
-            grocery_db["weeklymeals"].update_one({"username": username}, {"$set": {"plan": plan}})
+            removed_nutrients = meal_data.pop("nutrients", None)
+            # Update only this meal of the plan
+            set_plan_slice(username, f"{day_name}.{meal_name}", meal_data, removed_nutrients)
+            # Give the meal's grams back to the grocery list in one round trip
+            apply_gram_changes(username, food_totals)
         db.foods.delete_many({"weekday": weekday.lower(), "time_in_day": meal.lower(), "username": username})
-        return redirect(url_for("day_view", weekday=weekday))
+        return plan_edited("day_view", weekday=weekday)
 
     @app.route("/swap-day/<weekday>", methods=["POST"])
     def swap_day(weekday):
@@ -572,43 +639,43 @@ def create_app():
         username = session.get("username")
         if not username:
             return redirect(url_for("login"))
+        if wants_json():
+            capture_diffs()
 
         weekdays = ["monday", "tuesday", "wednesday", "thursday",
                     "friday", "saturday", "sunday"]
         day = weekday.lower()
         if day not in weekdays:
-            return redirect(url_for("home"))
+            return plan_edited("home")
 
         idx = weekdays.index(day)
         if direction == "up":
             if idx == 0:
-                return redirect(url_for("home"))
+                return plan_edited("home")
             other = weekdays[idx - 1]
         else:  # treat anything else as down
             if idx == len(weekdays) - 1:
-                return redirect(url_for("home"))
+                return plan_edited("home")
             other = weekdays[idx + 1]
 
         # Work with the weeklymeals collection that backs the UI
-        weekly_doc = grocery_db["weeklymeals"].find_one({"username": username})
+        weekly_doc = find_weekly_doc(username, ["plan"], allow_stale=False)
         if not weekly_doc or "plan" not in weekly_doc:
-            return redirect(url_for("home"))
+            return plan_edited("home")
 
         plan = weekly_doc["plan"]
         # Keys are title‑cased in the plan (e.g., 'Monday')
         day_key = day.title()
         other_key = other.title()
         if day_key not in plan or other_key not in plan:
-            return redirect(url_for("home"))
+            return plan_edited("home")
 
         # Swap the entire day blocks
+        previous = dict(plan)
         plan[day_key], plan[other_key] = plan[other_key], plan[day_key]
-        grocery_db["weeklymeals"].update_one(
-            {"_id": weekly_doc["_id"]},
-            {"$set": {"plan": plan}},
-        )
+        set_plan(username, plan, previous)
 
-        return redirect(url_for("home"))
+        return plan_edited("home")
 
     @app.route("/day/swap/<weekday>/<meal>/<direction>", methods=["POST"])
     def swap_day_meal(weekday, meal, direction):
@@ -619,31 +686,33 @@ def create_app():
         username = session.get("username")
         if not username:
             return redirect(url_for("login"))
+        if wants_json():
+            capture_diffs()
 
         meal = meal.lower()
         order = ["breakfast", "lunch", "dinner"]
         if meal not in order:
-            return redirect(url_for("day_view", weekday=weekday))
+            return plan_edited("day_view", weekday=weekday)
 
         idx = order.index(meal)
         if direction == "up":
             if idx == 0:
-                return redirect(url_for("day_view", weekday=weekday))
+                return plan_edited("day_view", weekday=weekday)
             target = order[idx - 1]
         else:  # down
             if idx == len(order) - 1:
-                return redirect(url_for("day_view", weekday=weekday))
+                return plan_edited("day_view", weekday=weekday)
             target = order[idx + 1]
 
         # Load the weekly plan from the same collection used by day_view
-        weekly_doc = grocery_db["weeklymeals"].find_one({"username": username})
+        weekly_doc = find_weekly_doc(username, ["plan"], allow_stale=False)
         if not weekly_doc or "plan" not in weekly_doc:
-            return redirect(url_for("day_view", weekday=weekday))
+            return plan_edited("day_view", weekday=weekday)
 
         plan = weekly_doc["plan"]
         day_key = weekday.title()
         if day_key not in plan:
-            return redirect(url_for("day_view", weekday=weekday))
+            return plan_edited("day_view", weekday=weekday)
 
         # Plan keys are title-cased meal names
         meal_key_map = {"breakfast": "Breakfast", "lunch": "Lunch", "dinner": "Dinner"}
@@ -652,18 +721,16 @@ def create_app():
 
         day_plan = plan.get(day_key, {})
         if src_key not in day_plan or dst_key not in day_plan:
-            return redirect(url_for("day_view", weekday=weekday))
+            return plan_edited("day_view", weekday=weekday)
 
         # Swap the entire meal blocks (including items and totals)
+        previous = {**plan, day_key: dict(day_plan)}
         day_plan[src_key], day_plan[dst_key] = day_plan[dst_key], day_plan[src_key]
         plan[day_key] = day_plan
 
-        grocery_db["weeklymeals"].update_one(
-            {"_id": weekly_doc["_id"]},
-            {"$set": {"plan": plan}},
-        )
+        set_plan(username, plan, previous)
 
-        return redirect(url_for("day_view", weekday=weekday))
+        return plan_edited("day_view", weekday=weekday)
 
     @app.route("/delete-week", methods=["POST"])
     def delete_week():
@@ -935,22 +1002,32 @@ def create_app():
         Returns:
             Redirect to home page.
         """
-        # Get the total grams from the weekly plan for this food in this meal
-        weekly_doc = grocery_db["weeklymeals"].find_one({"username": username})
-        total_grams = 0
-        if weekly_doc and "plan" in weekly_doc:
-            plan = weekly_doc["plan"]
-            day_plan = plan.get(weekday.lower(), {})
-            meal_data = day_plan.get(time_in_day.lower(), {})
-            # Sum the grams for the deleted food
-            total_grams = sum(item['grams'] for item in meal_data.get("items", []) if item['foodName'].lower() == food_name.lower())
+        username = session.get('username')
+        if not username:
+            return redirect(url_for("login"))
+        # Only fetch this meal's slice of the plan to get the total grams for this food
+        day_name = day_key(weekday)
+        meal_name = meal_key(time_in_day)
+        meal_data = find_meal_plan(username, day_name, meal_name, allow_stale=False) if day_name and meal_name else None
+        food_totals = {}
+        if meal_data is not None:
+            # Sum the grams for the deleted food (keyed by the name stored in the grocery list)
+            for item in meal_data.get("items", []):
+                if item['foodName'].lower() == food_name.lower():
+                    food_totals[item['foodName']] = food_totals.get(item['foodName'], 0) + item['grams']
             # Remove the items from the plan
             updated_items = [item for item in meal_data.get("items", []) if item['foodName'].lower() != food_name.lower()]
+            removed_nutrients = sum_nutrients([item.get('nutrients', {}) for item in meal_data.get("items", [])
+                                               if item['foodName'].lower() == food_name.lower()])
             meal_data["items"] = updated_items
-            # Recalculate total_calories
+            # Recalculate total_calories and nutrients
             meal_data["total_calories"] = sum(item['calories'] for item in updated_items)
-            # Update the plan
-            grocery_db["weeklymeals"].update_one({"username": username}, {"$set": {"plan": plan}})
+            if "nutrients" in meal_data:
+                meal_data["nutrients"] = sum_nutrients([item.get('nutrients', {}) for item in updated_items])
+            # Update only this meal of the plan
+            set_plan_slice(username, f"{day_name}.{meal_name}", meal_data, removed_nutrients)
+            # Give the food's grams back to the grocery list
+            apply_gram_changes(username, food_totals)
         result = db.foods.delete_many({"name": food_name, "weekday": weekday, "time_in_day": time_in_day, "username": username})
         return redirect(url_for("home"))
     
@@ -1045,7 +1122,10 @@ def create_app():
     return app
 
 
-app = create_app()
+# The what-if worker processes (spawned) re-import the script that started the
+# app as __mp_main__; they only plan, so they must not start another app
+if __name__ != "__mp_main__":
+    app = create_app()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+from __future__ import annotations
+import copy
+import random
+import statistics
+import sys
+import time
+from typing import Any
+
+from planner import DAYS, MEAL_COMPOSITION, plan_days
+from optimizer import optimize_plan
+'''
+This script measures how much the local-search pass improves the greedy weekly plan for a given time budget. It plans synthetic grocery pools (random foods, gram amounts and calorie densities per category) with the greedy planner, runs optimize_plan at several budgets on copies of the same plan, and reports the remaining calorie-goal error against the time actually spent, to help pick PLAN_OPTIMIZE_MS.
+
+usage: python benchmark_optimizer.py [pools] [budget_ms ...]
+'''
+
+CATEGORY_CAL_PER_GRAM: dict[str, tuple[float, float]] = {
+    "Protein": (1.2, 2.5),
+    "Dairy": (0.5, 1.2),
+    "Fruit": (0.4, 0.9),
+    "Vegetable": (0.2, 0.5),
+    "Grain": (1.1, 3.6),
+}
+DEFAULT_BUDGETS_MS = [0, 1, 5, 10, 25, 50, 100]
+
+
+def synthetic_pool(rng: random.Random) -> list[dict[str, Any]]:
+    """A random grocery pool, shaped like build_food_pool's output."""
+    pool = []
+    for breakfast in (True, False):
+        for category, (low, high) in CATEGORY_CAL_PER_GRAM.items():
+            if breakfast and category not in MEAL_COMPOSITION["Breakfast"]:
+                continue
+            for n in range(rng.randint(0, 3)):
+                grams = rng.choice([200, 450, 900, 1500, 2500])
+                cal_per_gram = rng.uniform(low, high)
+                pool.append({
+                    "foodName": f"{category.lower()} {n}{' (b)' if breakfast else ''}",
+                    "foodCategory": category,
+                    "isBreakfast": breakfast,
+                    "original_grams": float(grams),
+                    "remaining_grams": float(grams),
+                    "cal_per_gram": cal_per_gram,
+                    "remaining_calories": grams * cal_per_gram,
+                })
+    return pool
+
+
+def run(pools: int, budgets: list[float]) -> None:
+    rng = random.Random(42)
+    results: dict[float, list[tuple[float, float]]] = {budget: [] for budget in budgets}
+    greedy_ms: list[float] = []
+    for _ in range(pools):
+        pool = synthetic_pool(rng)
+        started = time.perf_counter()
+        plan, _, _ = plan_days(pool, DAYS)
+        greedy_ms.append((time.perf_counter() - started) * 1000)
+        for budget in budgets:
+            trial_plan, trial_pool = copy.deepcopy(plan), copy.deepcopy(pool)
+            stats = optimize_plan(trial_plan, trial_pool, MEAL_COMPOSITION, budget)
+            results[budget].append((stats["error_after"], stats["elapsed_ms"]))
+
+    print(f"{pools} synthetic pools, greedy planner {statistics.mean(greedy_ms):.2f} ms per week")
+    print(f"  {'budget ms':>9}  {'mean error kcal':>15}  {'per slot':>8}  {'mean ms':>8}  {'max ms':>8}")
+    slots = len(DAYS) * len(MEAL_COMPOSITION)
+    for budget in budgets:
+        errors = [error for error, _ in results[budget]]
+        elapsed = [ms for _, ms in results[budget]]
+        print(f"  {budget:9g}  {statistics.mean(errors):15.1f}  {statistics.mean(errors) / slots:8.1f}"
+              f"  {statistics.mean(elapsed):8.2f}  {max(elapsed):8.2f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    pool_count = int(args[0]) if args else 50
+    budget_list = [float(arg) for arg in args[1:]] or DEFAULT_BUDGETS_MS
+    run(pool_count, budget_list)
@@ -0,0 +1,190 @@
+from __future__ import annotations
+import datetime
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from flask import Response, request, make_response, render_template, g
+
+'''
+This module holds the caching helpers shared by the app and blueprints. Pages get a weak ETag built from cheap version stamps (weeklymeals.updated_at, the user's current_list version) so a repeat request can be answered with a 304 before the plan is transformed or a template is rendered. Rendered HTML is also kept per user in an in-process LRU cache that the write paths invalidate, so the most frequent reads skip the full plan read and Jinja. They do not skip Mongo entirely: a cached page is only served while its ETag still matches the current stamps, so cached_page still costs one plan_stamp read (the plan's updated_at alone), because plans rebuilt by another worker process or plan_daemon.py never invalidate this process's cache. Pages of past weeks are cached separately, without invalidation, since their plans never change; their keys and ETags include the week navigation links, and all but the newest past week are served with long-lived cache headers.
+'''
+
+
+def weak_etag(*parts: Any) -> str:
+    """Build an (unquoted) ETag value from the given version parts."""
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def page_etag(username: str, page: str, stamp: Any, json_mode: bool) -> str:
+    """
+    ETag for one of a user's pages. HTML pages also depend on today's date
+    (the "Today" highlight and date labels), JSON responses do not.
+    """
+    today = None if json_mode else datetime.date.today().isoformat()
+    return weak_etag(username, page, "json" if json_mode else "html", stamp, today)
+
+
+def is_fresh(etag: str) -> bool:
+    """True if the client already holds the response for this ETag."""
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response carrying the ETag."""
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    """Attach a weak ETag to a response and make clients revalidate it."""
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def immutable(response: Response, etag: str) -> Response:
+    """Attach a weak ETag to a response that never changes and let clients keep it."""
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
+class PageCache:
+    """
+    LRU cache of rendered pages keyed by (username, page key), bounded by the
+    total size of the cached bodies in bytes.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], tuple[bytes, str]] = OrderedDict()
+        self._user_keys: dict[str, set[str]] = {}
+        self._generations: dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, username: str, key: str, etag: str | None = None) -> tuple[bytes, str] | None:
+        """
+        Return (body, etag) for a cached page, or None on a miss. With `etag`,
+        a page cached under a different ETag is outdated: it is dropped and missed.
+        """
+        with self._lock:
+            entry = self._entries.get((username, key))
+            if entry is not None and etag is not None and entry[1] != etag:
+                self._remove((username, key))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((username, key))
+            self.hits += 1
+            return entry
+
+    def generation(self, username: str) -> int:
+        """Counter bumped on every invalidation of a user's pages."""
+        with self._lock:
+            return self._generations.get(username, 0)
+
+    def put(
+        self, username: str, key: str, body: bytes, etag: str, generation: int
+    ) -> None:
+        """
+        Cache a rendered page, evicting least recently used pages if needed.
+        The page is dropped if the user's pages were invalidated since
+        `generation` was read, since it may have been rendered from old data.
+        """
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if self._generations.get(username, 0) != generation:
+                return
+            self._remove((username, key))
+            self._entries[(username, key)] = (body, etag)
+            self._user_keys.setdefault(username, set()).add(key)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, username: str) -> None:
+        """Drop every cached page for a user after their data changed."""
+        with self._lock:
+            for key in list(self._user_keys.get(username, ())):
+                self._remove((username, key))
+            self._generations[username] = self._generations.get(username, 0) + 1
+            self.invalidations += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, entry_key: tuple[str, str]) -> None:
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry[0])
+        username, key = entry_key
+        keys = self._user_keys.get(username)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[username]
+
+
+page_cache = PageCache(int(os.getenv("PAGE_CACHE_BYTES", str(8 * 1024 * 1024))))
+# Past weeks' plans are final, so their pages live in a cache the write paths never invalidate
+past_page_cache = PageCache(int(os.getenv("PAST_PAGE_CACHE_BYTES", str(4 * 1024 * 1024))))
+
+
+def html_page_key(page: str) -> str:
+    """Cache key for an HTML page; rendered pages also depend on today's date."""
+    return f"{page}|{datetime.date.today().isoformat()}"
+
+
+def cached_page(username: str, page: str, etag: str) -> Response | None:
+    """
+    Serve a page straight from the page cache, or None on a miss. `etag` is
+    the page's current ETag; a page cached under another one was rendered
+    before the plan or list changed (possibly in another process) and is
+    rendered again.
+    """
+    # Remember the generation before the caller reads Mongo for a miss
+    g.page_generation = page_cache.generation(username)
+    entry = page_cache.get(username, html_page_key(page), etag)
+    if entry is None:
+        return None
+    return with_etag(make_response(entry[0]), etag)
+
+
+def render_cached(
+    username: str, page: str, etag: str, template: str, **context: Any
+) -> Response:
+    """
+    Render a template, store the HTML in the page cache and attach the ETag.
+    Pages rendered from a stale plan (context stale=True) are not cached.
+    """
+    body = render_template(template, **context).encode("utf-8")
+    if context.get("stale"):
+        return with_etag(make_response(body), etag)
+    generation = g.get("page_generation", page_cache.generation(username))
+    page_cache.put(username, html_page_key(page), body, etag, generation)
+    return with_etag(make_response(body), etag)
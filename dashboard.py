@@ -0,0 +1,37 @@
+from flask import Blueprint, render_template, session, redirect, url_for
+from algorithm import food_db, get_planner_config, refresh_stale_rollups
+from rollups import load_dashboard
+'''
+This module defines the nutrition dashboard blueprint. The page shows planned calories against the goal and food-category coverage per day of the current week, per week and per month, plus what was bought in archived weeks. Everything comes from the precomputed documents in nutrition_rollups (see rollups.py).
+'''
+dashboard_bp = Blueprint('dashboard', __name__)
+
+
+def coverage(categories, expected):
+    """Share (0-100) of the planner's categories that appear in `categories`."""
+    if not expected:
+        return 0
+    return round(100 * len(set(categories) & expected) / len(expected))
+
+
+@dashboard_bp.route("/dashboard")
+def dashboard():
+    """Calories and category coverage per day, week and month."""
+    username = session.get('username')
+    if not username:
+        return redirect(url_for("login"))
+    versions = food_db.list_versions.find_one({"username": username}, {"settings_version": 1}) or {}
+    expected = set(get_planner_config(username, versions.get("settings_version", 0)).category_codes)
+    refresh_stale_rollups(username)
+    rollups = load_dashboard(food_db, username)
+    for period in rollups.values():
+        for row in period:
+            row["coverage"] = coverage(row.get("categories", []), expected)
+            purchased = row.get("purchased")
+            if purchased:
+                purchased["coverage"] = coverage(purchased.get("categories", []), expected)
+    return render_template("dashboard.html",
+                           days=rollups["days"],
+                           weeks=rollups["weeks"],
+                           months=rollups["months"],
+                           categories=sorted(expected))
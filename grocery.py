@@ -1,17 +1,25 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify, Response, stream_with_context
+import json
 from pymongo import MongoClient
 import os
 import datetime
 from bson.objectid import ObjectId
 import certifi
 from algorithm import (
-    build_meal_plan,
-    push_weekly_plan,
-    get_food_category,
-    lookup_food_category,
-    get_calories_per_gram,
-    parse_grams
+    request_plan_rebuild,
+    bump_list_version,
+    get_list_version,
+    plan_filter,
+    food_db
 )
+from quantity import parse_quantity
+from rollups import rollup_history_week
+from history_archive import compact_history, archived_weeks, archived_week_summary, archived_week_items
+from history_search import PAGE_SIZE, index_history_items, search_history
+from suggestions import record_purchases, suggest
+from caching import page_etag, is_fresh, not_modified, cached_page, render_cached
+from grocery_import import parse_item_json, parse_item_text, add_items_bulk, import_items
+from plan_events import wants_json, capture_diffs, captured_diff
 '''
 This module defines the grocery blueprint for the Flask application. It handles routes related to the grocery list, including displaying the current list, adding items, saving weekly history, and viewing past grocery lists.
 '''
@@ -31,7 +39,7 @@ grocery_history = db["grocery_history"] #need to update to read old week's inste
 #== HELPER FUNCTIONS ==#
 def calculate_item_calories(name, amount):
     doc = db.foodstats.find_one({"Name": {"$regex": name, "$options": "i"}})
-    grams = parse_grams(amount)
+    grams = parse_quantity(amount, name)
     print(doc['Calories'])
     if doc:
         return doc['Calories'] / 100 * grams
@@ -49,6 +57,30 @@ def get_item_category(name):
         print("not found!")
         return None
 
+def group_items_by_category(username):
+    """Load a user's current list grouped by food category for the template"""
+    items = current_week.find({"username": username})
+    categories_dict = {}
+    for item in items:
+        item['_id'] = str(item['_id'])
+        item['breakfast'] = item.get('time_in_day', '').lower() == 'breakfast'
+        category = item.get("food_type", "other")
+        if category not in categories_dict:
+            categories_dict[category] = []
+        categories_dict[category].append(item)
+    return categories_dict
+
+def item_row(item):
+    """One grocery list row as the page shows it, for JSON responses"""
+    return {
+        "_id": str(item["_id"]),
+        "name": item.get("name"),
+        "amount": item.get("amount"),
+        "grams": item.get("grams"),
+        "food_type": item.get("food_type", "other"),
+        "breakfast": item.get("time_in_day", "").lower() == "breakfast",
+    }
+
 def get_week_start(dt):
     """Get the Monday of the week for a given datetime"""
     return dt - datetime.timedelta(days=dt.weekday())
@@ -80,10 +112,10 @@ def add_old_to_history(username):
             #add this item into its correct week
             old_weeks[week_key]["items"].append(item_cp)
     for week_key in old_weeks:
-        exist = grocery_history.find_one({"week_start": old_weeks[week_key]["week_start"]})
+        exist = grocery_history.find_one({"username": username, "week_start": old_weeks[week_key]["week_start"]})
         if exist:
             grocery_history.update_one(
-                {"week_start": old_weeks[week_key]["week_start"]},
+                {"username": username, "week_start": old_weeks[week_key]["week_start"]},
                 {"$push": {"items": {"$each": old_weeks[week_key]["items"]}}}
             )
         else:
@@ -95,7 +127,20 @@ def add_old_to_history(username):
 
     for item in old_items:
         current_week.delete_one({"_id":item["_id"]})
-    build_meal_plan(username)
+    if old_items:
+        bump_list_version(username)
+    # Keep the dashboard's weekly/monthly purchase rollups in step with the archive
+    for week_key in old_weeks:
+        week_start = old_weeks[week_key]["week_start"]
+        rollup_history_week(food_db, grocery_history, username, week_start,
+                            archived_week_summary(grocery_history, username, week_start))
+    if old_weeks:
+        archived = [(week["week_start"], week["items"]) for week in old_weeks.values()]
+        index_history_items(grocery_history, username, archived)
+        record_purchases(grocery_history, username, archived)
+    # Move weeks past HISTORY_COLD_AFTER_WEEKS into compressed monthly storage
+    compact_history(grocery_history, username)
+    request_plan_rebuild(username)
 #== CRUD ==#
 def label_existing_items():
     items = list(current_week.find({
@@ -110,6 +155,7 @@ def label_existing_items():
 
 
     updated_count = 0
+    updated_users = set()
 
     for item in items:
         name = item['name']
@@ -130,11 +176,18 @@ def label_existing_items():
             )
         if result.modified_count > 0:
             updated_count +=1
+            updated_users.add(item.get("username"))
+    for username in updated_users:
+        bump_list_version(username)
     print(f"Total items updated: {updated_count}")
     return updated_count
 
 @grocery_bp.route("/delete-item/<item_id>", methods=["POST"])
 def delete_item(item_id):
+    json_mode = wants_json()
+    if json_mode:
+        capture_diffs()
+    removed = []
     try:
         item = current_week.find_one({"_id": ObjectId(item_id)})
         if item:
@@ -142,18 +195,27 @@ def delete_item(item_id):
             result = current_week.delete_one({"_id": ObjectId(item_id)})
             if result.deleted_count > 0:
                 print(f"Deleted item with id: {item_id}")
+                removed.append(item_id)
+                bump_list_version(username)
                 # Update the weekly meal plan after deleting item
-                build_meal_plan(username)
+                request_plan_rebuild(username)
             else:
                 print(f"Item not found: {item_id}")
         else:
             print(f"Item not found: {item_id}")
     except Exception as e:
         print(f"Error deleting item: {e}")
+    if json_mode:
+        if not removed:
+            return jsonify({"error": "Item not found"}), 404
+        return jsonify({"grocery": {"removed": removed}, "plan": captured_diff()})
     return redirect(url_for("grocery.grocery_list"))
 
 @grocery_bp.route("/toggle-breakfast/<item_id>", methods=["POST"])
 def toggle_breakfast(item_id):
+    json_mode = wants_json()
+    if json_mode:
+        capture_diffs()
     try:
         item = current_week.find_one({"_id": ObjectId(item_id)})
         if item:
@@ -165,12 +227,17 @@ def toggle_breakfast(item_id):
                 {"$set": {"time_in_day": new_value, "breakfast": not current_value}}
             )
             print(f"Toggled breakfast for {item.get('name')} to {new_value}")
+            bump_list_version(username)
             
             # Update the weekly meal plan after toggling
-            build_meal_plan(username)
+            request_plan_rebuild(username)
             
-            if request.headers.get('Content-Type') == 'application/json':
-                return jsonify({"success": True, "breakfast": not current_value})
+            if json_mode:
+                item["time_in_day"] = new_value
+                return jsonify({"success": True, "breakfast": not current_value,
+                                "grocery": {"updated": [item_row(item)]}, "plan": captured_diff()})
+        elif json_mode:
+            return jsonify({"error": "Item not found"}), 404
         
         return redirect(url_for("grocery.grocery_list"))
     except Exception as e:
@@ -193,8 +260,33 @@ def grocery_history_page():
         week['_id'] = str(week['_id'])
         for item in week.get('items', []):
             item['_id'] = str(item['_id'])
+    # Archived weeks are listed from their summaries; only an expanded week is decompressed
+    expanded = request.args.get("week")
+    for week in archived_weeks(grocery_history, username):
+        week["archived"] = True
+        week["expanded"] = week["week_start"].strftime("%Y-%m-%d") == expanded
+        if week["expanded"]:
+            week["items"] = archived_week_items(grocery_history, username, week["week_start"])
+        history.append(week)
     return render_template("grocery-history.html", history=history)
 
+@grocery_bp.route("/grocery-history/search")
+def grocery_history_search():
+    """Search the user's past purchases by name, newest first, PAGE_SIZE per page"""
+    username = session.get('username')
+    if not username:
+        return redirect(url_for("login"))
+    query = request.args.get("q", "").strip()
+    result = search_history(grocery_history, username, query,
+                            request.args.get("after"), request.args.get("before"), PAGE_SIZE)
+    if request.headers.get('Content-Type') == 'application/json' or request.args.get('format') == 'json':
+        for item in result["results"]:
+            for field in ("date_added", "week_start"):
+                if item.get(field):
+                    item[field] = item[field].isoformat()
+        return jsonify(result)
+    return render_template("grocery-search.html", **result)
+
 @grocery_bp.route("/save-week") #hasn't implement function yet
 def save_week():
     items = list(current_week.find())
@@ -220,7 +312,17 @@ def grocery_list():
     username = session.get('username')
     if not username:
         return redirect(url_for("login"))
-    
+
+    if request.method == "GET":
+        # Answer repeat visits with a 304 before loading or rendering the list
+        etag = page_etag(username, "grocery-list", get_list_version(username), False)
+        if is_fresh(etag):
+            return not_modified(etag)
+        # Serve the rendered list from the per-user page cache when possible
+        cached = cached_page(username, "grocery-list", etag)
+        if cached is not None:
+            return cached
+
     unlabeled_items = current_week.count_documents({
     "$or": [
         {"food_type": {"$exists": False}},
@@ -238,26 +340,25 @@ def grocery_list():
 
     print(f"Received {request.method} request at /grocery-list")
     if request.method == "POST":
-        name = request.form.get("name")
-        amount = request.form.get("amount")
-        is_breakfast = request.form.get("breakfast") == "on"
+        json_mode = wants_json()
+        if json_mode:
+            capture_diffs()
+        fields = request.get_json(silent=True) or request.form
+        name = fields.get("name")
+        amount = fields.get("amount")
+        is_breakfast = fields.get("breakfast") in ("on", True)
+        if json_mode and not (name and amount):
+            return jsonify({"error": "Both a name and an amount are needed"}), 400
         # username = session.get('username') #NEED TO DEBUG
         # if not username:
         #     print("no user")
         #     return redirect(url_for("auth.login"))
         food_category = get_item_category(name)
+        if food_category is None and json_mode:
+            return jsonify({"error": "Sorry we don't recognize this food. Please try a different food item"}), 400
         if food_category is None:
-            items = current_week.find({"username": username})
-            categories_dict = {}
-            for item in items:
-                item['_id'] = str(item['_id'])
-                item['breakfast'] = item.get('time_in_day', '').lower() == 'breakfast'
-                category = item.get("food_type", "other")
-                if category not in categories_dict:
-                    categories_dict[category] = []
-                categories_dict[category].append(item)
             return render_template("grocery-list.html", 
-                                   categories = categories_dict, 
+                                   categories = group_items_by_category(username), 
                                    error = "Sorry we don't recognize this food. Please try a different food item"
                                    )
 
@@ -267,40 +368,118 @@ def grocery_list():
         
         if name and amount:
             
-            result  = current_week.insert_one({
+            item = {
                 "username": username,
                 "name": name,
                 "amount": amount,
+                "grams": parse_quantity(amount, name),
                 "time_in_day": "breakfast" if is_breakfast else "empty",
                 "breakfast": is_breakfast,
                 "food_type": food_category,
                 "date_added": datetime.datetime.utcnow(),
                 "calories": total_calories
-            })
+            }
+            current_week.insert_one(item)
 
             print(f"Added item{name} ({amount}g) - Category: {food_category}")
+            bump_list_version(username)
             
             # Update the weekly meal plan after adding item
-            build_meal_plan(username)
+            request_plan_rebuild(username)
+            if json_mode:
+                return jsonify({"grocery": {"added": [item_row(item)]}, "plan": captured_diff()})
             
         return redirect(url_for("grocery.grocery_list"))
    
    # GET request
+    # Labeling above bumps the list version, so stamp the page with the version it shows
+    etag = page_etag(username, "grocery-list", get_list_version(username), False)
+    return render_cached(username, "grocery-list", etag, "grocery-list.html", categories=group_items_by_category(username))
 
-    items = current_week.find({"username": username})
-    categories_dict = {}
 
-    for item in items:
-        item['_id'] = str(item['_id'])
-        item['breakfast'] = item.get('time_in_day', '').lower() == 'breakfast'
-        category = item.get("food_type", "other")
+@grocery_bp.route("/grocery-list/suggestions")
+def grocery_list_suggestions():
+    """Foods for the plan's missing categories and regular staples, loaded by the grocery list page"""
+    username = session.get('username')
+    if not username:
+        return jsonify({"error": "Not logged in"}), 401
+    plan = food_db.weeklymeals.find_one(plan_filter(username), {"missing_categories": 1}) or {}
+    names = [item["name"] for item in current_week.find({"username": username}, {"name": 1}) if item.get("name")]
+    return jsonify(suggest(grocery_history, username, plan.get("missing_categories", []), names))
+
+
+@grocery_bp.route("/grocery-list/bulk", methods=["POST"])
+def grocery_list_bulk():
+    """
+    Add many grocery items at once. Accepts a JSON array, a CSV/text body or a
+    form "items" textarea with one "name, amount[, breakfast]" per line, and
+    returns a per-line report (JSON) or the grocery list page (form).
+    """
+    username = session.get('username')
+    if not username:
+        return redirect(url_for("login"))
 
-        if category not in categories_dict:
-            categories_dict[category] = []
-        categories_dict[category].append(item)
+    from_form = "items" in request.form
+    if request.is_json:
+        try:
+            rows = parse_item_json(request.get_json())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    elif from_form:
+        rows = parse_item_text(request.form["items"])
+    else:
+        rows = parse_item_text(request.get_data(as_text=True))
+
+    report = add_items_bulk(username, rows)
+    added = sum(1 for entry in report if entry["status"] == "added")
+    print(f"Bulk add for {username}: {added} of {len(report)} items added")
+
+    if from_form:
+        failed = [entry["name"] or f"line {entry['line']}" for entry in report if entry["status"] != "added"]
+        if failed:
+            return render_template("grocery-list.html",
+                                   categories=group_items_by_category(username),
+                                   error=f"Added {added} items. Sorry we don't recognize: {', '.join(failed)}")
+        return redirect(url_for("grocery.grocery_list"))
+    return jsonify({"added": added, "items": report})
+
+
+@grocery_bp.route("/grocery-list/import", methods=["POST"])
+def grocery_list_import():
+    """
+    Import a receipt export or CSV upload (form field "file"). API clients get
+    newline-delimited JSON progress events streamed back while the file is
+    processed; the upload form waits for the import and shows the list.
+    """
+    username = session.get('username')
+    if not username:
+        return redirect(url_for("login"))
+    upload = request.files.get("file")
+    if upload is None or not upload.filename:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    events = import_items(username, upload.stream)
+    if request.form.get("from_form"):
+        # Run the import to the end; the last event sums it up
+        last = None
+        for last in events:
+            pass
+        if last is None:
+            return render_template("grocery-list.html",
+                                   categories=group_items_by_category(username),
+                                   error="Nothing was imported from this file")
+        print(f"Imported {last['added']} items for {username} from {upload.filename}")
+        if last.get("failures"):
+            failed = ", ".join(failure["name"] or f"line {failure['line']}" for failure in last["failures"])
+            return render_template("grocery-list.html",
+                                   categories=group_items_by_category(username),
+                                   error=f"Imported {last['added']} items. Skipped {last['skipped']}: {failed}")
+        return redirect(url_for("grocery.grocery_list"))
 
- 
-    return render_template("grocery-list.html", categories=categories_dict)
+    def stream():
+        for event in events:
+            yield json.dumps(event) + "\n"
+    return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
 
 
 @grocery_bp.route('/<path:filename>')
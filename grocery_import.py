@@ -0,0 +1,267 @@
+from __future__ import annotations
+import csv
+import datetime
+import io
+import re
+import sys
+from itertools import islice
+from typing import Any, BinaryIO, Iterable, Iterator
+
+from algorithm import (
+    food_db,
+    request_plan_rebuild,
+    bump_list_version,
+    resolve_food_records
+)
+from quantity import parse_quantity
+'''
+This module adds many grocery items in one go. Items come in as a JSON array or a CSV/text paste ("name, amount[, breakfast]" per line); all foods are resolved with a single foodstats query, written with one insert_many and the meal plan is rebuilt once at the end.
+
+Large uploads (receipt exports, CSVs with hundreds of lines) go through import_items, a generator pipeline that reads the file line by line, normalizes names and quantities and resolves/inserts them in fixed-size chunks, so memory stays flat regardless of file size.
+'''
+
+BREAKFAST_WORDS = {"breakfast", "b", "yes", "y", "true", "1", "on"}
+IMPORT_CHUNK_SIZE = 200
+MAX_REPORTED_FAILURES = 50
+
+NAME_HEADERS = {"name", "item", "items", "description", "product", "food"}
+AMOUNT_HEADERS = {"amount", "quantity", "qty", "size", "weight"}
+UNIT_HEADERS = {"unit", "units", "uom"}
+BREAKFAST_HEADERS = {"breakfast"}
+
+PRICE_RE = re.compile(r"\s*\$?\d+\.\d{2}\s*$")
+QUANTITY_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\.?\s*$")
+RECEIPT_LINE_RE = re.compile(
+    r"^(?P<name>.*?[a-zA-Z].*?)\s+(?P<amount>\d+(?:\.\d+)?\s*[a-zA-Z]*)\.?$"
+)
+
+
+def parse_item_line(line: str) -> dict[str, Any] | None:
+    """Parse one "name, amount[, breakfast]" line; blank lines give None."""
+    if not line.strip():
+        return None
+    delimiter = "\t" if "\t" in line else ","
+    fields = [field.strip() for field in next(csv.reader([line], delimiter=delimiter))]
+    return {
+        "name": fields[0],
+        "amount": fields[1] if len(fields) > 1 else "",
+        "breakfast": len(fields) > 2 and fields[2].lower() in BREAKFAST_WORDS,
+    }
+
+
+def parse_item_text(text: str) -> list[dict[str, Any] | None]:
+    """Parse a pasted list, one row per line (None for blank lines)."""
+    return [parse_item_line(line) for line in io.StringIO(text)]
+
+
+def parse_item_json(payload: Any) -> list[dict[str, Any] | None]:
+    """Parse a JSON array of {"name", "amount", "breakfast"} objects or text lines."""
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of items")
+    rows: list[dict[str, Any] | None] = []
+    for entry in payload:
+        if isinstance(entry, str):
+            rows.append(parse_item_line(entry))
+        elif isinstance(entry, dict):
+            breakfast = entry.get("breakfast", False)
+            if isinstance(breakfast, str):
+                breakfast = breakfast.lower() in BREAKFAST_WORDS
+            rows.append({
+                "name": str(entry.get("name", "")).strip(),
+                "amount": str(entry.get("amount", "")).strip(),
+                "breakfast": bool(breakfast),
+            })
+        else:
+            rows.append({"name": "", "amount": "", "breakfast": False})
+    return rows
+
+
+def make_item_doc(
+    username: str, row: dict[str, Any], record: dict[str, Any], added_at: datetime.datetime
+) -> dict[str, Any]:
+    """Build the current_list document for one recognised grocery item."""
+    calories = record.get("Calories") or 0
+    grams = parse_quantity(row["amount"], row["name"])
+    return {
+        "username": username,
+        "name": row["name"],
+        "amount": row["amount"],
+        "grams": grams,
+        "time_in_day": "breakfast" if row["breakfast"] else "empty",
+        "breakfast": row["breakfast"],
+        "food_type": record.get("Category"),
+        "date_added": added_at,
+        "calories": calories / 100 * grams,
+    }
+
+
+def resolve_rows(
+    username: str, numbered_rows: list[tuple[int, dict[str, Any]]]
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Resolve a batch of (line number, row) pairs against foodstats with one query.
+    Returns the documents to insert and a report entry for every row.
+    """
+    records = resolve_food_records([row["name"] for _, row in numbered_rows if row["name"]])
+    added_at = datetime.datetime.utcnow()
+    docs: list[dict[str, Any]] = []
+    report: list[dict[str, Any]] = []
+    for line, row in numbered_rows:
+        entry = {"line": line, "name": row["name"], "amount": row["amount"]}
+        if not row["name"] or not row["amount"]:
+            entry.update(status="invalid", error="Each item needs a name and an amount")
+        elif records.get(row["name"]) is None:
+            entry.update(status="unknown", error="Sorry we don't recognize this food")
+        else:
+            doc = make_item_doc(username, row, records[row["name"]], added_at)
+            docs.append(doc)
+            entry.update(status="added", food_type=doc["food_type"], calories=round(doc["calories"], 1))
+        report.append(entry)
+    return docs, report
+
+
+def add_items_bulk(username: str, rows: list[dict[str, Any] | None]) -> list[dict[str, Any]]:
+    """Add a batch of grocery items for a user and rebuild their plan once."""
+    numbered_rows = [(line, row) for line, row in enumerate(rows, start=1) if row is not None]
+    docs, report = resolve_rows(username, numbered_rows)
+    if docs:
+        food_db["current_list"].insert_many(docs)
+        bump_list_version(username)
+        request_plan_rebuild(username)
+    return report
+
+
+#== STREAMING IMPORT ==#
+def iter_text_lines(stream: BinaryIO) -> Iterator[str]:
+    """Decode an uploaded file line by line without reading it all into memory."""
+    yield from io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+
+
+def normalize_name(name: str) -> str:
+    """Drop a trailing receipt price and squeeze spaces, keeping the name's casing."""
+    name = PRICE_RE.sub("", name)
+    return " ".join(name.replace("*", " ").split()).strip(" -:;")
+
+
+def normalize_amount(amount: str) -> str:
+    """Tidy a quantity: "2LBS" -> "2 lbs", "500g" -> "500 g"."""
+    amount = " ".join(amount.split())
+    match = QUANTITY_RE.match(amount)
+    if not match:
+        return amount.lower()
+    number, unit = match.groups()
+    return f"{number} {unit.lower()}" if unit else number
+
+
+def _header_columns(fields: list[str]) -> dict[str, int] | None:
+    """Map a CSV header row to column positions, or None if it isn't a header."""
+    columns: dict[str, int] = {}
+    for index, field in enumerate(fields):
+        key = field.strip().lower()
+        for column, names in (("name", NAME_HEADERS), ("amount", AMOUNT_HEADERS),
+                              ("unit", UNIT_HEADERS), ("breakfast", BREAKFAST_HEADERS)):
+            if key in names and column not in columns:
+                columns[column] = index
+    return columns if "name" in columns else None
+
+
+def _row_from_columns(fields: list[str], columns: dict[str, int]) -> dict[str, Any]:
+    def field(column: str) -> str:
+        index = columns.get(column)
+        return fields[index].strip() if index is not None and index < len(fields) else ""
+
+    amount = field("amount")
+    if field("unit"):
+        amount = f"{amount} {field('unit')}"
+    return {
+        "name": field("name"),
+        "amount": amount,
+        "breakfast": field("breakfast").lower() in BREAKFAST_WORDS,
+    }
+
+
+def iter_rows(lines: Iterable[str]) -> Iterator[tuple[int, dict[str, Any]]]:
+    """
+    Parse lines into (line number, row) pairs. A first line naming the columns
+    (e.g. "Item,Qty,Unit,Price") is used as a header; otherwise each line is
+    "name, amount[, breakfast]" or a receipt line like "BANANAS 2.5 LB $1.23".
+    """
+    columns: dict[str, int] | None = None
+    seen_first = False
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        delimiter = "\t" if "\t" in line else ","
+        fields = next(csv.reader([line], delimiter=delimiter), [])
+        if not seen_first:
+            seen_first = True
+            columns = _header_columns(fields)
+            if columns is not None:
+                continue
+        if columns is not None:
+            row = _row_from_columns(fields, columns)
+        elif len(fields) > 1:
+            row = parse_item_line(line)
+        else:
+            match = RECEIPT_LINE_RE.match(PRICE_RE.sub("", line.strip()))
+            row = {"name": match["name"], "amount": match["amount"], "breakfast": False} if match \
+                else {"name": line.strip(), "amount": "", "breakfast": False}
+        yield line_number, row
+
+
+def normalize_rows(
+    rows: Iterable[tuple[int, dict[str, Any]]]
+) -> Iterator[tuple[int, dict[str, Any]]]:
+    for line_number, row in rows:
+        yield line_number, {
+            **row,
+            "name": normalize_name(row["name"]),
+            "amount": normalize_amount(row["amount"]),
+        }
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def import_items(
+    username: str, stream: BinaryIO, chunk_size: int = IMPORT_CHUNK_SIZE
+) -> Iterator[dict[str, Any]]:
+    """
+    Import a receipt export or CSV for a user. Yields a progress event after
+    each chunk is written and a final "done" event once the plan is rebuilt.
+    Only the first MAX_REPORTED_FAILURES failed lines are kept for reporting.
+    """
+    lines = added = skipped = 0
+    failures: list[dict[str, Any]] = []
+    rows = normalize_rows(iter_rows(iter_text_lines(stream)))
+    for chunk in chunked(rows, chunk_size):
+        docs, report = resolve_rows(username, chunk)
+        if docs:
+            food_db["current_list"].insert_many(docs, ordered=False)
+        lines = chunk[-1][0]
+        added += len(docs)
+        skipped += len(report) - len(docs)
+        for entry in report:
+            if entry["status"] != "added" and len(failures) < MAX_REPORTED_FAILURES:
+                failures.append(entry)
+        yield {"event": "progress", "lines": lines, "added": added, "skipped": skipped}
+
+    if added:
+        bump_list_version(username)
+        request_plan_rebuild(username)
+    yield {"event": "done", "lines": lines, "added": added, "skipped": skipped, "failures": failures}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python grocery_import.py <username> <file.csv>")
+        sys.exit(1)
+    with open(sys.argv[2], "rb") as upload:
+        for event in import_items(sys.argv[1], upload):
+            print(f"  {event['event']}: {event['lines']} lines read, "
+                  f"{event['added']} added, {event['skipped']} skipped")
+            for failure in event.get("failures", []):
+                print(f"    line {failure['line']}: {failure['name']!r} - {failure['error']}")
@@ -0,0 +1,154 @@
+from __future__ import annotations
+import datetime
+import json
+import os
+import zlib
+from typing import Any
+
+from bson.binary import Binary
+from pymongo.collection import Collection
+
+from rollups import week_start_of
+
+'''
+This module keeps old grocery history in cold storage. Weeks older than HISTORY_COLD_AFTER_WEEKS are moved out of grocery_history (one document per week holding full current_list copies) into grocery_history_archive, one document per user per month. The month document has a small header (item count, calories and categories per week) and a zlib-compressed blob holding the month's items column by column, keeping only the fields the history page and the rollups use.
+
+A month document also lists the _ids of the grocery_history weeks folded into it (week_ids). The fold and the delete of the hot weeks are separate writes, so after a crash between them the next compaction finds those weeks still in grocery_history; it skips the ones already listed and only deletes them.
+
+The history page lists archived weeks from their headers alone (the blob is projected out) and only decompresses a month when one of its weeks is expanded.
+'''
+
+ARCHIVE = "grocery_history_archive"
+COLD_AFTER_WEEKS = int(os.getenv("HISTORY_COLD_AFTER_WEEKS", "8"))
+BLOB_CODEC = "zlib-json-columns-1"
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Item fields kept in cold storage, one column each
+COLUMNS = ("week", "name", "amount", "grams", "calories", "food_type", "time_in_day", "date_added")
+
+
+def archive_id(username: str, month_start: datetime.datetime) -> str:
+    return f"{username}|{month_start.strftime('%Y-%m')}"
+
+
+def _row(item: dict[str, Any], week_start: datetime.datetime) -> dict[str, Any]:
+    date_added = item.get("date_added")
+    return {
+        "week": week_start.strftime("%Y-%m-%d"),
+        "name": item.get("name"),
+        "amount": item.get("amount"),
+        "grams": item.get("grams"),
+        "calories": item.get("calories"),
+        "food_type": item.get("food_type"),
+        "time_in_day": item.get("time_in_day"),
+        # date_added is naive UTC, stored as whole seconds since the epoch
+        "date_added": int((date_added - EPOCH).total_seconds()) if isinstance(date_added, datetime.datetime) else None,
+    }
+
+
+def encode_rows(rows: list[dict[str, Any]]) -> bytes:
+    columns = {column: [row[column] for row in rows] for column in COLUMNS}
+    return zlib.compress(json.dumps(columns, separators=(",", ":")).encode(), 9)
+
+
+def decode_rows(blob: bytes) -> list[dict[str, Any]]:
+    columns = json.loads(zlib.decompress(blob))
+    return [dict(zip(COLUMNS, values)) for values in zip(*(columns[column] for column in COLUMNS))]
+
+
+def _summaries(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """The per-week header of a month document."""
+    weeks: dict[str, dict[str, Any]] = {}
+    for row in rows:
+        week = weeks.setdefault(row["week"], {
+            "week_start": datetime.datetime.strptime(row["week"], "%Y-%m-%d"),
+            "item_count": 0,
+            "calories": 0.0,
+            "categories": set(),
+        })
+        week["item_count"] += 1
+        week["calories"] += row["calories"] or 0
+        if row["food_type"]:
+            week["categories"].add(row["food_type"])
+    return [
+        {**week, "calories": round(week["calories"], 1), "categories": sorted(week["categories"])}
+        for _, week in sorted(weeks.items())
+    ]
+
+
+def compact_history(history: Collection, username: str, now: datetime.datetime | None = None) -> int:
+    """
+    Move a user's weeks older than COLD_AFTER_WEEKS from grocery_history into
+    their month documents in the archive. Returns the number of weeks moved.
+    """
+    cutoff = week_start_of(now or datetime.datetime.utcnow()) - datetime.timedelta(weeks=COLD_AFTER_WEEKS)
+    hot_weeks = list(history.find({"username": username, "week_start": {"$lt": cutoff}}))
+    if not hot_weeks:
+        return 0
+    archive = history.database[ARCHIVE]
+
+    by_month: dict[datetime.datetime, list[dict[str, Any]]] = {}
+    for week in hot_weeks:
+        by_month.setdefault(week["week_start"].replace(day=1), []).append(week)
+    for month_start, weeks in by_month.items():
+        existing = archive.find_one({"_id": archive_id(username, month_start)}, {"blob": 1, "week_ids": 1}) or {}
+        week_ids = existing.get("week_ids", [])
+        new_weeks = [week for week in weeks if week["_id"] not in week_ids]
+        if not new_weeks:
+            # Folded in before, but not deleted from grocery_history yet
+            continue
+        rows = decode_rows(existing["blob"]) if existing else []
+        rows.extend(_row(item, week["week_start"]) for week in new_weeks for item in week.get("items", []))
+        blob = encode_rows(rows)
+        archive.replace_one(
+            {"_id": archive_id(username, month_start)},
+            {
+                "username": username,
+                "month_start": month_start,
+                "weeks": _summaries(rows),
+                "codec": BLOB_CODEC,
+                "blob": Binary(blob),
+                "week_ids": week_ids + [week["_id"] for week in new_weeks],
+                "updated_at": datetime.datetime.utcnow(),
+            },
+            upsert=True,
+        )
+    history.delete_many({"_id": {"$in": [week["_id"] for week in hot_weeks]}})
+    return len(hot_weeks)
+
+
+def archived_weeks(history: Collection, username: str) -> list[dict[str, Any]]:
+    """Header summaries of a user's archived weeks, newest first (no decompression)."""
+    months = history.database[ARCHIVE].find({"username": username}, {"weeks": 1})
+    weeks = [week for month in months for week in month.get("weeks", [])]
+    return sorted(weeks, key=lambda week: week["week_start"], reverse=True)
+
+
+def archived_week_summary(
+    history: Collection, username: str, week_start: datetime.datetime
+) -> dict[str, Any] | None:
+    """The header summary of one archived week, or None if it is not archived."""
+    month = history.database[ARCHIVE].find_one(
+        {"_id": archive_id(username, week_start.replace(day=1))}, {"weeks": 1})
+    for week in (month or {}).get("weeks", []):
+        if week["week_start"] == week_start:
+            return week
+    return None
+
+
+def archived_week_items(
+    history: Collection, username: str, week_start: datetime.datetime
+) -> list[dict[str, Any]]:
+    """Decompress the items of one archived week."""
+    month = history.database[ARCHIVE].find_one(
+        {"_id": archive_id(username, week_start.replace(day=1))}, {"blob": 1})
+    if not month:
+        return []
+    key = week_start.strftime("%Y-%m-%d")
+    items = []
+    for row in decode_rows(month["blob"]):
+        if row["week"] == key:
+            stamp = row.pop("date_added")
+            row["date_added"] = EPOCH + datetime.timedelta(seconds=stamp) if stamp is not None else None
+            items.append(row)
+    return items
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import datetime
+import re
+from typing import Any
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.collection import Collection
+
+from history_archive import ARCHIVE, EPOCH, decode_rows
+
+'''
+This module answers "when did I last buy X?" without opening grocery_history weeks. Every archived purchase is also written to history_items as one small document with the words of its name (lower-cased) in a "tokens" array. A multikey index on (username, tokens, date_added, _id) turns a search into an index seek that already returns purchases newest first. Pages are keyset pages: the next one starts after the (date_added, _id) of the last result instead of skipping the earlier ones, so a page costs the same however deep into the history it is.
+'''
+
+ITEMS = "history_items"
+PAGE_SIZE = 20
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def tokens(text: str) -> list[str]:
+    """The searchable words of an item name or query."""
+    return sorted(set(_WORD.findall((text or "").lower())))
+
+
+# Before _id was part of the search index; the new index makes it redundant
+OLD_SEARCH_INDEX = "username_1_tokens_1_date_added_-1"
+
+
+def ensure_history_search_index(history: Collection) -> None:
+    items = history.database[ITEMS]
+    items.create_index([("username", 1), ("tokens", 1), ("date_added", -1), ("_id", -1)])
+    if OLD_SEARCH_INDEX in items.index_information():
+        items.drop_index(OLD_SEARCH_INDEX)
+
+
+def _item_doc(username: str, week_start: datetime.datetime, item: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "username": username,
+        "name": item.get("name"),
+        "tokens": tokens(item.get("name")),
+        "amount": item.get("amount"),
+        "grams": item.get("grams"),
+        "calories": item.get("calories"),
+        "food_type": item.get("food_type"),
+        "date_added": item.get("date_added") or week_start,
+        "week_start": week_start,
+    }
+
+
+def index_history_items(
+    history: Collection, username: str, weeks: list[tuple[datetime.datetime, list[dict[str, Any]]]]
+) -> None:
+    """Add the items just archived, as (week_start, items) pairs, to the search table."""
+    items = history.database[ITEMS]
+    if not items.find_one({"username": username}, {"_id": 1}):
+        # First archive since the search table existed: index the whole history (which includes these items)
+        reindex_history(history, username)
+        return
+    docs = [_item_doc(username, week_start, item) for week_start, week_items in weeks for item in week_items]
+    if docs:
+        items.insert_many(docs, ordered=False)
+
+
+def reindex_history(history: Collection, username: str) -> int:
+    """
+    Rebuild a user's search table from grocery_history and the compressed
+    monthly archive. Returns the number of items indexed.
+    """
+    items = history.database[ITEMS]
+    items.delete_many({"username": username})
+    docs = [
+        _item_doc(username, week["week_start"], item)
+        for week in history.find({"username": username, "week_start": {"$exists": True}})
+        for item in week.get("items", [])
+    ]
+    for month in history.database[ARCHIVE].find({"username": username}, {"blob": 1}):
+        for row in decode_rows(month["blob"]):
+            week_start = datetime.datetime.strptime(row["week"], "%Y-%m-%d")
+            if row["date_added"] is not None:
+                row["date_added"] = EPOCH + datetime.timedelta(seconds=row["date_added"])
+            docs.append(_item_doc(username, week_start, row))
+    if docs:
+        items.insert_many(docs, ordered=False)
+    return len(docs)
+
+
+def page_key(item: dict[str, Any]) -> str:
+    """The position of a result, for the `after`/`before` of the next page."""
+    return f"{item['date_added'].isoformat()}_{item['_id']}"
+
+
+def _parse_key(key: str | None) -> tuple[datetime.datetime, ObjectId] | None:
+    if not key:
+        return None
+    date, _, item_id = key.rpartition("_")
+    try:
+        return datetime.datetime.fromisoformat(date), ObjectId(item_id)
+    except (ValueError, InvalidId):
+        return None
+
+
+def search_history(
+    history: Collection, username: str, query: str,
+    after: str | None = None, before: str | None = None, page_size: int = PAGE_SIZE,
+) -> dict[str, Any]:
+    """
+    One page of a user's past purchases whose names contain every word of
+    `query`, newest first: the first page, the page of older purchases
+    `after` a page_key, or the page of newer ones `before` it. "older" and
+    "newer" in the result are the keys to page on with, None at either end.
+    """
+    words = tokens(query)
+    result: dict[str, Any] = {"query": query, "results": [], "older": None, "newer": None}
+    if not words:
+        return result
+    items = history.database[ITEMS]
+    # Histories archived before the search table existed are indexed on first search
+    if not items.find_one({"username": username}, {"_id": 1}):
+        reindex_history(history, username)
+
+    match: dict[str, Any] = {"username": username, "tokens": {"$all": words}}
+    backwards = False
+    cursor_key = _parse_key(after)
+    if cursor_key is None and _parse_key(before) is not None:
+        cursor_key, backwards = _parse_key(before), True
+    if cursor_key is not None:
+        date, item_id = cursor_key
+        beyond = "$gt" if backwards else "$lt"
+        match["$or"] = [{"date_added": {beyond: date}}, {"date_added": date, "_id": {beyond: item_id}}]
+    order = 1 if backwards else -1
+    found = list(items.find(match, {"username": 0, "tokens": 0})
+                 .sort([("date_added", order), ("_id", order)])
+                 .limit(page_size + 1))
+    more = len(found) > page_size
+    page = found[:page_size]
+    if backwards:
+        page.reverse()
+    if page:
+        if more or backwards:
+            result["older"] = page_key(page[-1])
+        if (more and backwards) or (cursor_key is not None and not backwards):
+            result["newer"] = page_key(page[0])
+    for item in page:
+        del item["_id"]
+    result["results"] = page
+    return result
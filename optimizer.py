@@ -0,0 +1,235 @@
+from __future__ import annotations
+import random
+import time
+from typing import Any, Callable
+
+'''
+This module is an optional improvement pass run after the greedy planner. fill_meal_slot fills each slot once, in order, so meals often land under their calorie goal while grams are still left in the pool, and a category can run out on one day while another day has plenty. optimize_plan runs random local-search moves (top up a slot from the leftover pool, trim an overfull slot, shift grams of a food between slots, swap foods between slots) and keeps a move only when it lowers the plan's cost. It is an anytime search: it stops when its time budget runs out and the plan always holds the best solution found so far.
+'''
+
+# Cost (in kcal of calorie error) of a slot missing one of its meal's categories
+MISSING_CATEGORY_PENALTY = 100.0
+MIN_ITEM_GRAMS = 1.0
+# Give up early after this many proposals in a row that didn't improve the plan
+MAX_IDLE_PROPOSALS = 2000
+
+Slot = dict[str, Any]
+Move = tuple[dict[int, list[dict[str, Any]]], dict[tuple[str, bool], float]]
+
+
+def plan_error(plan: dict[str, Any]) -> float:
+    """Total absolute distance between each slot's calories and its goal."""
+    return round(sum(
+        abs(slot.get("calorie_goal", 0) - slot.get("total_calories", 0))
+        for meals in plan.values() for slot in meals.values()
+    ), 1)
+
+
+class _Search:
+    def __init__(
+        self,
+        plan: dict[str, Any],
+        pool: list[dict[str, Any]],
+        composition: dict[str, dict[str, int]],
+        rng: random.Random,
+    ):
+        self.composition = composition
+        self.rng = rng
+        self.foods = {(f["foodName"], f["isBreakfast"]): f for f in pool}
+        self.leftover = {key: max(0.0, f["remaining_grams"]) for key, f in self.foods.items()}
+        self.slots: list[tuple[str, str, Slot]] = [
+            (day, meal, slot) for day, meals in plan.items() for meal, slot in meals.items()
+        ]
+        self.items = [[dict(item, grams=float(item["grams"])) for item in slot["items"]]
+                      for _, _, slot in self.slots]
+        self.costs = [self.cost(i, items) for i, items in enumerate(self.items)]
+
+    def is_breakfast(self, index: int) -> bool:
+        return self.slots[index][1] == "Breakfast"
+
+    def calories(self, index: int, items: list[dict[str, Any]]) -> float:
+        breakfast = self.is_breakfast(index)
+        return sum(item["grams"] * self.foods[(item["foodName"], breakfast)]["cal_per_gram"]
+                   for item in items if (item["foodName"], breakfast) in self.foods)
+
+    def cost(self, index: int, items: list[dict[str, Any]]) -> float:
+        goal = self.slots[index][2].get("calorie_goal", 0)
+        present = {item["foodCategory"] for item in items}
+        missing = sum(1 for category in self.composition.get(self.slots[index][1], {})
+                      if category not in present)
+        return abs(goal - self.calories(index, items)) + MISSING_CATEGORY_PENALTY * missing
+
+    def gap(self, index: int) -> float:
+        """Calories still needed to reach the slot's goal (negative if over)."""
+        return self.slots[index][2].get("calorie_goal", 0) - self.calories(index, self.items[index])
+
+    def can_add(self, index: int, items: list[dict[str, Any]], food: dict[str, Any]) -> bool:
+        if any(item["foodName"] == food["foodName"] for item in items):
+            return True
+        quota = self.composition.get(self.slots[index][1], {}).get(food["foodCategory"], 0)
+        return sum(1 for item in items if item["foodCategory"] == food["foodCategory"]) < quota
+
+    def compatible_slots(self, index: int) -> list[int]:
+        breakfast = self.is_breakfast(index)
+        return [i for i in range(len(self.slots)) if i != index and self.is_breakfast(i) == breakfast]
+
+    @staticmethod
+    def with_grams(items: list[dict[str, Any]], food: dict[str, Any], grams: float) -> list[dict[str, Any]]:
+        """Copy of `items` with `grams` of `food` added (or removed, if negative)."""
+        result = []
+        found = False
+        for item in items:
+            if item["foodName"] == food["foodName"]:
+                found = True
+                item = dict(item, grams=item["grams"] + grams)
+                if item["grams"] < MIN_ITEM_GRAMS:
+                    continue
+            result.append(item)
+        if not found and grams >= MIN_ITEM_GRAMS:
+            result.append({"foodName": food["foodName"], "foodCategory": food["foodCategory"], "grams": grams})
+        return result
+
+    #== MOVES ==#
+    def top_up(self) -> Move | None:
+        """Add leftover grams of a food to a slot that is under its goal or missing a category."""
+        index = self.rng.randrange(len(self.slots))
+        breakfast = self.is_breakfast(index)
+        items = self.items[index]
+        choices = [self.foods[key] for key, grams in self.leftover.items()
+                   if key[1] == breakfast and grams >= MIN_ITEM_GRAMS
+                   and self.foods[key]["cal_per_gram"] > 0 and self.can_add(index, items, self.foods[key])]
+        if not choices:
+            return None
+        food = self.rng.choice(choices)
+        key = (food["foodName"], breakfast)
+        gap = self.gap(index)
+        wanted = gap / food["cal_per_gram"] if gap > 0 else self.rng.uniform(MIN_ITEM_GRAMS, 50.0)
+        grams = min(self.leftover[key], wanted)
+        return {index: self.with_grams(items, food, grams)}, {key: -grams}
+
+    def trim(self) -> Move | None:
+        """Give grams back to the pool from a slot that is over its goal."""
+        index = self.rng.randrange(len(self.slots))
+        items = self.items[index]
+        excess = -self.gap(index)
+        if excess <= 0 or not items:
+            return None
+        item = self.rng.choice(items)
+        key = (item["foodName"], self.is_breakfast(index))
+        food = self.foods.get(key)
+        if food is None or food["cal_per_gram"] <= 0:
+            return None
+        grams = min(item["grams"], excess / food["cal_per_gram"])
+        return {index: self.with_grams(items, food, -grams)}, {key: grams}
+
+    def shift(self) -> Move | None:
+        """Move grams of one food from one slot to another (possibly on another day)."""
+        source = self.rng.randrange(len(self.slots))
+        if not self.items[source]:
+            return None
+        target = self.rng.choice(self.compatible_slots(source) or [source])
+        if target == source:
+            return None
+        item = self.rng.choice(self.items[source])
+        food = self.foods.get((item["foodName"], self.is_breakfast(source)))
+        if food is None or food["cal_per_gram"] <= 0 or not self.can_add(target, self.items[target], food):
+            return None
+        gap = self.gap(target)
+        grams = min(item["grams"], gap / food["cal_per_gram"]) if gap > 0 else item["grams"]
+        return {
+            source: self.with_grams(self.items[source], food, -grams),
+            target: self.with_grams(self.items[target], food, grams),
+        }, {}
+
+    def swap(self) -> Move | None:
+        """Exchange two foods of the same category between two slots."""
+        first = self.rng.randrange(len(self.slots))
+        second = self.rng.choice(self.compatible_slots(first) or [first])
+        if first == second or not self.items[first] or not self.items[second]:
+            return None
+        a = self.rng.choice(self.items[first])
+        b = self.rng.choice(self.items[second])
+        if a["foodCategory"] != b["foodCategory"] or a["foodName"] == b["foodName"]:
+            return None
+        names_first = {item["foodName"] for item in self.items[first]}
+        names_second = {item["foodName"] for item in self.items[second]}
+        if b["foodName"] in names_first or a["foodName"] in names_second:
+            return None
+        return {
+            first: [b if item is a else item for item in self.items[first]],
+            second: [a if item is b else item for item in self.items[second]],
+        }, {}
+
+    def try_move(self, propose: Callable[[], Move | None]) -> bool:
+        move = propose()
+        if move is None:
+            return False
+        changed, pool_changes = move
+        new_costs = {index: self.cost(index, items) for index, items in changed.items()}
+        if sum(new_costs.values()) >= sum(self.costs[i] for i in changed) - 1e-6:
+            return False
+        for index, items in changed.items():
+            self.items[index] = items
+            self.costs[index] = new_costs[index]
+        for key, grams in pool_changes.items():
+            self.leftover[key] = max(0.0, self.leftover[key] + grams)
+        return True
+
+    def write_back(self, pool: list[dict[str, Any]]) -> None:
+        for index, (_, meal, slot) in enumerate(self.slots):
+            breakfast = meal == "Breakfast"
+            slot["items"] = []
+            for item in self.items[index]:
+                food = self.foods.get((item["foodName"], breakfast))
+                slot["items"].append({
+                    "foodName": item["foodName"],
+                    "foodCategory": item["foodCategory"],
+                    "grams": int(round(item["grams"])),
+                    # Items of foods not in the pool are never resized, so they keep their calories
+                    "calories": round(item["grams"] * food["cal_per_gram"], 1) if food else item.get("calories", 0),
+                })
+            slot["total_calories"] = round(sum(item["calories"] for item in slot["items"]), 1)
+        for food in pool:
+            food["remaining_grams"] = self.leftover[(food["foodName"], food["isBreakfast"])]
+            food["remaining_calories"] = food["remaining_grams"] * food["cal_per_gram"]
+
+
+def optimize_plan(
+    plan: dict[str, Any],
+    pool: list[dict[str, Any]],
+    composition: dict[str, dict[str, int]],
+    budget_ms: float,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """
+    Improve a greedy plan in place for at most `budget_ms` milliseconds.
+    `pool` must be the pool the plan was built from (its remaining_grams are
+    the leftovers the search may use) and is updated to match the new plan.
+    Returns statistics about the run.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+    error_before = plan_error(plan)
+    if not plan or budget_ms <= 0:
+        return {"error_before": error_before, "error_after": error_before,
+                "proposals": 0, "accepted": 0, "elapsed_ms": 0.0}
+
+    search = _Search(plan, pool, composition, random.Random(seed))
+    moves = (search.top_up, search.trim, search.shift, search.swap)
+    proposals = accepted = idle = 0
+    while idle < MAX_IDLE_PROPOSALS and time.perf_counter() < deadline:
+        proposals += 1
+        if search.try_move(search.rng.choice(moves)):
+            accepted += 1
+            idle = 0
+        else:
+            idle += 1
+    search.write_back(pool)
+
+    return {
+        "error_before": error_before,
+        "error_after": plan_error(plan),
+        "proposals": proposals,
+        "accepted": accepted,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,97 @@
+from __future__ import annotations
+from typing import Any
+
+'''
+This module encodes meal plans for storage in weeklymeals. A plan stored in format 2 keeps a food table once per document ("foods": [[name, category], ...]) and every selected item becomes a short list [food index, grams, calories, protein, carbs, fiber, sugar, fat] instead of a dict repeating the food's name and category in all 21 meal slots. Meals keep their dict shape (items, total_calories, calorie_goal, nutrients) so projections such as "plan.Tuesday.Lunch.nutrients" still work.
+
+Documents written before format 2 have no "plan_format" field and are returned unchanged by the decoder, so they stay readable until the next plan build rewrites them.
+'''
+
+PLAN_FORMAT = 2
+
+# Order of the nutrient values after [index, grams, calories] in an encoded item
+ITEM_NUTRIENTS = ("protein", "carbs", "fiber", "sugar", "fat")
+
+# Fields a projection needs alongside any part of the plan to decode it
+CODEC_FIELDS = ("plan_format", "foods")
+
+
+class FoodTable:
+    """A plan's food table: (name, category) pairs, each stored once."""
+    def __init__(self, foods: list[list[str]] | None = None):
+        self.foods: list[list[str]] = [list(food) for food in foods or []]
+        self._index = {(name, category): i for i, (name, category) in enumerate(self.foods)}
+        self.grown = False
+
+    def index(self, name: str, category: str) -> int:
+        key = (name, category)
+        if key not in self._index:
+            self._index[key] = len(self.foods)
+            self.foods.append([name, category])
+            self.grown = True
+        return self._index[key]
+
+
+def encode_item(item: dict[str, Any], table: FoodTable) -> list[Any]:
+    encoded = [table.index(item["foodName"], item["foodCategory"]), item["grams"], item["calories"]]
+    nutrients = item.get("nutrients")
+    if nutrients:
+        encoded.extend(nutrients.get(nutrient, 0.0) for nutrient in ITEM_NUTRIENTS)
+    return encoded
+
+
+def decode_item(item: list[Any], foods: list[list[str]]) -> dict[str, Any]:
+    name, category = foods[item[0]]
+    decoded = {"foodName": name, "foodCategory": category, "grams": item[1], "calories": item[2]}
+    if len(item) > 3:
+        decoded["nutrients"] = dict(zip(ITEM_NUTRIENTS, item[3:]))
+    return decoded
+
+
+def encode_meal(meal: dict[str, Any], table: FoodTable) -> dict[str, Any]:
+    if "items" not in meal:
+        return meal
+    return {**meal, "items": [encode_item(item, table) for item in meal["items"]]}
+
+
+def decode_meal(meal: dict[str, Any], foods: list[list[str]]) -> dict[str, Any]:
+    # A projection may have left out the items (e.g. "plan.Monday.Lunch.nutrients")
+    if "items" not in meal:
+        return meal
+    return {**meal, "items": [decode_item(item, foods) for item in meal["items"]]}
+
+
+def encode_day(day_plan: dict[str, Any], table: FoodTable) -> dict[str, Any]:
+    return {meal: encode_meal(data, table) for meal, data in day_plan.items()}
+
+
+def decode_day(day_plan: dict[str, Any], foods: list[list[str]]) -> dict[str, Any]:
+    return {meal: decode_meal(data, foods) for meal, data in day_plan.items()}
+
+
+def encode_plan(plan: dict[str, Any], table: FoodTable | None = None) -> tuple[dict[str, Any], FoodTable]:
+    """Encode a whole plan, adding its foods to `table` (a new one by default)."""
+    table = table or FoodTable()
+    return {day: encode_day(day_plan, table) for day, day_plan in plan.items()}, table
+
+
+def encode_slice(path: str, value: Any, table: FoodTable) -> Any:
+    """Encode the part of a plan stored at `path`: a day ("Tuesday") or a meal ("Tuesday.Lunch")."""
+    if "." in path:
+        return encode_meal(value, table)
+    return encode_day(value, table)
+
+
+def decode_doc(doc: dict[str, Any] | None) -> dict[str, Any] | None:
+    """
+    Return a weeklymeals document with its plan (or the projected part of it)
+    in the dict-per-item shape the routes use. Old-format documents are
+    returned as they are; the stored document is never modified.
+    """
+    if not doc or doc.get("plan_format") != PLAN_FORMAT:
+        return doc
+    decoded = {key: value for key, value in doc.items() if key not in CODEC_FIELDS}
+    if "plan" in doc:
+        foods = doc.get("foods", [])
+        decoded["plan"] = {day: decode_day(day_plan, foods) for day, day_plan in doc["plan"].items()}
+    return decoded
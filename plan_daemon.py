@@ -0,0 +1,205 @@
+from __future__ import annotations
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from algorithm import food_db, build_meal_plan, current_week_start, ensure_plan_indexes
+from rebuild_lease import run_with_lease
+
+'''
+This module is a standalone daemon (python plan_daemon.py) that keeps weeklymeals in step with current_list however the list is written: routes, the labeler, imports or scripts. It follows a Mongo change stream on current_list and list_versions (for planner settings) and rebuilds the plans of the users whose lists changed, collecting changes for PLAN_DAEMON_BATCH_MS so a burst of writes costs one rebuild per user. The resume token is saved in daemon_state so a restart picks up where it left off.
+
+A standalone mongod has no change streams; the daemon then polls list_versions every PLAN_DAEMON_POLL_SECONDS instead, reading only the documents whose indexed changed_at moved since the last poll and rebuilding the users whose input_version or settings_version changed. Every list write in the app (routes, the labeler, imports) bumps those versions; scripts that write current_list directly are only seen through change streams. At the start of each week every user with a list gets a plan for the new week.
+
+Run the web app with PLAN_REBUILDS=daemon to take rebuilds off the request path entirely.
+'''
+
+BATCH_MS = int(os.getenv("PLAN_DAEMON_BATCH_MS", "500"))
+POLL_SECONDS = float(os.getenv("PLAN_DAEMON_POLL_SECONDS", "2"))
+WORKERS = int(os.getenv("PLAN_DAEMON_WORKERS", "2"))
+# auto = change streams when the server has them, polling otherwise
+MODE = os.getenv("PLAN_DAEMON_MODE", "auto")
+STATE_ID = "plan_daemon"
+# Updates that only hand grams back to the list after a plan edit (apply_gram_changes)
+PLAN_EDIT_FIELDS = {"grams", "grams_restored_at"}
+CHANGE_STREAM_HISTORY_LOST = 286
+# Polls look this far behind the newest changed_at seen, for writes that committed out of order
+POLL_OVERLAP = timedelta(seconds=5)
+
+
+class PlanRebuilder:
+    """Collects users whose plans are out of date and rebuilds them in batches."""
+    def __init__(self, workers: int):
+        self.dirty: set[str] = set()
+        self.first_dirty_at: float | None = None
+        self.owners: dict[Any, str] = {}
+        self.week = current_week_start()
+        self.rebuilt = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan-rebuild")
+
+    def load_owners(self) -> None:
+        """Remember who owns each list item, since delete events only carry the _id."""
+        self.owners = {doc["_id"]: doc["username"]
+                       for doc in food_db.current_list.find({}, {"username": 1}) if doc.get("username")}
+
+    def mark(self, username: str | None) -> None:
+        if not username:
+            return
+        if not self.dirty:
+            self.first_dirty_at = time.monotonic()
+        self.dirty.add(username)
+
+    def mark_everyone(self) -> None:
+        for username in food_db.current_list.distinct("username"):
+            self.mark(username)
+
+    def due(self) -> bool:
+        return bool(self.dirty) and (time.monotonic() - self.first_dirty_at) * 1000 >= BATCH_MS
+
+    def check_week(self) -> None:
+        """Every user with a list needs a plan for a week that just started."""
+        week = current_week_start()
+        if week != self.week:
+            self.week = week
+            self.mark_everyone()
+
+    def flush(self) -> int:
+        users, self.dirty = sorted(self.dirty), set()
+        list(self._executor.map(self._rebuild, users))
+        self.rebuilt += len(users)
+        print(f"Rebuilt plans for {len(users)} users: {users}")
+        return len(users)
+
+    def _rebuild(self, username: str) -> None:
+        try:
+            # A web worker holding the lease rebuilds again for us
+            run_with_lease(food_db, username, lambda: build_meal_plan(username))
+        except PyMongoError as e:
+            print(f"Could not rebuild the plan for {username}: {e}")
+            # Try again with the next batch
+            self.mark(username)
+
+    def handle_change(self, change: dict[str, Any]) -> None:
+        """Mark the user a change stream event belongs to, if it affects their plan."""
+        operation = change["operationType"]
+        fields: set[str] = set()
+        if operation == "update":
+            description = change.get("updateDescription", {})
+            fields = set(description.get("updatedFields", {})) | set(description.get("removedFields", []))
+        document = change.get("fullDocument") or {}
+
+        if change["ns"]["coll"] == "list_versions":
+            # Only planner settings matter here; list edits show up on current_list itself
+            if "settings_version" in fields or (operation == "insert" and "settings_version" in document):
+                self.mark(document.get("username"))
+            return
+
+        key = change.get("documentKey", {}).get("_id")
+        if operation == "delete":
+            self.mark(self.owners.pop(key, None))
+            return
+        username = document.get("username") or self.owners.get(key)
+        if username:
+            self.owners[key] = username
+        if operation == "update" and "grams_restored_at" in fields and fields <= PLAN_EDIT_FIELDS:
+            return
+        self.mark(username)
+
+
+def _save_resume_token(token: Any) -> None:
+    food_db.daemon_state.update_one({"_id": STATE_ID}, {"$set": {"resume_token": token}}, upsert=True)
+
+
+def follow_change_stream(rebuilder: PlanRebuilder) -> None:
+    """Rebuild plans from a change stream (raises OperationFailure if the server has none)."""
+    state = food_db.daemon_state.find_one({"_id": STATE_ID}) or {}
+    resume_token = state.get("resume_token")
+    if resume_token is None:
+        # Nothing to resume from, so anything could have changed while we were away
+        rebuilder.mark_everyone()
+    pipeline = [{"$match": {"ns.coll": {"$in": ["current_list", "list_versions"]}}}]
+    try:
+        stream = food_db.watch(pipeline, full_document="updateLookup",
+                               resume_after=resume_token, max_await_time_ms=BATCH_MS)
+    except OperationFailure as e:
+        if e.code != CHANGE_STREAM_HISTORY_LOST or resume_token is None:
+            raise
+        print("Resume point is no longer in the oplog; rebuilding every plan")
+        food_db.daemon_state.delete_one({"_id": STATE_ID})
+        return follow_change_stream(rebuilder)
+
+    print("Following current_list through a change stream")
+    saved = resume_token
+    with stream:
+        while True:
+            change = stream.try_next()
+            if change is not None:
+                rebuilder.handle_change(change)
+            else:
+                rebuilder.check_week()
+            if rebuilder.due():
+                rebuilder.flush()
+            if not rebuilder.dirty and stream.resume_token != saved:
+                saved = stream.resume_token
+                _save_resume_token(saved)
+
+
+def changed_versions(since: datetime | None) -> tuple[dict[str, tuple[int, int]], datetime | None]:
+    """
+    The (input_version, settings_version) of every user whose list_versions
+    document changed since `since` (everyone when None), read through the
+    changed_at index, and the newest changed_at seen.
+    """
+    query = {} if since is None else {"changed_at": {"$gte": since - POLL_OVERLAP}}
+    versions: dict[str, tuple[int, int]] = {}
+    newest = since
+    for doc in food_db.list_versions.find(
+            query, {"username": 1, "input_version": 1, "settings_version": 1, "changed_at": 1}):
+        versions[doc["username"]] = (doc.get("input_version", 0), doc.get("settings_version", 0))
+        changed_at = doc.get("changed_at")
+        if changed_at is not None and (newest is None or changed_at > newest):
+            newest = changed_at
+    return versions, newest
+
+
+def poll(rebuilder: PlanRebuilder, rounds: int | None = None) -> None:
+    """Rebuild plans by polling list_versions every POLL_SECONDS (for `rounds` rounds, or forever)."""
+    print(f"Polling list_versions every {POLL_SECONDS}s")
+    rebuilder.mark_everyone()
+    known, since = changed_versions(None)
+    while rounds is None or rounds > 0:
+        if rebuilder.dirty:
+            rebuilder.flush()
+        time.sleep(POLL_SECONDS)
+        changed, since = changed_versions(since)
+        for username, versions in changed.items():
+            if known.get(username) != versions:
+                known[username] = versions
+                rebuilder.mark(username)
+        rebuilder.check_week()
+        if rounds is not None:
+            rounds -= 1
+    if rebuilder.dirty:
+        rebuilder.flush()
+
+
+if __name__ == "__main__":
+    if MODE not in ("auto", "stream", "poll"):
+        print("PLAN_DAEMON_MODE must be auto, stream or poll")
+        sys.exit(1)
+    ensure_plan_indexes()
+    rebuilder = PlanRebuilder(WORKERS)
+    if MODE != "poll":
+        rebuilder.load_owners()
+        try:
+            follow_change_stream(rebuilder)
+        except OperationFailure as e:
+            if MODE == "stream":
+                raise
+            print(f"Change streams are not available ({e})")
+    poll(rebuilder)
@@ -0,0 +1,166 @@
+from __future__ import annotations
+import json
+import os
+import queue
+import threading
+from typing import Any
+
+from flask import g, has_app_context, request
+
+from plan_codec import ITEM_NUTRIENTS
+
+'''
+This module pushes plan changes to the pages a user has open. Plan writes publish a diff (the days and meals that changed, with their new items and totals) to an in-process pub/sub, and /api/v1/plan/events relays it to the browser as Server-Sent Events, so the week and day pages patch the changed meals in place instead of reloading.
+
+Mutating routes asked for JSON answer with the same diff instead of redirecting to a full page render: capture_diffs() keeps the diffs published while the request runs and captured_diff() merges them for the response.
+
+Subscribers only hear about writes made by the same process. Streams also compare the plan's updated_at every PLAN_EVENTS_KEEPALIVE_SECONDS, and tell the page to reload when another worker or plan_daemon.py changed the plan.
+
+Every open stream holds a server thread (or greenlet) for as long as it stays open. A stream that has sent no changes for PLAN_EVENTS_IDLE_SECONDS is closed, and so is a user's oldest stream once they open more than PLAN_EVENTS_MAX_STREAMS. The page is sent a "close" event first, so it stops listening and reloads the next time it is shown instead of reconnecting right away.
+'''
+
+MEALS = ("Breakfast", "Lunch", "Dinner")
+KEEPALIVE_SECONDS = float(os.getenv("PLAN_EVENTS_KEEPALIVE_SECONDS", "15"))
+# Events held for a page that is not reading them; past this the page is told to reload
+MAX_QUEUED_EVENTS = 20
+# Streams without a plan change for this long are closed
+IDLE_SECONDS = float(os.getenv("PLAN_EVENTS_IDLE_SECONDS", "600"))
+# Open streams per user (in this process); opening another closes the oldest
+MAX_STREAMS_PER_USER = int(os.getenv("PLAN_EVENTS_MAX_STREAMS", "4"))
+
+
+class PlanEvents:
+    """Per-user subscriber queues for plan diffs."""
+    def __init__(self):
+        # Each user's queues in the order they subscribed
+        self._subscribers: dict[str, dict[queue.Queue, None]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.evicted = 0
+
+    def subscribe(self, username: str) -> queue.Queue:
+        """A queue for a new stream. Past MAX_STREAMS_PER_USER the user's oldest stream is told to close."""
+        events: queue.Queue = queue.Queue(MAX_QUEUED_EVENTS)
+        with self._lock:
+            subscribers = self._subscribers.setdefault(username, {})
+            subscribers[events] = None
+            oldest = [q for q in subscribers if q is not events][:max(0, len(subscribers) - MAX_STREAMS_PER_USER)]
+            for old in oldest:
+                del subscribers[old]
+        for old in oldest:
+            _send(old, {"close": True})
+            self.evicted += 1
+        return events
+
+    def unsubscribe(self, username: str, events: queue.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(username)
+            if subscribers is not None:
+                subscribers.pop(events, None)
+                if not subscribers:
+                    del self._subscribers[username]
+
+    def has_subscribers(self, username: str) -> bool:
+        return username in self._subscribers
+
+    def wants_diff(self, username: str) -> bool:
+        """True if a plan write for the user should work out what changed."""
+        return self.has_subscribers(username) or (has_app_context() and g.get("plan_diffs") is not None)
+
+    def publish(self, username: str, diff: dict[str, Any]) -> None:
+        """Send a plan diff to every open page of the user (nothing is sent for an empty diff)."""
+        if not diff["days"]:
+            return
+        if has_app_context() and g.get("plan_diffs") is not None:
+            g.plan_diffs.append(diff)
+        with self._lock:
+            subscribers = list(self._subscribers.get(username, ()))
+        for events in subscribers:
+            # A page that fell behind gets one reload, which replaces everything it missed
+            _send(events, diff, {"reload": True})
+        self.published += 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"users": len(self._subscribers),
+                    "streams": sum(len(s) for s in self._subscribers.values()),
+                    "published": self.published,
+                    "evicted": self.evicted}
+
+
+def _send(events: queue.Queue, message: dict[str, Any], when_full: dict[str, Any] | None = None) -> None:
+    """Queue a message; if the queue is full, replace its contents with `when_full` (or the message)."""
+    try:
+        events.put_nowait(message)
+    except queue.Full:
+        _drain(events)
+        events.put_nowait(when_full or message)
+
+
+def _drain(events: queue.Queue) -> None:
+    while True:
+        try:
+            events.get_nowait()
+        except queue.Empty:
+            return
+
+
+plan_events = PlanEvents()
+
+
+def _meal_view(meal: dict[str, Any]) -> dict[str, Any]:
+    items = [{"name": item["foodName"], "grams": item["grams"], "calories": item["calories"]}
+             for item in meal.get("items", [])]
+    return {"items": items, "calories": sum(item["calories"] for item in items)}
+
+
+def day_totals(day_plan: dict[str, Any]) -> dict[str, Any]:
+    """A day's calories and nutrient totals, as the day page shows them."""
+    meals = [day_plan.get(meal, {}) for meal in MEALS]
+    return {
+        "calories": sum(item["calories"] for meal in meals for item in meal.get("items", [])),
+        "nutrients": {n: round(sum(meal.get("nutrients", {}).get(n, 0.0) for meal in meals), 1)
+                      for n in ITEM_NUTRIENTS},
+    }
+
+
+def plan_diff(old: dict[str, Any], new: dict[str, Any], days: list[str] | None = None) -> dict[str, Any]:
+    """
+    The meals of decoded plan `new` that differ from `old` (only `days` are
+    compared when given): {"days": {day: {"meals": {meal: {items, calories}},
+    "calories": ..., "nutrients": {...}}}}. Changed days carry their new totals.
+    """
+    changed: dict[str, Any] = {}
+    for day in days or list(dict.fromkeys([*new, *old])):
+        old_day, new_day = old.get(day, {}), new.get(day, {})
+        meals = {meal: _meal_view(new_day.get(meal, {})) for meal in MEALS
+                 if old_day.get(meal, {}).get("items", []) != new_day.get(meal, {}).get("items", [])}
+        if meals:
+            changed[day] = {"meals": meals, **day_totals(new_day)}
+    return {"days": changed}
+
+
+def sse(event: str, data: Any) -> str:
+    """One Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def wants_json() -> bool:
+    """True for API-style requests: a JSON body, ?format=json or Accept: application/json."""
+    return (request.is_json or request.args.get("format") == "json"
+            or request.accept_mimetypes.best == "application/json")
+
+
+def capture_diffs() -> None:
+    """Keep the plan diffs published during this request for its response."""
+    g.plan_diffs = []
+
+
+def captured_diff() -> dict[str, Any]:
+    """Everything the request changed in the plan, as one diff (later writes win)."""
+    days: dict[str, Any] = {}
+    for diff in g.get("plan_diffs") or []:
+        for day, changed in diff["days"].items():
+            meals = {**days.get(day, {}).get("meals", {}), **changed["meals"]}
+            days[day] = {**changed, "meals": meals}
+    return {"days": days}
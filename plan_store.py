@@ -0,0 +1,353 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any
+
+from bson.objectid import ObjectId
+from pymongo.errors import ExecutionTimeout, PyMongoError
+
+from algorithm import DAYS, NUTRIENTS, food_db, sum_nutrients, plan_filter
+from caching import page_cache
+from plan_codec import CODEC_FIELDS, PLAN_FORMAT, FoodTable, decode_doc, encode_plan, encode_slice
+from plan_events import plan_events, plan_diff
+
+'''
+This module holds the read/write helpers for the weeklymeals collection. Routes that only need one day or one meal ask Mongo for that slice with a projection (e.g. "plan.Tuesday") instead of loading the whole weekly plan document. Plans are stored in the compact format of plan_codec.py and decoded here, so routes only ever see plain item dicts.
+
+Reads go through a latency budget: each read asks Mongo to give up after PLAN_READ_BUDGET_MS (maxTimeMS), and if it does, the last full plan we read for the user is served (flagged as stale) while a background read refreshes it. Background refreshes run on a small pool and are skipped rather than queued once PLAN_REFRESH_WORKERS are in flight. A circuit breaker stops sending reads to a database that keeps timing out or failing; while it is open, users we have no copy for get PlanUnavailable instead of an empty plan.
+'''
+
+MEALS: list[str] = ["Breakfast", "Lunch", "Dinner"]
+
+PLAN_READ_BUDGET_MS = float(os.getenv("PLAN_READ_BUDGET_MS", "250"))
+LAST_KNOWN_MAX_USERS = int(os.getenv("PLAN_LAST_KNOWN_MAX_USERS", "1000"))
+REFRESH_WORKERS = int(os.getenv("PLAN_REFRESH_WORKERS", "2"))
+
+
+class PlanUnavailable(PyMongoError):
+    """Plans can't be read right now and there is no last known plan to serve."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_seconds`; after that a single probe call is let through, which
+    closes the breaker on success or re-opens it on failure.
+    """
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+
+plan_breaker = CircuitBreaker(
+    int(os.getenv("PLAN_BREAKER_FAILURES", "5")),
+    float(os.getenv("PLAN_BREAKER_RESET_SECONDS", "10")),
+)
+_refresh_pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="plan-refresh")
+_last_known: OrderedDict[str, dict[str, Any]] = OrderedDict()
+_last_known_lock = threading.Lock()
+_refreshing: set[str] = set()
+_refreshing_lock = threading.Lock()
+_read_state = threading.local()
+
+
+def read_was_stale() -> bool:
+    """True if the last plan read on this thread was served from the last known plan."""
+    return getattr(_read_state, "stale", False)
+
+
+def _remember(username: str, doc: dict[str, Any]) -> None:
+    with _last_known_lock:
+        _last_known[username] = doc
+        _last_known.move_to_end(username)
+        while len(_last_known) > LAST_KNOWN_MAX_USERS:
+            _last_known.popitem(last=False)
+
+
+def _forget(username: str) -> None:
+    with _last_known_lock:
+        _last_known.pop(username, None)
+
+
+def _refresh(username: str) -> None:
+    try:
+        doc = food_db.weeklymeals.find_one(
+            plan_filter(username), {"plan": 1, "plan_format": 1, "foods": 1, "updated_at": 1})
+        plan_breaker.record_success()
+        if doc:
+            _remember(username, doc)
+    except PyMongoError:
+        plan_breaker.record_failure()
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(username)
+
+
+def _refresh_in_background(username: str) -> None:
+    """
+    Reload a user's full plan off the request path: at most one at a time per
+    user, and none while REFRESH_WORKERS are already busy, so nothing queues up.
+    """
+    with _refreshing_lock:
+        if username in _refreshing or len(_refreshing) >= REFRESH_WORKERS or not plan_breaker.allow():
+            return
+        _refreshing.add(username)
+    _refresh_pool.submit(_refresh, username)
+
+
+def _project(doc: dict[str, Any], fields: list[str] | None) -> dict[str, Any]:
+    """Apply a find() style projection to a cached document."""
+    if fields is None:
+        return doc
+    result: dict[str, Any] = {"_id": doc.get("_id")}
+    for field in fields:
+        source, target = doc, result
+        parts = field.split(".")
+        for part in parts[:-1]:
+            if not isinstance(source, dict) or part not in source:
+                break
+            source = source[part]
+            target = target.setdefault(part, {})
+        else:
+            if isinstance(source, dict) and parts[-1] in source:
+                target[parts[-1]] = source[parts[-1]]
+    return result
+
+
+def _have_copy(username: str) -> bool:
+    with _last_known_lock:
+        return username in _last_known
+
+
+def _serve_last_known(username: str, fields: list[str] | None) -> dict[str, Any]:
+    with _last_known_lock:
+        doc = _last_known.get(username)
+    if doc is None:
+        raise PlanUnavailable("Meal plans can't be loaded right now, please try again in a moment")
+    _read_state.stale = True
+    return _project(doc, fields)
+
+
+def day_key(weekday: str) -> str | None:
+    """Map a weekday from a URL ("tuesday") to its plan key ("Tuesday")."""
+    key = weekday.title()
+    return key if key in DAYS else None
+
+
+def meal_key(meal: str) -> str | None:
+    """Map a meal from a URL ("lunch") to its plan key ("Lunch")."""
+    key = meal.title()
+    return key if key in MEALS else None
+
+
+def find_weekly_doc(
+    username: str, fields: list[str] | None = None, allow_stale: bool = True
+) -> dict[str, Any] | None:
+    """
+    Fetch a user's weeklymeals document, limited to `fields` when given.
+    Falls back to the last known plan (see read_was_stale) when Mongo is slow
+    or the circuit breaker is open, unless allow_stale is False (reads that
+    are about to be written back must see the real document). Raises
+    PlanUnavailable if the breaker is open and there is no plan to fall back on.
+    Plans stored in the compact format are decoded (see plan_codec.py).
+    """
+    if fields is not None and any(field.split(".")[0] == "plan" for field in fields):
+        fields = fields + list(CODEC_FIELDS)
+    return decode_doc(_read_weekly_doc(username, fields, allow_stale))
+
+
+def _read_weekly_doc(
+    username: str, fields: list[str] | None, allow_stale: bool
+) -> dict[str, Any] | None:
+    _read_state.stale = False
+    projection = None
+    if fields is not None:
+        projection = {field: 1 for field in fields}
+        projection["updated_at"] = 1
+    if not allow_stale:
+        return food_db.weeklymeals.find_one(plan_filter(username), projection)
+    if not plan_breaker.allow():
+        return _serve_last_known(username, fields)
+
+    try:
+        doc = food_db.weeklymeals.find_one(
+            plan_filter(username), projection, max_time_ms=max(1, int(PLAN_READ_BUDGET_MS)))
+    except ExecutionTimeout:
+        plan_breaker.record_failure()
+        _refresh_in_background(username)
+        if _have_copy(username):
+            return _serve_last_known(username, fields)
+        # Nothing to fall back on yet, so wait for the database after all
+        doc = food_db.weeklymeals.find_one(plan_filter(username), projection)
+    except PyMongoError:
+        plan_breaker.record_failure()
+        if not _have_copy(username):
+            raise
+        return _serve_last_known(username, fields)
+    plan_breaker.record_success()
+
+    if doc is None:
+        _forget(username)
+    elif fields is None or "plan" in fields:
+        # Only full plan reads update the last known plan; day and stamp reads stay one small read
+        _remember(username, doc)
+    return doc
+
+
+def plan_stamp(username: str) -> datetime | None:
+    """Fetch only the plan's updated_at, the version stamp used for ETags."""
+    doc = find_weekly_doc(username, ["updated_at"])
+    return doc.get("updated_at") if doc else None
+
+
+def find_week_doc(username: str, week_start: datetime) -> dict[str, Any] | None:
+    """Fetch the plan of a past week. Past weeks are never written, so there is no stale fallback."""
+    return decode_doc(food_db.weeklymeals.find_one(
+        plan_filter(username, week_start), {"plan": 1, "plan_format": 1, "foods": 1, "updated_at": 1}))
+
+
+def adjacent_weeks(
+    username: str, week_start: datetime
+) -> tuple[datetime | None, datetime | None]:
+    """
+    The week_start of the user's nearest stored plans before and after
+    `week_start`, each found with a single seek on the (username, week_start) index.
+    """
+    earlier = food_db.weeklymeals.find_one(
+        {"username": username, "week_start": {"$lt": week_start}}, {"week_start": 1},
+        sort=[("week_start", -1)])
+    later = food_db.weeklymeals.find_one(
+        {"username": username, "week_start": {"$gt": week_start}}, {"week_start": 1},
+        sort=[("week_start", 1)])
+    return (earlier or {}).get("week_start"), (later or {}).get("week_start")
+
+
+def find_day_plan(
+    username: str, day: str, allow_stale: bool = True
+) -> dict[str, Any] | None:
+    """Fetch one day of a user's plan, or None if the user has no plan."""
+    doc = find_weekly_doc(username, [f"plan.{day}"], allow_stale)
+    if not doc or "plan" not in doc:
+        return None
+    return doc["plan"].get(day, {})
+
+
+def find_meal_plan(
+    username: str, day: str, meal: str, allow_stale: bool = True
+) -> dict[str, Any] | None:
+    """Fetch one meal of a user's plan, or None if the user has no plan."""
+    doc = find_weekly_doc(username, [f"plan.{day}.{meal}"], allow_stale)
+    if not doc or "plan" not in doc:
+        return None
+    return doc["plan"].get(day, {}).get(meal, {})
+
+
+def set_plan_slice(
+    username: str, path: str, value: Any, removed_nutrients: dict[str, float] | None = None
+) -> None:
+    """
+    Overwrite a single day or meal of a user's plan, e.g. path="Tuesday.Lunch".
+    `removed_nutrients` (what the old slice held beyond the new one) is taken
+    off the stored weekly nutrient totals in the same write.
+    """
+    day = path.split(".")[0]
+    projection = {"plan_format": 1, "foods": 1}
+    if plan_events.wants_diff(username):
+        projection[f"plan.{day}"] = 1
+    stored = food_db.weeklymeals.find_one(plan_filter(username), projection) or {}
+    update: dict[str, Any] = {"$set": {"updated_at": datetime.now(timezone.utc), "rollups_stale": ObjectId()}}
+    if stored.get("plan_format") == PLAN_FORMAT:
+        table = FoodTable(stored.get("foods"))
+        update["$set"][f"plan.{path}"] = encode_slice(path, value, table)
+        if table.grown:
+            update["$set"]["foods"] = table.foods
+    else:
+        # Old-format plans keep their format until the next full write
+        update["$set"][f"plan.{path}"] = value
+    if removed_nutrients:
+        update["$inc"] = {f"nutrition_week.{n}": -removed_nutrients.get(n, 0.0) for n in NUTRIENTS}
+    food_db.weeklymeals.update_one(plan_filter(username), update)
+    if "plan" in stored:
+        old_day = decode_doc(stored)["plan"].get(day, {})
+        new_day = {**old_day, path.split(".")[1]: value} if "." in path else value
+        plan_events.publish(username, plan_diff({day: old_day}, {day: new_day}))
+    page_cache.invalidate(username)
+
+
+def set_plan(username: str, plan: dict[str, Any], previous: dict[str, Any] | None = None) -> None:
+    """
+    Overwrite a user's whole plan (e.g. after swapping days). `previous`, the
+    plan being replaced, lets open pages be sent what changed.
+    """
+    encoded, table = encode_plan(plan)
+    food_db.weeklymeals.update_one(
+        plan_filter(username),
+        {"$set": {
+            "plan": encoded,
+            "plan_format": PLAN_FORMAT,
+            "foods": table.foods,
+            "updated_at": datetime.now(timezone.utc),
+            "rollups_stale": ObjectId(),
+        }},
+    )
+    if previous is not None:
+        plan_events.publish(username, plan_diff(previous, plan))
+    page_cache.invalidate(username)
+
+
+def day_nutrients(day_plan: dict[str, Any]) -> dict[str, float]:
+    """A day's nutrient totals, from the per-meal totals stored with the plan."""
+    return sum_nutrients([day_plan.get(meal, {}).get("nutrients", {}) for meal in MEALS])
+
+
+def meals_for_day(
+    day_plan: dict[str, Any], weekday: str, username: str
+) -> dict[str, list[dict[str, Any]]]:
+    """Turn one day of the plan into the per-meal food dicts the templates use."""
+    meals: dict[str, list[dict[str, Any]]] = {}
+    for meal in MEALS:
+        meals[meal.lower()] = [{
+            'name': item['foodName'],
+            'food_type': item['foodCategory'],
+            'food_amount': item['grams'],
+            'calorie_amount': item['calories'],
+            'weekday': weekday.lower(),
+            'time_in_day': meal.lower(),
+            'username': username,
+            'is_generated': True
+        } for item in day_plan.get(meal, {}).get('items', [])]
+    return meals
@@ -0,0 +1,244 @@
+from __future__ import annotations
+from typing import Any, Callable
+
+from optimizer import optimize_plan
+from planner_config import PlannerConfig, compile_config
+
+'''
+This module is the meal planner itself: the default planner settings and the greedy pass that fills each day's meal slots from a grocery pool (plus the optional local search of optimizer.py). It works on plain pool dicts and never touches Mongo or the app, so it can also run in the what-if worker processes (what_if_worker.py); algorithm.py builds the pools and stores the plans.
+'''
+
+DAYS: list[str] = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+CALORIE_GOALS: dict[str, float] = {
+    "Breakfast": 450,
+    "Lunch": 650,
+    "Dinner": 650,
+}
+
+MEAL_COMPOSITION: dict[str, dict[str, int]] = {
+    "Breakfast": {
+        "Fruit": 1,
+        "Dairy": 1,
+        "Protein": 1,
+    },
+    "Lunch": {
+        "Protein": 1,
+        "Vegetable": 2,
+        "Grain": 1,
+        "Fruit": 1,
+        "Dairy": 1,
+    },
+    "Dinner": {
+        "Protein": 1,
+        "Vegetable": 2,
+        "Grain": 1,
+        "Fruit": 1,
+        "Dairy": 1,
+    },
+}
+
+MEAL_CALORIE_SPLITS: dict[str, dict[str, float]] = {
+    "Breakfast": {
+        "Protein": 0.35,
+        "Dairy": 0.40,
+        "Fruit": 0.25,
+    },
+    "Lunch": {
+        "Protein": 0.35,
+        "Vegetable": 0.30,
+        "Grain": 0.25,
+        "Fruit": 0.05,
+        "Dairy": 0.05,
+    },
+    "Dinner": {
+        "Protein": 0.35,
+        "Vegetable": 0.30,
+        "Grain": 0.25,
+        "Fruit": 0.05,
+        "Dairy": 0.05,
+    },
+}
+
+DEFAULT_PLANNER_CONFIG = compile_config(CALORIE_GOALS, MEAL_COMPOSITION, MEAL_CALORIE_SPLITS)
+
+
+def index_pool(
+    pool: list[dict[str, Any]], config: PlannerConfig
+) -> dict[tuple[int, bool], list[dict[str, Any]]]:
+    """Group pool entries by (category code, breakfast flag), keeping pool order."""
+    buckets: dict[tuple[int, bool], list[dict[str, Any]]] = {}
+    for food in pool:
+        code = config.category_codes.get(food["foodCategory"])
+        if code is not None:
+            buckets.setdefault((code, food["isBreakfast"]), []).append(food)
+    return buckets
+
+
+def fill_meal_slot(
+    pool: list[dict[str, Any]],
+    meal_name: str,
+    calorie_goal: float,
+    used_protein_today: set[str],
+    config: PlannerConfig | None = None,
+    buckets: dict[tuple[int, bool], list[dict[str, Any]]] | None = None,
+) -> tuple[list[dict[str, Any]], float, list[str]]:
+    is_breakfast = meal_name == "Breakfast"
+    config = config or DEFAULT_PLANNER_CONFIG
+    if buckets is None:
+        buckets = index_pool(pool, config)
+    precomputed = calorie_goal == config.calorie_goals[meal_name]
+    splits = config.meal_calorie_splits[meal_name]
+
+    selected: list[dict[str, Any]] = []
+    total_used = 0.0
+    missing_categories: list[str] = []
+
+    for code, category, quota, budget in config.slots[meal_name]:
+        if not precomputed:
+            budget = calorie_goal * splits[category]
+        items_used = 0
+
+        candidates = [
+            f for f in buckets.get((code, is_breakfast), ())
+            if f["remaining_grams"] > 0
+            and f["cal_per_gram"] > 0
+        ]
+
+        if not candidates:
+            missing_categories.append(category)
+            continue
+
+        candidates.sort(key=lambda f: f["remaining_grams"], reverse=True)
+
+        for food in candidates:
+            if budget <= 0 or items_used >= quota:
+                break
+
+            max_grams_by_calories = budget / food["cal_per_gram"]
+            grams_used = min(food["remaining_grams"], max_grams_by_calories)
+
+            if grams_used < 0.1:
+                continue
+
+            calories_used = grams_used * food["cal_per_gram"]
+
+            selected.append(
+                {
+                    "foodName": food["foodName"],
+                    "foodCategory": category,
+                    "grams": int(round(grams_used)),
+                    "calories": round(calories_used, 1),
+                }
+            )
+
+            food["remaining_grams"] -= grams_used
+            food["remaining_calories"] -= calories_used
+            budget -= calories_used
+            total_used += calories_used
+            items_used += 1
+
+            if category == "Protein Foods":
+                used_protein_today.add(food["foodName"])
+
+    return selected, round(total_used, 1), missing_categories
+
+
+def pool_key(food: dict[str, Any]) -> str:
+    """Stable key for a pool entry, used to line checkpoints up with a rebuilt pool."""
+    return f"{food['foodName'].strip().lower()}|{int(food['isBreakfast'])}"
+
+
+def plan_day(
+    pool: list[dict[str, Any]],
+    config: PlannerConfig | None = None,
+    buckets: dict[tuple[int, bool], list[dict[str, Any]]] | None = None,
+) -> tuple[dict[str, Any], list[str]]:
+    """Fill one day's meals from the pool, consuming it. Returns (day plan, missing categories)."""
+    config = config or DEFAULT_PLANNER_CONFIG
+    if buckets is None:
+        buckets = index_pool(pool, config)
+    daily_plan: dict[str, Any] = {}
+    used_protein_today: set[str] = set()
+    day_missing: set[str] = set()
+
+    for meal in ("Breakfast", "Lunch", "Dinner"):
+        goal = config.calorie_goals[meal]
+        items, total_cal, missing = fill_meal_slot(
+            pool, meal, goal, used_protein_today, config, buckets)
+        day_missing.update(missing)
+        daily_plan[meal] = {
+            "items": items,
+            "total_calories": total_cal,
+            "calorie_goal": goal,
+        }
+    return daily_plan, sorted(day_missing)
+
+
+def replay_checkpoints(
+    pool: list[dict[str, Any]], plans: dict[str, Any], days: list[str], start: list[float]
+) -> dict[str, list[float]]:
+    """Recompute the per-day checkpoints from a finished plan, starting from `start`."""
+    index = {(f["foodName"], f["isBreakfast"]): i for i, f in enumerate(pool)}
+    remaining = list(start)
+    checkpoints: dict[str, list[float]] = {}
+    for day in days:
+        checkpoints[day] = [round(max(0.0, grams), 2) for grams in remaining]
+        for meal, slot in plans[day].items():
+            for item in slot["items"]:
+                i = index.get((item["foodName"], meal == "Breakfast"))
+                if i is not None:
+                    remaining[i] -= item["grams"]
+    return checkpoints
+
+
+class PlanOutdated(Exception):
+    """The grocery list or planner settings changed while a plan was being built."""
+
+
+def plan_days(
+    pool: list[dict[str, Any]],
+    days: list[str],
+    optimize_ms: float = 0,
+    config: PlannerConfig | None = None,
+    outdated: Callable[[], bool] | None = None,
+) -> tuple[dict[str, Any], dict[str, list[str]], dict[str, list[float]]]:
+    """
+    Plan the given days in order. Before each day the remaining grams of every
+    pool entry are recorded, so a later replan can resume from that day.
+    With optimize_ms the greedy plan is then improved by optimize_plan.
+    `outdated` is checked before each day and before optimizing; PlanOutdated
+    is raised as soon as it returns True.
+    """
+    config = config or DEFAULT_PLANNER_CONFIG
+    buckets = index_pool(pool, config)
+    plans: dict[str, Any] = {}
+    missing_by_day: dict[str, list[str]] = {}
+    checkpoints: dict[str, list[float]] = {}
+    for day in days:
+        if outdated is not None and outdated():
+            raise PlanOutdated(day)
+        checkpoints[day] = [round(f["remaining_grams"], 2) for f in pool]
+        plans[day], missing_by_day[day] = plan_day(pool, config, buckets)
+
+    if outdated is not None and outdated():
+        raise PlanOutdated("optimize")
+    if optimize_ms > 0 and days:
+        optimize_plan(plans, pool, config.meal_composition, optimize_ms)
+        checkpoints = replay_checkpoints(pool, plans, days, checkpoints[days[0]])
+        for day in days:
+            present = {(meal, item["foodCategory"]) for meal, slot in plans[day].items() for item in slot["items"]}
+            missing_by_day[day] = sorted({
+                category for meal, composition in config.meal_composition.items()
+                for category in composition if (meal, category) not in present
+                and category in missing_by_day[day]
+            })
+    return plans, missing_by_day, checkpoints
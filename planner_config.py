@@ -0,0 +1,121 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping
+
+'''
+This module turns planner settings (calorie goal per meal, categories per meal and each category's share of the meal's calories) into an immutable PlannerConfig. Everything the planner would otherwise recompute for every meal slot is worked out once here: the calorie budget of every category in every meal, a small integer code per category, and per-meal tuples of (code, category, item quota, budget) in planning order. Configs are compiled once per settings version and shared read-only.
+
+A config also carries the user's own time budget for the local-search pass (optimize_ms). None means the user never set one and the server default (PLAN_OPTIMIZE_MS) applies.
+'''
+
+MEALS = ("Breakfast", "Lunch", "Dinner")
+# The largest search budget a user can ask for; every rebuild of their plan spends it
+MAX_OPTIMIZE_MS = 2000
+
+SlotPlan = tuple[tuple[int, str, int, float], ...]
+
+
+@dataclass(frozen=True)
+class PlannerConfig:
+    calorie_goals: Mapping[str, float]
+    meal_composition: Mapping[str, Mapping[str, int]]
+    meal_calorie_splits: Mapping[str, Mapping[str, float]]
+    category_budgets: Mapping[str, Mapping[str, float]]
+    category_codes: Mapping[str, int]
+    slots: Mapping[str, SlotPlan]
+    version: int = 0
+    optimize_ms: float | None = None
+
+    def settings(self) -> dict[str, Any]:
+        """The settings this config was compiled from, as plain dicts."""
+        return {
+            "calorie_goals": dict(self.calorie_goals),
+            "meal_composition": {meal: dict(parts) for meal, parts in self.meal_composition.items()},
+            "meal_calorie_splits": {meal: dict(parts) for meal, parts in self.meal_calorie_splits.items()},
+            "optimize_ms": self.optimize_ms,
+        }
+
+
+def _freeze(table: dict[str, dict[str, Any]]) -> Mapping[str, Mapping[str, Any]]:
+    return MappingProxyType({key: MappingProxyType(dict(value)) for key, value in table.items()})
+
+
+def compile_config(
+    calorie_goals: Mapping[str, float],
+    meal_composition: Mapping[str, Mapping[str, int]],
+    meal_calorie_splits: Mapping[str, Mapping[str, float]],
+    version: int = 0,
+    optimize_ms: float | None = None,
+) -> PlannerConfig:
+    """Precompute the per-category budgets and code tables for a set of settings."""
+    categories = sorted({category for parts in meal_composition.values() for category in parts})
+    codes = {category: code for code, category in enumerate(categories)}
+    budgets = {
+        meal: {category: calorie_goals[meal] * meal_calorie_splits[meal][category]
+               for category in meal_composition[meal]}
+        for meal in MEALS
+    }
+    slots = {
+        meal: tuple((codes[category], category, quota, budgets[meal][category])
+                    for category, quota in meal_composition[meal].items())
+        for meal in MEALS
+    }
+    return PlannerConfig(
+        calorie_goals=MappingProxyType({meal: calorie_goals[meal] for meal in MEALS}),
+        meal_composition=_freeze({meal: meal_composition[meal] for meal in MEALS}),
+        meal_calorie_splits=_freeze({meal: meal_calorie_splits[meal] for meal in MEALS}),
+        category_budgets=_freeze(budgets),
+        category_codes=MappingProxyType(codes),
+        slots=MappingProxyType(slots),
+        version=version,
+        optimize_ms=optimize_ms,
+    )
+
+
+def merge_settings(
+    base: PlannerConfig, overrides: Any, label: str = "Settings"
+) -> dict[str, Any]:
+    """
+    Apply user overrides to a config's settings and validate the result.
+    Meals left out keep their current values; a meal given a new composition
+    without splits shares its calories evenly between the categories. An
+    optimize_ms of null goes back to the server's default search budget.
+    Raises ValueError (mentioning `label`) on bad input.
+    """
+    if not isinstance(overrides, dict):
+        raise ValueError(f"{label} must be an object")
+    settings = base.settings()
+    goals = settings["calorie_goals"]
+    compositions = settings["meal_composition"]
+    splits = settings["meal_calorie_splits"]
+
+    for meal, goal in (overrides.get("calorie_goals") or {}).items():
+        if meal not in goals or not isinstance(goal, (int, float)) or goal < 0:
+            raise ValueError(f"{label}: bad calorie goal for {meal!r}")
+        goals[meal] = goal
+    for meal, composition in (overrides.get("meal_composition") or {}).items():
+        if meal not in compositions or not isinstance(composition, dict) or not composition:
+            raise ValueError(f"{label}: bad meal composition for {meal!r}")
+        if any(not isinstance(count, int) or count < 1 for count in composition.values()):
+            raise ValueError(f"{label}: item counts for {meal} must be positive integers")
+        compositions[meal] = dict(composition)
+        splits[meal] = {category: 1 / len(composition) for category in composition}
+    for meal, split in (overrides.get("meal_calorie_splits") or {}).items():
+        if meal not in splits or not isinstance(split, dict):
+            raise ValueError(f"{label}: bad calorie split for {meal!r}")
+        if any(not isinstance(share, (int, float)) or share < 0 for share in split.values()):
+            raise ValueError(f"{label}: calorie shares for {meal} must be non-negative numbers")
+        splits[meal].update({category: float(share) for category, share in split.items()})
+    if "optimize_ms" in overrides:
+        budget = overrides["optimize_ms"]
+        if budget is not None and (isinstance(budget, bool) or not isinstance(budget, (int, float))
+                                   or not 0 <= budget <= MAX_OPTIMIZE_MS):
+            raise ValueError(f"{label}: optimize_ms must be between 0 and {MAX_OPTIMIZE_MS}")
+        settings["optimize_ms"] = None if budget is None else float(budget)
+
+    for meal in MEALS:
+        missing = [category for category in compositions[meal] if category not in splits[meal]]
+        if missing:
+            raise ValueError(f"{label}: no calorie split for {meal} {missing}")
+    return settings
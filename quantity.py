@@ -0,0 +1,191 @@
+from __future__ import annotations
+import re
+import sys
+from typing import Any
+
+from pymongo import UpdateOne
+
+'''
+This module turns grocery amounts like "2 lbs", "1 gallon", "1 dozen", "32 oz" or "2 x 500g" into grams. Mass units convert directly, volumes go through a per-food density and counts ("1 dozen", "3 heads", "4 each") through a per-food piece weight. A bare number is always grams, as the add form has always meant it. It runs once when an item is added and the result is stored as a numeric "grams" field, so the planner never re-parses amount strings.
+'''
+
+# grams per unit
+MASS_UNITS: dict[str, float] = {
+    "g": 1.0, "gram": 1.0, "grams": 1.0, "gr": 1.0,
+    "kg": 1000.0, "kgs": 1000.0, "kilo": 1000.0, "kilos": 1000.0, "kilogram": 1000.0, "kilograms": 1000.0,
+    "mg": 0.001, "milligram": 0.001, "milligrams": 0.001,
+    "oz": 28.3495, "ounce": 28.3495, "ounces": 28.3495,
+    "lb": 453.592, "lbs": 453.592, "pound": 453.592, "pounds": 453.592,
+}
+
+# millilitres per unit
+VOLUME_UNITS: dict[str, float] = {
+    "ml": 1.0, "milliliter": 1.0, "milliliters": 1.0, "millilitre": 1.0, "millilitres": 1.0,
+    "l": 1000.0, "liter": 1000.0, "liters": 1000.0, "litre": 1000.0, "litres": 1000.0,
+    "gal": 3785.41, "gallon": 3785.41, "gallons": 3785.41,
+    "qt": 946.353, "quart": 946.353, "quarts": 946.353,
+    "pt": 473.176, "pint": 473.176, "pints": 473.176,
+    "cup": 240.0, "cups": 240.0,
+    "floz": 29.5735, "fl oz": 29.5735,
+    "tbsp": 14.787, "tablespoon": 14.787, "tablespoons": 14.787,
+    "tsp": 4.929, "teaspoon": 4.929, "teaspoons": 4.929,
+}
+
+# pieces per unit; the weight of a piece comes from FOOD_PIECE_GRAMS / CONTAINER_GRAMS
+COUNT_UNITS: dict[str, float] = {
+    "dozen": 12.0, "doz": 12.0,
+    "each": 1.0, "ea": 1.0, "piece": 1.0, "pieces": 1.0, "pc": 1.0, "pcs": 1.0,
+    "count": 1.0, "ct": 1.0, "x": 1.0,
+    "head": 1.0, "heads": 1.0, "bag": 1.0, "bags": 1.0, "can": 1.0, "cans": 1.0,
+    "loaf": 1.0, "loaves": 1.0, "bunch": 1.0, "bunches": 1.0, "pack": 1.0, "packs": 1.0,
+    "box": 1.0, "boxes": 1.0, "bottle": 1.0, "bottles": 1.0, "jar": 1.0, "jars": 1.0,
+}
+
+# g/ml for foods usually bought by volume; anything else is treated like water
+FOOD_DENSITY: dict[str, float] = {
+    "milk": 1.03,
+    "cream": 1.01,
+    "yogurt": 1.05,
+    "juice": 1.04,
+    "oil": 0.92,
+    "honey": 1.42,
+    "rice": 0.85,
+    "oats": 0.41,
+    "flour": 0.53,
+}
+
+# grams per piece for foods usually bought by count
+FOOD_PIECE_GRAMS: dict[str, float] = {
+    "egg": 50.0,
+    "chicken breast": 175.0,
+    "broccoli": 600.0,
+    "cauliflower": 850.0,
+    "lettuce": 600.0,
+    "cabbage": 900.0,
+    "banana": 118.0,
+    "apple": 182.0,
+    "orange": 130.0,
+    "avocado": 150.0,
+    "potato": 210.0,
+    "sweet potato": 130.0,
+    "onion": 150.0,
+    "tomato": 120.0,
+    "pepper": 150.0,
+    "spinach": 285.0,
+    "bread": 500.0,
+    "tortilla": 45.0,
+}
+
+# grams per container when the food itself has no piece weight
+CONTAINER_GRAMS: dict[str, float] = {
+    "head": 500.0, "heads": 500.0,
+    "bag": 450.0, "bags": 450.0,
+    "can": 400.0, "cans": 400.0,
+    "loaf": 500.0, "loaves": 500.0,
+    "bunch": 250.0, "bunches": 250.0,
+    "jar": 450.0, "jars": 450.0,
+    "bottle": 500.0, "bottles": 500.0,
+    "box": 400.0, "boxes": 400.0,
+}
+DEFAULT_PIECE_GRAMS = 100.0
+
+FRACTION_RE = re.compile(r"(?:(?P<whole>\d+)\s+)?(?P<num>\d+)\s*/\s*(?P<den>\d+)\s*(?P<unit>.*)")
+NUMBER_RE = re.compile(r"(?P<whole>\d+(?:\.\d+)?)\s*(?P<unit>.*)")
+# "2 x 500g", "3x1 lb": a number of packs of the given size
+MULTIPLIER_RE = re.compile(r"(?P<count>\d+(?:\.\d+)?)\s*[x×*]\s*(?P<each>\d.*)")
+
+
+def _lookup(table: dict[str, float], food_name: str) -> float | None:
+    """Find the longest table key contained in the food name ("sweet potato" beats "potato")."""
+    name = food_name.lower()
+    matches = [key for key in table if key in name]
+    return table[max(matches, key=len)] if matches else None
+
+
+def _split_amount(text: str) -> tuple[float, str] | None:
+    """Split "1 1/2 cups" into (1.5, "cups"); None if there is no number."""
+    match = FRACTION_RE.search(text)
+    if match and float(match.group("den")) != 0:
+        value = float(match.group("whole") or 0) + float(match.group("num")) / float(match.group("den"))
+    else:
+        match = NUMBER_RE.search(text)
+        if not match:
+            return None
+        value = float(match.group("whole"))
+    words = match.group("unit").replace(".", " ").split()
+    if words[:2] == ["fl", "oz"]:
+        return value, "fl oz"
+    return value, words[0] if words else ""
+
+
+def parse_quantity(amount: Any, food_name: str = "") -> float:
+    """
+    Convert an amount like "2 lbs", "1 gallon", "1 dozen", "1 1/2 cups",
+    "2 x 500g" or "500" into grams. A bare number is taken to be grams;
+    counts need a count word ("4 each", "4 pcs").
+    """
+    if isinstance(amount, (int, float)):
+        return float(amount)
+    text = str(amount).strip().lower()
+    multiplied = MULTIPLIER_RE.fullmatch(text)
+    if multiplied:
+        return float(multiplied.group("count")) * parse_quantity(multiplied.group("each"), food_name)
+    parsed = _split_amount(text)
+    if parsed is None:
+        return 0.0
+    value, unit = parsed
+
+    if not unit:
+        return value
+    if unit in MASS_UNITS:
+        return value * MASS_UNITS[unit]
+    if unit in VOLUME_UNITS:
+        density = _lookup(FOOD_DENSITY, food_name) or 1.0
+        return value * VOLUME_UNITS[unit] * density
+    if unit in COUNT_UNITS:
+        piece = _lookup(FOOD_PIECE_GRAMS, food_name) or CONTAINER_GRAMS.get(unit, DEFAULT_PIECE_GRAMS)
+        return value * COUNT_UNITS[unit] * piece
+    # unknown unit word ("3 apples"): treat it as a count of the food
+    piece = _lookup(FOOD_PIECE_GRAMS, f"{food_name} {unit}") or DEFAULT_PIECE_GRAMS
+    return value * piece
+
+
+def migrate_grams(collection) -> set[str]:
+    """
+    Add the numeric grams field to current_list rows stored before it existed.
+    Calories were computed from the old first-number parse, so they are scaled
+    to the new gram count. Returns the usernames whose rows changed.
+    """
+    updates = []
+    usernames: set[str] = set()
+    for item in collection.find({"grams": {"$exists": False}}):
+        amount = item.get("amount", "")
+        grams = parse_quantity(amount, item.get("name", ""))
+        fields: dict[str, Any] = {"grams": grams}
+        match = re.search(r"[\d.]+", str(amount))
+        try:
+            old_grams = float(match.group()) if match else 0.0
+        except ValueError:
+            old_grams = 0.0
+        if old_grams > 0 and item.get("calories"):
+            fields["calories"] = item["calories"] * grams / old_grams
+        updates.append(UpdateOne({"_id": item["_id"]}, {"$set": fields}))
+        usernames.add(item.get("username"))
+        if len(updates) >= 500:
+            collection.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+    return usernames
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["--migrate"]:
+        print("usage: python quantity.py --migrate")
+        sys.exit(1)
+    from algorithm import food_db, bump_list_version, build_meal_plan
+    changed_users = migrate_grams(food_db["current_list"])
+    for username in changed_users:
+        bump_list_version(username)
+        build_meal_plan(username)
+    print(f"Migrated grams for {len(changed_users)} users: {sorted(u for u in changed_users if u)}")
@@ -0,0 +1,117 @@
+from __future__ import annotations
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+'''
+This module makes sure only one worker (process, thread or host) rebuilds a user's plan at a time. A worker takes the user's lease in rebuild_leases with one atomic find_one_and_update; the lease expires after REBUILD_LEASE_SECONDS so a crashed worker cannot block a user for good. While the rebuild runs, a heartbeat thread pushes the expiry forward every third of that time, so a rebuild that takes longer than the lease (a large pool, a long optimizer budget) is not taken over halfway. A worker that finds the lease taken doesn't wait or rebuild: it marks the lease dirty, and the holder runs the rebuild once more before letting go, so the newest grocery list is always planned and a burst of changes costs at most two rebuilds.
+
+tests/test_rebuild_lease.py checks the lease against a local mongod.
+'''
+
+LEASES = "rebuild_leases"
+LEASE_SECONDS = float(os.getenv("REBUILD_LEASE_SECONDS", "30"))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def acquire_lease(db: Database, username: str) -> str | None:
+    """
+    Take the user's rebuild lease and return its token, or mark the lease
+    dirty for its holder and return None.
+    """
+    leases = db[LEASES]
+    while True:
+        token = uuid.uuid4().hex
+        now = _now()
+        try:
+            leases.find_one_and_update(
+                {"_id": username, "$or": [{"holder": None}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"holder": token, "dirty": False, "expires_at": now + timedelta(seconds=LEASE_SECONDS)}},
+                upsert=True,
+            )
+            return token
+        except DuplicateKeyError:
+            # Held by someone else: the upsert found no free lease and tried to insert one
+            pass
+        marked = leases.update_one(
+            {"_id": username, "holder": {"$ne": None}, "expires_at": {"$gt": now}},
+            {"$set": {"dirty": True}},
+        )
+        if marked.matched_count:
+            return None
+        # The holder let go (or its lease ran out) in between; try to take it again
+
+
+def release_lease(db: Database, username: str, token: str) -> bool:
+    """
+    Give the lease back. Returns True instead if another worker marked it
+    dirty: the lease is then renewed and the caller has to rebuild again.
+    """
+    leases = db[LEASES]
+    released = leases.update_one(
+        {"_id": username, "holder": token, "dirty": False},
+        {"$set": {"holder": None, "expires_at": _now()}},
+    )
+    if released.matched_count:
+        return False
+    renewed = leases.update_one(
+        {"_id": username, "holder": token, "dirty": True},
+        {"$set": {"dirty": False, "expires_at": _now() + timedelta(seconds=LEASE_SECONDS)}},
+    )
+    # Not renewed: the lease expired and another worker holds it now
+    return bool(renewed.matched_count)
+
+
+def renew_lease(db: Database, username: str, token: str) -> bool:
+    """Move the lease's expiry LEASE_SECONDS ahead. Returns False if `token` no longer holds it."""
+    renewed = db[LEASES].update_one(
+        {"_id": username, "holder": token},
+        {"$set": {"expires_at": _now() + timedelta(seconds=LEASE_SECONDS)}},
+    )
+    return bool(renewed.matched_count)
+
+
+def _keep_renewed(db: Database, username: str, token: str, done: threading.Event) -> None:
+    while not done.wait(LEASE_SECONDS / 3):
+        try:
+            if not renew_lease(db, username, token):
+                if not done.is_set():
+                    print(f"Lost the rebuild lease for {username} while rebuilding")
+                return
+        except PyMongoError as e:
+            # Try again next time; the lease only runs out after two more misses
+            print(f"Could not renew the rebuild lease for {username}: {e}")
+
+
+def run_with_lease(db: Database, username: str, work: Callable[[], Any]) -> bool:
+    """
+    Run `work` while holding the user's lease, again for every time another
+    worker asked for it meanwhile. The lease is renewed in the background for
+    as long as this runs. Returns False if another worker holds the lease
+    (and will run it instead).
+    """
+    token = acquire_lease(db, username)
+    if token is None:
+        return False
+    done = threading.Event()
+    threading.Thread(target=_keep_renewed, args=(db, username, token, done),
+                     name=f"lease-{username}", daemon=True).start()
+    try:
+        work()
+        while release_lease(db, username, token):
+            work()
+    except BaseException:
+        db[LEASES].update_one({"_id": username, "holder": token}, {"$set": {"holder": None, "expires_at": _now()}})
+        raise
+    finally:
+        done.set()
+    return True
+
@@ -0,0 +1,204 @@
+from __future__ import annotations
+import datetime
+from typing import Any
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+from pymongo.collection import Collection
+
+'''
+This module keeps the nutrition dashboard's rollups in the nutrition_rollups collection: one small document per user per day, week and month with planned calories, the calorie goal and the food categories covered, plus the calories and categories bought for archived weeks. Rollups are refreshed by Mongo aggregation pipelines, and only for the day/week/month that changed, so the dashboard reads a handful of documents instead of scanning weeklymeals and grocery_history. Purchase rollups are refreshed when a grocery week is archived. Plan writes only mark the plan (rollups_stale) and its rollups are refreshed when the dashboard is next read, so editing a plan doesn't pay for the pipelines.
+'''
+
+ROLLUPS = "nutrition_rollups"
+
+
+def week_start_of(moment: datetime.datetime) -> datetime.datetime:
+    """Midnight on the Monday of the week containing `moment`."""
+    monday = moment - datetime.timedelta(days=moment.weekday())
+    return monday.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def rollup_id(username: str, period: str, key: str) -> str:
+    return f"{username}|{period}|{key}"
+
+
+def _summarize(
+    rollups: Collection, match: dict[str, Any], prefix: str = ""
+) -> dict[str, Any]:
+    """
+    Add up the calories/goal/items and union the categories of the rollup
+    documents matching `match`. `prefix` selects a nested set of fields
+    ("purchased." for grocery history).
+    """
+    result = next(rollups.aggregate([
+        {"$match": match},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "calories": {"$sum": f"${prefix}calories"},
+                "goal": {"$sum": f"${prefix}goal"},
+                "items": {"$sum": f"${prefix}items"},
+                "days": {"$sum": {"$cond": [{"$gt": [f"${prefix}items", 0]}, 1, 0]}},
+            }}],
+            "categories": [
+                {"$unwind": f"${prefix}categories"},
+                {"$group": {"_id": None, "categories": {"$addToSet": f"${prefix}categories"}}},
+            ],
+        }},
+    ]), {})
+    totals = (result.get("totals") or [{}])[0]
+    categories = (result.get("categories") or [{}])[0]
+    return {
+        "calories": round(totals.get("calories", 0), 1),
+        "goal": round(totals.get("goal", 0), 1),
+        "items": totals.get("items", 0),
+        "days": totals.get("days", 0),
+        "categories": sorted(categories.get("categories", [])),
+    }
+
+
+def _upsert(username: str, period: str, key: str, start: datetime.datetime, fields: dict[str, Any]) -> UpdateOne:
+    return UpdateOne(
+        {"_id": rollup_id(username, period, key)},
+        {"$set": {
+            "username": username,
+            "period": period,
+            "key": key,
+            "start": start,
+            **fields,
+            "updated_at": datetime.datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+
+
+def refresh_month(db: Database, username: str, month_start: datetime.datetime) -> None:
+    """Recompute one month's rollup from its day rollups and its weeks' purchases."""
+    rollups = db[ROLLUPS]
+    next_month = (month_start + datetime.timedelta(days=32)).replace(day=1)
+    in_month = {"username": username, "start": {"$gte": month_start, "$lt": next_month}}
+    planned = _summarize(rollups, {**in_month, "period": "day"})
+    purchased = _summarize(rollups, {**in_month, "period": "week", "purchased": {"$exists": True}}, "purchased.")
+    key = month_start.strftime("%Y-%m")
+    rollups.bulk_write([_upsert(username, "month", key, month_start, {
+        **planned,
+        "purchased": {field: purchased[field] for field in ("calories", "items", "categories")},
+    })])
+
+
+def rollup_plan(db: Database, username: str, days: list[str], week_start: datetime.datetime | None = None) -> None:
+    """
+    Refresh the day, week and month rollups for the week a user's plan covers
+    (the current week unless given) from that week's weeklymeals document.
+    """
+    week_start = week_start or week_start_of(datetime.datetime.utcnow())
+    result = next(db.weeklymeals.aggregate([
+        {"$match": {"username": username, "week_start": week_start}},
+        {"$project": {"foods": 1, "days": {"$objectToArray": "$plan"}}},
+        {"$unwind": "$days"},
+        {"$project": {"foods": 1, "day": "$days.k", "meals": {"$objectToArray": "$days.v"}}},
+        {"$unwind": "$meals"},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": "$day",
+                "calories": {"$sum": "$meals.v.total_calories"},
+                "goal": {"$sum": "$meals.v.calorie_goal"},
+            }}],
+            "categories": [
+                {"$unwind": "$meals.v.items"},
+                {"$group": {
+                    "_id": "$day",
+                    "categories": {"$addToSet": {"$cond": [
+                        # Compact plans store [food index, ...] per item, see plan_codec.py
+                        {"$isArray": "$meals.v.items"},
+                        {"$arrayElemAt": [{"$arrayElemAt": ["$foods", {"$arrayElemAt": ["$meals.v.items", 0]}]}, 1]},
+                        "$meals.v.items.foodCategory",
+                    ]}},
+                    "items": {"$sum": 1},
+                }},
+            ],
+        }},
+    ]), {})
+    totals = {row["_id"]: row for row in result.get("totals", [])}
+    categories = {row["_id"]: row for row in result.get("categories", [])}
+
+    rollups = db[ROLLUPS]
+    operations = []
+    for offset, day in enumerate(days):
+        date = week_start + datetime.timedelta(days=offset)
+        operations.append(_upsert(username, "day", date.strftime("%Y-%m-%d"), date, {
+            "weekday": day,
+            "calories": round(totals.get(day, {}).get("calories", 0), 1),
+            "goal": totals.get(day, {}).get("goal", 0),
+            "items": categories.get(day, {}).get("items", 0),
+            "categories": sorted(categories.get(day, {}).get("categories", [])),
+        }))
+    rollups.bulk_write(operations, ordered=False)
+
+    week_end = week_start + datetime.timedelta(days=len(days))
+    week = _summarize(rollups, {"username": username, "period": "day",
+                                "start": {"$gte": week_start, "$lt": week_end}})
+    rollups.bulk_write([_upsert(username, "week", week_start.strftime("%Y-%m-%d"), week_start, week)])
+    # A week can straddle two months
+    for month_start in {week_start.replace(day=1), (week_end - datetime.timedelta(days=1)).replace(day=1)}:
+        refresh_month(db, username, month_start)
+
+
+def rollup_history_week(
+    db: Database,
+    history: Collection,
+    username: str,
+    week_start: datetime.datetime,
+    archived: dict[str, Any] | None = None,
+) -> None:
+    """
+    Refresh what was bought in one archived grocery week, and its month.
+    `archived` is the cold-storage summary of the week, if part of it has
+    already been compacted (see history_archive.py).
+    """
+    result = next(history.aggregate([
+        {"$match": {"username": username, "week_start": week_start}},
+        {"$unwind": "$items"},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "calories": {"$sum": "$items.calories"},
+                "items": {"$sum": 1},
+            }}],
+            "categories": [{"$group": {"_id": None, "categories": {"$addToSet": "$items.food_type"}}}],
+        }},
+    ]), {})
+    totals = (result.get("totals") or [{}])[0]
+    categories = (result.get("categories") or [{}])[0]
+    archived = archived or {}
+    db[ROLLUPS].update_one(
+        {"_id": rollup_id(username, "week", week_start.strftime("%Y-%m-%d"))},
+        {"$set": {
+            "username": username,
+            "period": "week",
+            "key": week_start.strftime("%Y-%m-%d"),
+            "start": week_start,
+            "purchased": {
+                "calories": round(totals.get("calories", 0) + archived.get("calories", 0), 1),
+                "items": totals.get("items", 0) + archived.get("item_count", 0),
+                "categories": sorted({c for c in categories.get("categories", []) if c}
+                                     | set(archived.get("categories", []))),
+            },
+            "updated_at": datetime.datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+    refresh_month(db, username, week_start.replace(day=1))
+
+
+def load_dashboard(db: Database, username: str, weeks: int = 8, months: int = 6) -> dict[str, list[dict[str, Any]]]:
+    """The current week's day rollups and the latest week and month rollups."""
+    week_start = week_start_of(datetime.datetime.utcnow())
+    rollups = db[ROLLUPS]
+    return {
+        "days": list(rollups.find({"username": username, "period": "day",
+                                   "start": {"$gte": week_start, "$lt": week_start + datetime.timedelta(days=7)}}).sort("start", 1)),
+        "weeks": list(rollups.find({"username": username, "period": "week"}).sort("start", -1).limit(weeks)),
+        "months": list(rollups.find({"username": username, "period": "month"}).sort("start", -1).limit(months)),
+    }
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import datetime
+import os
+from typing import Any
+
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+
+from history_search import ITEMS, reindex_history, tokens
+
+'''
+This module suggests what to buy next week: foods for the categories the current plan could not fill, and staples the user buys most weeks but has not added yet. Suggestions come from purchase_stats, one document per user and food with how many purchases and distinct weeks it appears in and when it was first and last bought. The stats are updated with a few upserts whenever weeks are archived, so a request reads one short indexed query instead of scanning grocery_history. The weeks a food was bought in are kept as a set of week starts (week_starts) and "weeks" is its size, so a week archived in several batches, or archived twice, still counts once.
+'''
+
+STATS = "purchase_stats"
+SUGGESTIONS_PER_CATEGORY = 3
+MAX_STAPLES = 5
+# Foods bought in at least this many weeks count as staples
+STAPLE_MIN_WEEKS = 3
+# How quickly old purchases stop counting: a purchase this many days ago counts half
+RECENCY_HALF_LIFE_DAYS = float(os.getenv("SUGGESTION_HALF_LIFE_DAYS", "28"))
+# Stats read per request (most frequently bought first)
+STATS_SCAN_LIMIT = 200
+
+
+def food_key(name: str) -> str:
+    return " ".join(tokens(name))
+
+
+def ensure_purchase_stats_index(history: Collection) -> None:
+    stats = history.database[STATS]
+    stats.create_index([("username", 1), ("key", 1)], unique=True)
+    stats.create_index([("username", 1), ("weeks", -1), ("last_bought", -1)])
+
+
+def record_purchases(
+    history: Collection, username: str, weeks: list[tuple[datetime.datetime, list[dict[str, Any]]]]
+) -> None:
+    """Fold newly archived weeks, as (week_start, items) pairs, into the user's purchase stats."""
+    stats = history.database[STATS]
+    if not stats.find_one({"username": username, "week_starts": {"$exists": True}}, {"_id": 1}):
+        # No stats yet (or only ones from before week_starts): build them from the whole history,
+        # which already holds these weeks
+        rebuild_purchase_stats(history, username)
+        return
+    foods: dict[str, dict[str, Any]] = {}
+    for week_start, items in weeks:
+        for item in items:
+            key = food_key(item.get("name"))
+            if not key:
+                continue
+            bought = item.get("date_added") or week_start
+            food = foods.setdefault(key, {"purchases": 0, "weeks": set(), "first": bought, "last": bought})
+            food["purchases"] += 1
+            food["weeks"].add(week_start)
+            food["first"] = min(food["first"], bought)
+            if bought >= food["last"]:
+                food["last"] = bought
+                food["name"] = item.get("name")
+                food["food_type"] = item.get("food_type")
+    operations = [
+        UpdateOne(
+            {"username": username, "key": key},
+            {
+                "$inc": {"purchases": food["purchases"]},
+                "$addToSet": {"week_starts": {"$each": sorted(food["weeks"])}},
+                "$min": {"first_bought": food["first"]},
+                "$max": {"last_bought": food["last"]},
+                "$set": {"name": food["name"], "food_type": food["food_type"]},
+            },
+            upsert=True,
+        )
+        for key, food in foods.items()
+    ]
+    if not operations:
+        return
+    stats.bulk_write(operations, ordered=False)
+    # weeks only grows with week_starts, so $max keeps racing archivers from setting it back
+    stats.bulk_write([
+        UpdateOne({"_id": doc["_id"]}, {"$max": {"weeks": len(doc["week_starts"])}})
+        for doc in stats.find({"username": username, "key": {"$in": list(foods)}}, {"week_starts": 1})
+    ], ordered=False)
+
+
+def rebuild_purchase_stats(history: Collection, username: str) -> int:
+    """Recompute a user's purchase stats from the history search table. Returns the number of foods."""
+    items = history.database[ITEMS]
+    if not items.find_one({"username": username}, {"_id": 1}):
+        reindex_history(history, username)
+    grouped = items.aggregate([
+        {"$match": {"username": username}},
+        {"$sort": {"date_added": 1}},
+        {"$group": {
+            "_id": "$tokens",
+            "name": {"$last": "$name"},
+            "food_type": {"$last": "$food_type"},
+            "purchases": {"$sum": 1},
+            "weeks": {"$addToSet": "$week_start"},
+            "first_bought": {"$min": "$date_added"},
+            "last_bought": {"$max": "$date_added"},
+        }},
+    ])
+    stats = history.database[STATS]
+    stats.delete_many({"username": username})
+    docs = [{
+        "username": username,
+        "key": " ".join(food["_id"]),
+        "name": food["name"],
+        "food_type": food["food_type"],
+        "purchases": food["purchases"],
+        "weeks": len(food["weeks"]),
+        "week_starts": sorted(food["weeks"]),
+        "first_bought": food["first_bought"],
+        "last_bought": food["last_bought"],
+    } for food in grouped if food["_id"]]
+    if docs:
+        stats.insert_many(docs, ordered=False)
+    return len(docs)
+
+
+def _bought_in(food: dict[str, Any]) -> str:
+    return f"bought in {food['weeks']} week{'' if food['weeks'] == 1 else 's'}"
+
+
+def _score(food: dict[str, Any], now: datetime.datetime) -> float:
+    """Weeks bought, discounted by how long ago the food was last bought."""
+    days = max((now - food["last_bought"]).total_seconds() / 86400, 0.0)
+    return food["weeks"] * 0.5 ** (days / RECENCY_HALF_LIFE_DAYS)
+
+
+def suggest(
+    history: Collection, username: str, missing_categories: list[str], current_names: list[str]
+) -> dict[str, Any]:
+    """
+    Foods to buy for each missing category (the user's own favourites first,
+    then common foods from foodstats) and the user's staples not on the list.
+    """
+    db = history.database
+    have = {food_key(name) for name in current_names}
+    found = list(db[STATS].find(
+        {"username": username},
+        {"_id": 0, "key": 1, "name": 1, "food_type": 1, "weeks": 1, "last_bought": 1},
+    ).sort([("weeks", -1), ("last_bought", -1)]).limit(STATS_SCAN_LIMIT))
+    # History archived before purchase_stats existed is folded in on first use
+    if not found and db[ITEMS].find_one({"username": username}, {"_id": 1}) \
+            and rebuild_purchase_stats(history, username):
+        return suggest(history, username, missing_categories, current_names)
+
+    now = datetime.datetime.utcnow()
+    ranked = sorted((food for food in found if food["key"] not in have),
+                    key=lambda food: _score(food, now), reverse=True)
+    by_category: dict[str, list[dict[str, Any]]] = {}
+    for category in missing_categories:
+        picks = [{"name": food["name"], "reason": _bought_in(food)}
+                 for food in ranked if food["food_type"] == category][:SUGGESTIONS_PER_CATEGORY]
+        if len(picks) < SUGGESTIONS_PER_CATEGORY:
+            taken = have | {food_key(pick["name"]) for pick in picks}
+            for record in db.foodstats.find({"Category": category}, {"Name": 1}).limit(SUGGESTIONS_PER_CATEGORY * 3):
+                if len(picks) >= SUGGESTIONS_PER_CATEGORY:
+                    break
+                if food_key(record["Name"]) not in taken:
+                    taken.add(food_key(record["Name"]))
+                    picks.append({"name": record["Name"], "reason": f"a {category.lower()} food"})
+        by_category[category] = picks
+
+    suggested = {food_key(pick["name"]) for picks in by_category.values() for pick in picks}
+    staples = [
+        {"name": food["name"], "category": food["food_type"], "reason": _bought_in(food)}
+        for food in ranked
+        if food["weeks"] >= STAPLE_MIN_WEEKS and food["key"] not in suggested
+    ][:MAX_STAPLES]
+    return {"missing_categories": by_category, "staples": staples}
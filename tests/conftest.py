@@ -0,0 +1,98 @@
+import os
+import sys
+import uuid
+
+import mongomock
+import pymongo
+import pytest
+
+'''
+Shared fixtures. The app modules open their Mongo client when they are imported, so the client is swapped for an in-memory mongomock one here, before any of them is imported. Tests that need server features mongomock lacks (the $trim in the pool snapshot, concurrent leases) take the `mongod` fixture instead, which skips them when no local mongod answers at TEST_MONGO_URI.
+'''
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+# grocery.py always uses "groceryfood"; the other modules follow MONGO_DBNAME, so point them at the same one
+os.environ["MONGO_DBNAME"] = "groceryfood"
+
+RealMongoClient = pymongo.MongoClient
+_mock_client = mongomock.MongoClient()
+pymongo.MongoClient = lambda *args, **kwargs: _mock_client
+
+MEALS = ("Breakfast", "Lunch", "Dinner")
+FOODS = [
+    {"Name": "Chicken Breast", "Category": "Protein", "Calories": 165},
+    {"Name": "Broccoli", "Category": "Vegetable", "Calories": 34},
+    {"Name": "Rice", "Category": "Grain", "Calories": 130},
+    {"Name": "Apple", "Category": "Fruit", "Calories": 52},
+    {"Name": "Milk", "Category": "Dairy", "Calories": 42},
+    {"Name": "Eggs", "Category": "Protein", "Calories": 143},
+]
+
+
+def _clear(database) -> None:
+    for name in database.list_collection_names():
+        database.drop_collection(name)
+
+
+@pytest.fixture
+def db():
+    """The (mongomock) database the app modules use, empty, with plan indexes and foodstats."""
+    import algorithm
+    import plan_store
+    from caching import page_cache
+
+    _clear(algorithm.food_db)
+    algorithm.ensure_plan_indexes()
+    algorithm.food_db.foodstats.insert_many([dict(food) for food in FOODS])
+    algorithm._latest_inputs.clear()
+    with plan_store._last_known_lock:
+        plan_store._last_known.clear()
+    plan_store.plan_breaker.record_success()
+    page_cache.invalidate("amy")
+    yield algorithm.food_db
+    _clear(algorithm.food_db)
+
+
+@pytest.fixture
+def client(db):
+    """A test client logged in as "amy"."""
+    from app import app
+
+    app.config["TESTING"] = True
+    test_client = app.test_client()
+    with test_client.session_transaction() as session:
+        session["username"] = "amy"
+    return test_client
+
+
+@pytest.fixture(scope="session")
+def mongod_client():
+    """A client for the local mongod, looked for once per run."""
+    mongo = RealMongoClient(os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=500)
+    try:
+        mongo.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        pytest.skip("no mongod running at TEST_MONGO_URI")
+    yield mongo
+    mongo.close()
+
+
+@pytest.fixture
+def mongod(mongod_client):
+    """A scratch database on the local mongod, dropped afterwards; skips the test without one."""
+    name = f"grocery_test_{uuid.uuid4().hex[:8]}"
+    yield mongod_client[name]
+    mongod_client.drop_database(name)
+
+
+def make_plan(days, calories: float = 150.0) -> dict:
+    """A decoded plan with one item per meal, named after its day and meal."""
+    nutrients = {"protein": 10.0, "carbs": 20.0, "fiber": 2.0, "sugar": 5.0, "fat": 3.0}
+    return {day: {meal: {
+        "items": [{"foodName": f"{day} {meal}", "foodCategory": "Protein",
+                   "grams": 100.0, "calories": calories, "nutrients": dict(nutrients)}],
+        "total_calories": calories,
+        "calorie_goal": 500,
+        "nutrients": dict(nutrients),
+    } for meal in MEALS} for day in days}
@@ -0,0 +1,45 @@
+import api
+from algorithm import DAYS, push_weekly_plan
+from caching import page_cache
+from conftest import make_plan
+
+
+def week(client, etag=None):
+    return client.get("/week", headers={"If-None-Match": etag} if etag else {})
+
+
+def test_week_page_is_cached_until_the_plan_changes(client, db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    first = week(client)
+    assert first.status_code == 200 and b"Monday Lunch" in first.data
+    etag = first.headers["ETag"]
+    assert week(client, etag).status_code == 304
+
+    hits = page_cache.stats()["hits"]
+    assert week(client).data == first.data
+    assert page_cache.stats()["hits"] == hits + 1
+
+    push_weekly_plan("amy", make_plan(DAYS[:1]), [])
+    changed = week(client, etag)
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag and b"Tuesday Lunch" not in changed.data
+
+
+def test_plan_rebuilt_elsewhere_is_not_served_from_the_cache(client, db, monkeypatch):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    first = week(client)
+    # A rebuild in another process moves the stamp but can't invalidate this process's cache
+    monkeypatch.setattr(page_cache, "invalidate", lambda username: None)
+    push_weekly_plan("amy", make_plan(DAYS[:1]), [])
+    second = week(client)
+    assert second.headers["ETag"] != first.headers["ETag"] and b"Tuesday Lunch" not in second.data
+
+
+def test_cache_stats_need_a_login(client, monkeypatch):
+    assert client.get("/api/v1/cache-stats").get_json()["hits"] >= 0
+    with client.session_transaction() as session:
+        session.clear()
+    assert client.get("/api/v1/cache-stats").status_code == 401
+    with client.session_transaction() as session:
+        session["username"] = "amy"
+    monkeypatch.setattr(api, "CACHE_STATS_USERS", {"admin"})
+    assert client.get("/api/v1/cache-stats").status_code == 403
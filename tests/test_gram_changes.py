@@ -0,0 +1,53 @@
+from algorithm import DAYS, apply_gram_changes, get_input_version, get_list_version, push_weekly_plan, \
+    update_current_list_amounts
+from conftest import make_plan
+
+
+def grams(db, name):
+    return db.current_list.find_one({"username": "amy", "name": name})["grams"]
+
+
+def test_gram_changes_are_one_bulk_inc(db, monkeypatch):
+    db.current_list.insert_many([
+        {"username": "amy", "name": "Rice", "grams": 500.0},
+        {"username": "amy", "name": "Milk", "grams": 1000.0},
+        # Not converted to grams yet: left alone
+        {"username": "amy", "name": "Apple", "amount": "3"},
+    ])
+    writes = []
+    bulk_write = type(db.current_list).bulk_write
+    monkeypatch.setattr(type(db.current_list), "bulk_write",
+                        lambda self, operations, **kwargs: (writes.append(operations),
+                                                            bulk_write(self, operations, **kwargs))[1])
+    assert apply_gram_changes("amy", {"Rice": 150.0, "Milk": -250.0, "Apple": 10.0, "Eggs": 0}) == 2
+    assert len(writes) == 1
+    assert grams(db, "Rice") == 650.0 and grams(db, "Milk") == 750.0
+    assert "grams" not in db.current_list.find_one({"name": "Apple"})
+    # Grams handed back by a plan edit change the list but not the plan inputs
+    assert get_list_version("amy") == 1 and get_input_version("amy") == 0
+
+
+def test_consumption_takes_from_merged_entries_in_turn(db):
+    db.current_list.insert_many([
+        {"_id": 1, "username": "amy", "name": "Rice", "grams": 300.0},
+        {"_id": 2, "username": "amy", "name": "Rice", "grams": 500.0},
+    ])
+    pool = [{"original_grams": 800.0, "remaining_grams": 400.0,
+             "_db_parts": [{"_id": 1, "grams": 300.0}, {"_id": 2, "grams": 500.0}]}]
+    update_current_list_amounts("amy", pool)
+    assert [doc["grams"] for doc in db.current_list.find().sort("_id", 1)] == [0.0, 400.0]
+
+
+def test_deleting_a_meal_gives_its_grams_back(client, db):
+    db.current_list.insert_one({"username": "amy", "name": "Monday Lunch", "grams": 50.0})
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    client.post("/delete-meal/monday/lunch")
+    assert grams(db, "Monday Lunch") == 150.0
+
+
+def test_deleting_a_day_gives_every_meal_back(client, db):
+    db.current_list.insert_many([{"username": "amy", "name": f"Friday {meal}", "grams": 0.0}
+                                 for meal in ("Breakfast", "Lunch", "Dinner")])
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    client.post("/delete-day/friday")
+    assert [doc["grams"] for doc in db.current_list.find({"username": "amy"})] == [100.0] * 3
@@ -0,0 +1,82 @@
+import io
+
+import mongomock
+import pytest
+
+import grocery_import
+from algorithm import get_list_version, resolve_food_records
+from grocery_import import add_items_bulk, import_items, parse_item_json, parse_item_text
+
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    """Record plan rebuild requests instead of planning."""
+    requested = []
+    monkeypatch.setattr(grocery_import, "request_plan_rebuild", requested.append)
+    return requested
+
+
+def test_parse_item_text_and_json():
+    assert parse_item_text("rice, 500 g\n\neggs\t12\tyes\n") == [
+        {"name": "rice", "amount": "500 g", "breakfast": False},
+        None,
+        {"name": "eggs", "amount": "12", "breakfast": True},
+    ]
+    assert parse_item_json([{"name": " Apple ", "amount": 3, "breakfast": "yes"}, "milk, 1 gallon", 7]) == [
+        {"name": "Apple", "amount": "3", "breakfast": True},
+        {"name": "milk", "amount": "1 gallon", "breakfast": False},
+        {"name": "", "amount": "", "breakfast": False},
+    ]
+    with pytest.raises(ValueError):
+        parse_item_json({"name": "rice"})
+
+
+def test_bulk_add_inserts_once_and_rebuilds_once(db, rebuilds, monkeypatch):
+    inserts = []
+    insert_many = mongomock.collection.Collection.insert_many
+
+    def counting_insert_many(self, documents, *args, **kwargs):
+        inserts.append(len(documents))
+        return insert_many(self, documents, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "insert_many", counting_insert_many)
+    report = add_items_bulk("amy", [
+        {"name": "rice", "amount": "500 g", "breakfast": False},
+        None,
+        {"name": "unicorn", "amount": "1", "breakfast": False},
+        {"name": "eggs", "amount": "", "breakfast": True},
+        {"name": "chicken breast", "amount": "1 lb", "breakfast": False},
+    ])
+    assert [(entry["line"], entry["status"]) for entry in report] == [
+        (1, "added"), (3, "unknown"), (4, "invalid"), (5, "added")]
+    assert inserts == [2]
+    assert rebuilds == ["amy"]
+    assert get_list_version("amy") == 1
+    rice = db.current_list.find_one({"username": "amy", "name": "rice"})
+    assert rice["grams"] == 500 and rice["food_type"] == "Grain" and rice["calories"] == pytest.approx(650)
+
+
+def test_bulk_add_with_nothing_recognised_writes_nothing(db, rebuilds):
+    report = add_items_bulk("amy", [{"name": "unicorn", "amount": "1", "breakfast": False}])
+    assert report[0]["status"] == "unknown"
+    assert db.current_list.count_documents({}) == 0
+    assert rebuilds == [] and get_list_version("amy") == 0
+
+
+def test_bulk_endpoint_reports_per_line(client, rebuilds):
+    response = client.post("/grocery-list/bulk", json=[{"name": "apple", "amount": "1000"}, {"name": "unicorn", "amount": "2"}])
+    body = response.get_json()
+    assert body["added"] == 1
+    assert [entry["status"] for entry in body["items"]] == ["added", "unknown"]
+    assert client.post("/grocery-list/bulk", json={"name": "apple"}).status_code == 400
+
+
+def test_import_keeps_the_users_casing(db, rebuilds):
+    upload = io.BytesIO(b"name,amount\nChicken Breast,1 lb\nRICE $2.49,500g\nbroccoli,2 cups\n")
+    events = list(import_items("amy", upload))
+    assert events[-1]["added"] == 3
+    names = [doc["name"] for doc in db.current_list.find({"username": "amy"}).sort("_id", 1)]
+    assert names == ["Chicken Breast", "RICE", "broccoli"]
+    # Differently cased names still find the same food, in one pattern
+    records = resolve_food_records(["Rice", "rice", "RICE"])
+    assert {record["Name"] for record in records.values()} == {"Rice"}
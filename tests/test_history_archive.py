@@ -0,0 +1,53 @@
+import datetime
+
+import mongomock
+import pytest
+from pymongo.errors import PyMongoError
+
+from history_archive import ARCHIVE, archived_week_items, archived_weeks, compact_history
+
+NOW = datetime.datetime(2026, 6, 1)
+OLD_WEEK = datetime.datetime(2026, 1, 5)
+
+
+def old_week(db, week_start=OLD_WEEK, names=("Rice", "Eggs")):
+    db.grocery_history.insert_one({"username": "amy", "week_start": week_start, "items": [
+        {"name": name, "amount": "100 g", "calories": 100.0, "food_type": "Grain", "date_added": week_start}
+        for name in names]})
+
+
+def test_old_weeks_move_into_the_month_document(db):
+    old_week(db)
+    old_week(db, NOW - datetime.timedelta(days=7))
+    assert compact_history(db.grocery_history, "amy", NOW) == 1
+    assert db.grocery_history.count_documents({}) == 1
+    assert [week["item_count"] for week in archived_weeks(db.grocery_history, "amy")] == [2]
+    assert [item["name"] for item in archived_week_items(db.grocery_history, "amy", OLD_WEEK)] == ["Rice", "Eggs"]
+
+
+def test_crash_before_the_delete_does_not_duplicate_history(db, monkeypatch):
+    old_week(db)
+    delete_many = mongomock.collection.Collection.delete_many
+
+    def crash(self, *args, **kwargs):
+        raise PyMongoError("worker died")
+
+    monkeypatch.setattr(mongomock.collection.Collection, "delete_many", crash)
+    with pytest.raises(PyMongoError):
+        compact_history(db.grocery_history, "amy", NOW)
+    monkeypatch.setattr(mongomock.collection.Collection, "delete_many", delete_many)
+    # The week is archived and still hot; the next compaction only deletes it
+    compact_history(db.grocery_history, "amy", NOW)
+    assert db.grocery_history.count_documents({}) == 0
+    assert len(archived_week_items(db.grocery_history, "amy", OLD_WEEK)) == 2
+    assert archived_weeks(db.grocery_history, "amy")[0]["item_count"] == 2
+
+
+def test_later_weeks_of_a_month_are_appended(db):
+    old_week(db)
+    compact_history(db.grocery_history, "amy", NOW)
+    old_week(db, OLD_WEEK + datetime.timedelta(days=7), ("Milk",))
+    compact_history(db.grocery_history, "amy", NOW)
+    month = db[ARCHIVE].find_one({"username": "amy"})
+    assert len(month["week_ids"]) == 2
+    assert [week["item_count"] for week in archived_weeks(db.grocery_history, "amy")] == [1, 2]
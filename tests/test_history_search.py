@@ -0,0 +1,62 @@
+import datetime
+
+from history_search import ITEMS, ensure_history_search_index, search_history
+
+
+def purchases(db, count):
+    """`count` salmon purchases a day apart (newest last), plus one rice, in one archived week."""
+    start = datetime.datetime(2026, 1, 5)
+    items = [{"name": f"Salmon fillet {n}", "amount": "200 g", "date_added": start + datetime.timedelta(days=n)}
+             for n in range(count)]
+    items.append({"name": "Rice", "amount": "1 kg", "date_added": start})
+    db.grocery_history.insert_one({"username": "amy", "week_start": start, "items": items})
+
+
+def names(result):
+    return [item["name"] for item in result["results"]]
+
+
+def test_search_index_covers_the_sort(db):
+    ensure_history_search_index(db.grocery_history)
+    keys = [index["key"] for index in db[ITEMS].index_information().values()]
+    assert [("username", 1), ("tokens", 1), ("date_added", -1), ("_id", -1)] in keys
+
+
+def test_pages_follow_each_other_newest_first(db):
+    purchases(db, 5)
+    first = search_history(db.grocery_history, "amy", "salmon", page_size=2)
+    assert names(first) == ["Salmon fillet 4", "Salmon fillet 3"]
+    assert first["newer"] is None and first["older"]
+    second = search_history(db.grocery_history, "amy", "salmon", after=first["older"], page_size=2)
+    assert names(second) == ["Salmon fillet 2", "Salmon fillet 1"]
+    last = search_history(db.grocery_history, "amy", "salmon", after=second["older"], page_size=2)
+    assert names(last) == ["Salmon fillet 0"] and last["older"] is None
+    # And back again
+    back = search_history(db.grocery_history, "amy", "salmon", before=last["newer"], page_size=2)
+    assert names(back) == names(second) and back["newer"] == second["newer"]
+    top = search_history(db.grocery_history, "amy", "salmon", before=back["newer"], page_size=2)
+    assert names(top) == names(first) and top["newer"] is None
+
+
+def test_same_day_purchases_are_paged_by_id(db):
+    day = datetime.datetime(2026, 1, 5)
+    db.grocery_history.insert_one({"username": "amy", "week_start": day, "items": [
+        {"name": f"Salmon {n}", "date_added": day} for n in range(3)]})
+    seen = []
+    after = None
+    while True:
+        page = search_history(db.grocery_history, "amy", "salmon", after=after, page_size=1)
+        seen += names(page)
+        after = page["older"]
+        if after is None:
+            break
+    assert sorted(seen) == ["Salmon 0", "Salmon 1", "Salmon 2"]
+
+
+def test_search_route_pages_as_json(client, db):
+    purchases(db, 3)
+    first = client.get("/grocery-history/search?q=salmon&format=json").get_json()
+    assert len(first["results"]) == 3 and first["older"] is None
+    assert first["results"][0]["date_added"].startswith("2026-01-07")
+    assert "_id" not in first["results"][0]
+    assert client.get("/grocery-history/search?q=salmon&after=garbage&format=json").get_json()["results"]
@@ -0,0 +1,52 @@
+import pytest
+
+import grocery
+from algorithm import DAYS, push_weekly_plan
+from conftest import make_plan
+
+JSON = {"Accept": "application/json"}
+
+
+@pytest.fixture
+def no_rebuilds(monkeypatch):
+    """Grocery edits request a rebuild, whose pool snapshot needs mongod."""
+    monkeypatch.setattr(grocery, "request_plan_rebuild", lambda username: None)
+
+
+def test_delete_meal_returns_only_that_meal(client, db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    response = client.post("/delete-meal/monday/lunch", headers=JSON)
+    days = response.get_json()["plan"]["days"]
+    assert list(days) == ["Monday"] and list(days["Monday"]["meals"]) == ["Lunch"]
+    assert days["Monday"]["meals"]["Lunch"] == {"items": [], "calories": 0}
+    # The day's new totals: breakfast and dinner are left
+    assert days["Monday"]["calories"] == 300.0 and days["Monday"]["nutrients"]["protein"] == 20.0
+
+
+def test_browsers_are_still_redirected(client, db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    response = client.post("/delete-meal/monday/lunch")
+    assert response.status_code == 302 and response.headers["Location"].endswith("/day/monday")
+
+
+def test_swapping_days_returns_both_days(client, db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    days = client.post("/week/swap/monday/down?format=json").get_json()["plan"]["days"]
+    assert set(days) == {"Monday", "Tuesday"}
+    assert days["Monday"]["meals"]["Lunch"]["items"][0]["name"] == "Tuesday Lunch"
+
+
+def test_grocery_add_and_delete_return_the_changed_rows(client, db, no_rebuilds):
+    added = client.post("/grocery-list", json={"name": "Rice", "amount": "500 g"}, headers=JSON).get_json()
+    row = added["grocery"]["added"][0]
+    assert row["name"] == "Rice" and row["grams"] == 500.0 and row["food_type"] == "Grain"
+
+    deleted = client.post(f"/delete-item/{row['_id']}", headers=JSON).get_json()
+    assert deleted["grocery"] == {"removed": [row["_id"]]}
+    assert client.post(f"/delete-item/{row['_id']}", headers=JSON).status_code == 404
+
+
+def test_unknown_food_is_a_json_error(client, db, no_rebuilds):
+    response = client.post("/grocery-list", json={"name": "Unicorn", "amount": "1"}, headers=JSON)
+    assert response.status_code == 400 and "don't recognize" in response.get_json()["error"]
+    assert db.current_list.count_documents({}) == 0
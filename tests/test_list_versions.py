@@ -0,0 +1,43 @@
+import mongomock
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from algorithm import bump_list_version, ensure_plan_indexes, get_list_version, inc_versions
+
+
+def test_list_versions_are_unique_per_user(db):
+    bump_list_version("amy")
+    with pytest.raises(DuplicateKeyError):
+        db.list_versions.insert_one({"username": "amy", "version": 1})
+
+
+def test_duplicates_merge_before_the_index_is_built(db):
+    db.list_versions.drop_indexes()
+    db.list_versions.insert_many([
+        {"username": "amy", "version": 3, "input_version": 2},
+        {"username": "amy", "version": 5, "input_version": 1, "settings_version": 1},
+        {"username": "bob", "version": 1},
+    ])
+    ensure_plan_indexes()
+    amy = list(db.list_versions.find({"username": "amy"}))
+    assert len(amy) == 1
+    # One past both, so neither document's ETags still match
+    assert (amy[0]["version"], amy[0]["input_version"], amy[0]["settings_version"]) == (6, 2, 1)
+    assert get_list_version("bob") == 1
+
+
+def test_losing_first_upsert_retries_as_an_update(db, monkeypatch):
+    bump_list_version("amy")
+    real = mongomock.collection.Collection.find_one_and_update
+    calls = []
+
+    def racing_upsert(self, *args, **kwargs):
+        calls.append(kwargs.get("upsert", False))
+        if kwargs.get("upsert"):
+            # Another worker inserted the user's document first
+            raise DuplicateKeyError("E11000 duplicate key")
+        return real(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find_one_and_update", racing_upsert)
+    assert inc_versions("amy", {"version": 1})["version"] == 2
+    assert calls == [True, False]
@@ -0,0 +1,52 @@
+import re
+
+import pytest
+
+from algorithm import DAYS, attach_nutrients, nutrient_matrix, push_weekly_plan, sum_nutrients
+
+
+def add_foods(db):
+    db.foodstats.insert_many([
+        {"Name": "Tofu", "Category": "Protein", "Calories": 144,
+         "Protein": 17.3, "Carbohydrate": 2.8, "Fiber": 2.3, "Sugar": 0.6, "Fat": 8.7},
+        # Other spellings of the nutrient fields
+        {"Name": "Oats", "Category": "Grain", "Calories": 389,
+         "Protein": 16.9, "Carbs": 66.3, "Dietary Fiber": 10.6, "Sugars": 1.0, "Total Fat": 6.9},
+    ])
+
+
+def meal(*items):
+    return {"items": [{"foodName": name, "foodCategory": "Protein", "grams": grams, "calories": 0.0}
+                      for name, grams in items]}
+
+
+def test_nutrient_matrix_reads_every_field_spelling(db):
+    add_foods(db)
+    matrix = nutrient_matrix(["Oats", "Tofu", "Unicorn"])
+    assert matrix[0].round(4).tolist() == [0.169, 0.663, 0.106, 0.01, 0.069]
+    assert matrix[1].round(4).tolist() == [0.173, 0.028, 0.023, 0.006, 0.087]
+    assert matrix[2].tolist() == [0.0] * 5
+
+
+def test_totals_are_joined_into_items_meals_and_days(db):
+    add_foods(db)
+    plans = {"Monday": {"Breakfast": meal(("Oats", 100)), "Lunch": meal(("Tofu", 200), ("Oats", 50))},
+             "Tuesday": {"Dinner": meal(("Tofu", 100))}}
+    days = attach_nutrients(plans, ["Monday", "Tuesday"])
+    assert plans["Monday"]["Lunch"]["items"][0]["nutrients"]["protein"] == 34.6
+    assert plans["Monday"]["Lunch"]["nutrients"] == {
+        "protein": 43.1, "carbs": 38.8, "fiber": 9.9, "sugar": 1.7, "fat": 20.8}
+    # Day totals come from the unrounded meal totals
+    assert days["Monday"] == pytest.approx(sum_nutrients([plans["Monday"]["Breakfast"]["nutrients"],
+                                                          plans["Monday"]["Lunch"]["nutrients"]]), abs=0.15)
+    assert days["Tuesday"]["protein"] == 17.3
+
+
+def test_day_view_shows_the_stored_totals(client, db):
+    add_foods(db)
+    plan = {day: {"Lunch": meal(("Tofu", 100))} for day in DAYS}
+    attach_nutrients(plan, DAYS)
+    push_weekly_plan("amy", plan, [])
+    page = client.get("/day/monday").get_data(as_text=True)
+    totals = dict(re.findall(r'data-total="(\w+)">([\d.]+)<', page))
+    assert totals == {"calories": "0.0", "protein": "17.3", "carbs": "2.8", "fat": "8.7", "fiber": "2.3", "sugar": "0.6"}
@@ -0,0 +1,62 @@
+import copy
+import random
+
+import pytest
+
+from planner import DAYS, MEAL_COMPOSITION, plan_days
+from benchmark_optimizer import synthetic_pool
+from optimizer import optimize_plan, plan_error
+
+
+def greedy(seed: int):
+    pool = synthetic_pool(random.Random(seed))
+    plan, _, _ = plan_days(pool, DAYS)
+    return plan, pool
+
+
+def test_zero_budget_leaves_plan_alone():
+    plan, pool = greedy(1)
+    before = copy.deepcopy(plan)
+    stats = optimize_plan(plan, pool, MEAL_COMPOSITION, 0)
+    assert plan == before and stats["proposals"] == 0
+    assert stats["error_before"] == stats["error_after"] == plan_error(plan)
+
+
+def test_search_never_makes_the_plan_worse():
+    for seed in range(5):
+        plan, pool = greedy(seed)
+        stats = optimize_plan(plan, pool, MEAL_COMPOSITION, 20)
+        assert stats["error_after"] <= stats["error_before"]
+        assert stats["error_after"] == plan_error(plan)
+
+
+def item_grams(plan) -> dict[str, list[int]]:
+    grams: dict[str, list[int]] = {}
+    for day in plan.values():
+        for slot in day.values():
+            for item in slot.get("items", []):
+                grams.setdefault(item["foodName"], []).append(item["grams"])
+    return grams
+
+
+def test_pool_stays_consistent_with_the_plan():
+    plan, pool = greedy(3)
+    greedy_items = item_grams(plan)
+    optimize_plan(plan, pool, MEAL_COMPOSITION, 20)
+    items = item_grams(plan)
+    for food in pool:
+        name = food["foodName"]
+        assert food["remaining_grams"] >= -1e-6
+        # Plan items hold whole grams: the greedy plan's rounding carries into the search, which rounds again
+        slack = 0.5 * (len(greedy_items.get(name, [])) + len(items.get(name, []))) + 1e-6
+        assert food["original_grams"] - food["remaining_grams"] == pytest.approx(sum(items.get(name, [])), abs=slack)
+
+
+def test_items_missing_from_the_pool_keep_their_calories():
+    plan, pool = greedy(4)
+    slot = plan["Monday"]["Lunch"]
+    slot["items"].append({"foodName": "Leftover stew", "foodCategory": "Protein", "grams": 300, "calories": 420.0})
+    optimize_plan(plan, pool, MEAL_COMPOSITION, 20)
+    stew = [item for day in plan.values() for slot in day.values()
+            for item in slot["items"] if item["foodName"] == "Leftover stew"]
+    assert stew == [{"foodName": "Leftover stew", "foodCategory": "Protein", "grams": 300, "calories": 420.0}]
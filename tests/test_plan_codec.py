@@ -0,0 +1,71 @@
+import copy
+
+from algorithm import plan_filter, push_weekly_plan
+from conftest import make_plan
+from plan_codec import PLAN_FORMAT, FoodTable, decode_doc, encode_plan, encode_slice
+from plan_store import find_day_plan
+
+
+def stored(plan):
+    encoded, table = encode_plan(plan)
+    return {"_id": 1, "plan": encoded, "plan_format": PLAN_FORMAT, "foods": table.foods}
+
+
+def test_round_trip():
+    plan = make_plan(["Monday", "Tuesday"])
+    original = copy.deepcopy(plan)
+    assert decode_doc(stored(plan)) == {"_id": 1, "plan": original}
+    # Encoding leaves the caller's plan alone
+    assert plan == original
+
+
+def test_items_are_short_lists_with_a_shared_food_table():
+    plan = make_plan(["Monday", "Tuesday"])
+    plan["Tuesday"]["Lunch"]["items"][0]["foodName"] = "Monday Lunch"
+    doc = stored(plan)
+    assert len(doc["foods"]) == 5
+    monday, tuesday = doc["plan"]["Monday"]["Lunch"]["items"][0], doc["plan"]["Tuesday"]["Lunch"]["items"][0]
+    assert monday[0] == tuesday[0]
+    assert monday[1:3] == [100.0, 150.0] and len(monday) == 8
+
+
+def test_items_without_nutrients():
+    plan = {"Monday": {"Lunch": {"items": [{"foodName": "rice", "foodCategory": "Grain", "grams": 50, "calories": 65}]}}}
+    assert decode_doc(stored(copy.deepcopy(plan)))["plan"] == plan
+
+
+def test_legacy_documents_pass_through():
+    legacy = {"_id": 1, "plan": make_plan(["Monday"])}
+    assert decode_doc(legacy) is legacy
+    assert decode_doc(None) is None
+
+
+def test_projected_parts_decode():
+    doc = stored(make_plan(["Monday", "Tuesday"]))
+    day = decode_doc({"plan": {"Tuesday": doc["plan"]["Tuesday"]}, "plan_format": PLAN_FORMAT, "foods": doc["foods"]})
+    assert day["plan"]["Tuesday"]["Dinner"]["items"][0]["foodName"] == "Tuesday Dinner"
+    nutrients_only = {"plan": {"Monday": {"Lunch": {"nutrients": {"protein": 1.0}}}},
+                      "plan_format": PLAN_FORMAT, "foods": doc["foods"]}
+    assert decode_doc(nutrients_only)["plan"] == {"Monday": {"Lunch": {"nutrients": {"protein": 1.0}}}}
+
+
+def test_slices_extend_the_stored_table():
+    doc = stored(make_plan(["Monday"]))
+    table = FoodTable(doc["foods"])
+    meal = make_plan(["Friday"])["Friday"]["Lunch"]
+    encoded = encode_slice("Monday.Lunch", meal, table)
+    assert table.grown and table.foods[:3] == doc["foods"]
+    doc["plan"]["Monday"]["Lunch"] = encoded
+    decoded = decode_doc({**doc, "foods": table.foods})
+    assert decoded["plan"]["Monday"]["Lunch"]["items"][0]["foodName"] == "Friday Lunch"
+    assert not FoodTable(table.foods).grown
+
+
+def test_legacy_plan_is_read_then_rewritten_in_format_2(db):
+    legacy = make_plan(["Monday"])
+    db.weeklymeals.insert_one({**plan_filter("amy"), "plan": copy.deepcopy(legacy)})
+    assert find_day_plan("amy", "Monday") == legacy["Monday"]
+    push_weekly_plan("amy", legacy, [])
+    doc = db.weeklymeals.find_one(plan_filter("amy"))
+    assert doc["plan_format"] == PLAN_FORMAT and isinstance(doc["plan"]["Monday"]["Lunch"]["items"][0], list)
+    assert find_day_plan("amy", "Monday") == legacy["Monday"]
@@ -0,0 +1,52 @@
+import time
+from types import SimpleNamespace
+
+import algorithm
+import plan_daemon
+from algorithm import bump_list_version, save_planner_settings
+from plan_daemon import PlanRebuilder, changed_versions, poll
+
+
+def run_poll(db, monkeypatch, *edits):
+    """Poll once per edit, making each edit while the daemon sleeps; returns the rebuilt users per round."""
+    pending = list(edits)
+    rounds: list[list[str]] = []
+    rebuilder = PlanRebuilder(1)
+    monkeypatch.setattr(rebuilder, "_rebuild", lambda username: rounds[-1].append(username))
+    monkeypatch.setattr(plan_daemon, "time", SimpleNamespace(
+        monotonic=time.monotonic, sleep=lambda seconds: (rounds.append([]), pending.pop(0)())))
+    rounds.append([])
+    poll(rebuilder, rounds=len(edits))
+    return rounds
+
+
+def test_poll_rebuilds_after_a_label_change(db, monkeypatch):
+    db.current_list.insert_one({"username": "amy", "name": "Tofu", "calories": 144.0, "grams": 100.0})
+    bump_list_version("amy")
+
+    def label():
+        # What the labeler does: no count, calorie or name change
+        db.current_list.update_one({"name": "Tofu"}, {"$set": {"food_type": "Protein"}})
+        bump_list_version("amy")
+
+    assert run_poll(db, monkeypatch, label, lambda: None) == [["amy"], ["amy"], []]
+
+
+def test_poll_ignores_plan_edits_and_sees_settings(db, monkeypatch):
+    db.current_list.insert_one({"username": "amy", "name": "Tofu", "calories": 144.0, "grams": 100.0})
+    bump_list_version("amy")
+    # The web worker's own rebuild is not what is being tested
+    monkeypatch.setattr(algorithm, "request_plan_rebuild", lambda username: None)
+    rounds = run_poll(db, monkeypatch,
+                      lambda: bump_list_version("amy", plan_input=False),
+                      lambda: save_planner_settings("amy", {}))
+    assert rounds[1:] == [[], ["amy"]]
+
+
+def test_changed_versions_reads_only_recent_changes(db):
+    bump_list_version("amy")
+    versions, since = changed_versions(None)
+    assert versions == {"amy": (1, 0)} and since is not None
+    db.list_versions.update_one({"username": "amy"}, {"$set": {"changed_at": since - 10 * plan_daemon.POLL_OVERLAP}})
+    bump_list_version("bob")
+    assert set(changed_versions(since)[0]) == {"bob"}
@@ -0,0 +1,42 @@
+import api
+import plan_events
+from algorithm import DAYS, push_weekly_plan
+from conftest import make_plan
+
+
+def open_stream(client):
+    """The event stream's messages, read one at a time (the first is the retry delay)."""
+    response = client.get("/api/v1/plan/events", buffered=False)
+    messages = (chunk.decode() for chunk in response.response)
+    assert next(messages).startswith("retry:")
+    return messages
+
+
+def test_plan_write_sends_only_the_changed_meals(client, db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    messages = open_stream(client)
+    plan = make_plan(DAYS)
+    plan["Tuesday"]["Lunch"]["items"][0]["foodName"] = "Lentil soup"
+    push_weekly_plan("amy", plan, [])
+    message = next(messages)
+    assert message.startswith("event: diff")
+    assert '"Tuesday":{"meals":{"Lunch":{"items":[{"name":"Lentil soup"' in message
+    assert "Monday" not in message and "Dinner" not in message
+
+
+def test_idle_stream_is_closed(client, db, monkeypatch):
+    monkeypatch.setattr(api, "KEEPALIVE_SECONDS", 0.01)
+    monkeypatch.setattr(api, "IDLE_SECONDS", 0.03)
+    messages = open_stream(client)
+    assert list(messages)[-1] == "event: close\ndata: {}\n\n"
+    assert plan_events.plan_events.stats()["streams"] == 0
+
+
+def test_opening_too_many_streams_closes_the_oldest(monkeypatch):
+    monkeypatch.setattr(plan_events, "MAX_STREAMS_PER_USER", 2)
+    events = plan_events.PlanEvents()
+    oldest, second, newest = (events.subscribe("amy") for _ in range(3))
+    assert oldest.get_nowait() == {"close": True}
+    assert events.stats()["streams"] == 2
+    events.publish("amy", {"days": {"Monday": {}}})
+    assert second.get_nowait() == newest.get_nowait() == {"days": {"Monday": {}}}
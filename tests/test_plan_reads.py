@@ -0,0 +1,33 @@
+from algorithm import DAYS, push_weekly_plan
+from conftest import make_plan
+from plan_store import find_day_plan, find_meal_plan, find_weekly_doc
+
+
+def test_day_read_only_loads_that_day(db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    doc = find_weekly_doc("amy", ["plan.Tuesday"])
+    assert list(doc["plan"]) == ["Tuesday"]
+    assert find_day_plan("amy", "Tuesday")["Lunch"]["items"][0]["foodName"] == "Tuesday Lunch"
+
+
+def test_meal_read_returns_decoded_items(db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    meal = find_meal_plan("amy", "Friday", "Dinner")
+    assert meal["items"] == [{"foodName": "Friday Dinner", "foodCategory": "Protein", "grams": 100.0,
+                              "calories": 150.0, "nutrients": meal["items"][0]["nutrients"]}]
+    assert meal["total_calories"] == 150.0
+
+
+def test_reads_without_a_plan(db):
+    assert find_day_plan("amy", "Monday") is None
+    assert find_meal_plan("amy", "Monday", "Lunch") is None
+
+
+def test_plan_api_slices(client):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    day = client.get("/api/v1/plan/wednesday").get_json()
+    assert day["day"] == "Wednesday" and set(day["meals"]) == {"Breakfast", "Lunch", "Dinner"}
+    meal = client.get("/api/v1/plan/wednesday/lunch").get_json()
+    assert meal["meal"] == "Lunch" and meal["items"][0]["foodName"] == "Wednesday Lunch"
+    assert client.get("/api/v1/plan/someday").status_code == 404
+    assert client.get("/api/v1/plan/monday/brunch").status_code == 404
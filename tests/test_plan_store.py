@@ -0,0 +1,154 @@
+import threading
+import time
+
+import mongomock
+import pytest
+from pymongo.errors import ExecutionTimeout, PyMongoError
+
+import plan_store
+from algorithm import DAYS, push_weekly_plan
+from conftest import make_plan
+from plan_store import CircuitBreaker, PlanUnavailable, find_day_plan, find_weekly_doc, read_was_stale
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    # Only one probe at a time while half-open
+    assert not breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+
+@pytest.fixture
+def slow_reads(monkeypatch):
+    """Make weeklymeals reads take longer than the (shortened) read budget."""
+    monkeypatch.setattr(plan_store, "PLAN_READ_BUDGET_MS", 20)
+    find_one = mongomock.collection.Collection.find_one
+
+    def slow_find_one(self, *args, max_time_ms=None, **kwargs):
+        # Like mongod, give up once maxTimeMS has passed
+        if max_time_ms is not None and max_time_ms < 100:
+            time.sleep(max_time_ms / 1000)
+            raise ExecutionTimeout("operation exceeded time limit")
+        time.sleep(0.1)
+        return find_one(self, *args, **kwargs)
+
+    return lambda: monkeypatch.setattr(mongomock.collection.Collection, "find_one", slow_find_one)
+
+
+def test_slow_read_serves_last_known_plan(db, slow_reads):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    # A full plan read (the week page) is what keeps the last known copy
+    find_weekly_doc("amy", ["plan"])
+    assert not read_was_stale()
+    slow_reads()
+    day = find_day_plan("amy", "Monday")
+    assert read_was_stale()
+    assert day["Lunch"]["items"][0]["foodName"] == "Monday Lunch"
+
+
+def test_slow_read_without_copy_waits_for_database(db, slow_reads):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    slow_reads()
+    assert find_day_plan("amy", "Monday") is not None
+    assert not read_was_stale()
+
+
+def test_failed_read_falls_back_or_raises(db, monkeypatch):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    find_weekly_doc("amy", ["plan"])
+
+    def failing_find_one(self, *args, **kwargs):
+        raise PyMongoError("down")
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find_one", failing_find_one)
+    assert find_day_plan("amy", "Monday") is not None
+    assert read_was_stale()
+    with pytest.raises(PyMongoError):
+        find_day_plan("bob", "Monday")
+
+
+def test_open_breaker_skips_database(db, monkeypatch):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    find_weekly_doc("amy", ["plan"])
+    monkeypatch.setattr(plan_store, "plan_breaker", CircuitBreaker(1, 60))
+    plan_store.plan_breaker.record_failure()
+    assert find_day_plan("amy", "Tuesday")["Dinner"]["items"][0]["foodName"] == "Tuesday Dinner"
+    assert read_was_stale()
+
+
+def test_open_breaker_without_copy_shows_an_error(client, monkeypatch):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    monkeypatch.setattr(plan_store, "plan_breaker", CircuitBreaker(1, 60))
+    plan_store.plan_breaker.record_failure()
+    with pytest.raises(PlanUnavailable):
+        find_day_plan("amy", "Monday")
+    response = client.get("/day/monday")
+    assert response.status_code == 500 and b"may be stale" not in response.data
+
+
+def test_concurrent_reads_within_budget_keep_the_breaker_closed(db, monkeypatch):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    monkeypatch.setattr(plan_store, "PLAN_READ_BUDGET_MS", 30)
+    monkeypatch.setattr(plan_store, "plan_breaker", CircuitBreaker(1, 60))
+    find_one = mongomock.collection.Collection.find_one
+
+    def busy_find_one(self, *args, **kwargs):
+        time.sleep(0.01)
+        return find_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find_one", busy_find_one)
+    # Many more page loads than there used to be read threads; none waits on another
+    readers = [threading.Thread(target=find_day_plan, args=("amy", "Monday")) for _ in range(16)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    assert not plan_store.plan_breaker.is_open
+
+
+def test_background_refreshes_do_not_queue(db, monkeypatch):
+    release = threading.Event()
+    find_one = mongomock.collection.Collection.find_one
+
+    def blocked_find_one(self, *args, **kwargs):
+        release.wait(5)
+        return find_one(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find_one", blocked_find_one)
+    for n in range(plan_store.REFRESH_WORKERS + 3):
+        plan_store._refresh_in_background(f"user{n}")
+    assert len(plan_store._refreshing) == plan_store.REFRESH_WORKERS
+    release.set()
+    for _ in range(100):
+        if not plan_store._refreshing:
+            break
+        time.sleep(0.01)
+    assert not plan_store._refreshing
+
+
+def test_day_and_stamp_reads_do_not_reload_the_whole_plan(db, monkeypatch):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    find_weekly_doc("amy", ["plan"])
+    push_weekly_plan("amy", make_plan(DAYS[:1]), [])
+    refreshed = []
+    monkeypatch.setattr(plan_store, "_refresh_in_background", refreshed.append)
+    find_day_plan("amy", "Monday")
+    plan_store.plan_stamp("amy")
+    assert refreshed == []
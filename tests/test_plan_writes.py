@@ -0,0 +1,79 @@
+import pytest
+
+import algorithm
+from algorithm import (
+    DAYS,
+    PoolSnapshot,
+    bump_list_version,
+    build_meal_plan,
+    get_input_version,
+    input_outdated,
+    plan_filter,
+    push_weekly_plan,
+)
+from conftest import make_plan
+
+
+def stored_plan(db):
+    docs = list(db.weeklymeals.find({"username": "amy"}))
+    assert len(docs) == 1
+    return docs[0]
+
+
+@pytest.fixture(params=["indexed", "unindexed"])
+def plans(request, db):
+    """Run each test with and without the unique (username, week_start) index."""
+    if request.param == "unindexed":
+        db.weeklymeals.drop_indexes()
+    return db
+
+
+def test_newer_inputs_replace_the_plan(plans):
+    assert push_weekly_plan("amy", make_plan(DAYS, 100.0), [], input_version=1)
+    assert push_weekly_plan("amy", make_plan(DAYS, 200.0), [], input_version=2)
+    assert stored_plan(plans)["input_version"] == 2
+
+
+def test_plan_from_older_inputs_is_dropped(plans):
+    assert push_weekly_plan("amy", make_plan(DAYS, 200.0), [], input_version=5)
+    assert not push_weekly_plan("amy", make_plan(DAYS, 100.0), [], input_version=4)
+    doc = stored_plan(plans)
+    assert doc["input_version"] == 5
+    assert doc["plan"]["Monday"]["Lunch"]["items"][0][2] == 200.0
+
+
+def test_same_inputs_may_rewrite(plans):
+    assert push_weekly_plan("amy", make_plan(DAYS), [], input_version=3)
+    assert push_weekly_plan("amy", make_plan(DAYS), [], input_version=3)
+    stored_plan(plans)
+
+
+def test_versioned_write_replaces_an_unversioned_plan(plans):
+    assert push_weekly_plan("amy", make_plan(DAYS), [])
+    assert push_weekly_plan("amy", make_plan(DAYS), [], input_version=1)
+    assert stored_plan(plans)["input_version"] == 1
+
+
+def test_plan_edits_do_not_outdate_rebuilds(db):
+    bump_list_version("amy")
+    version = get_input_version("amy")
+    bump_list_version("amy", plan_input=False)
+    assert get_input_version("amy") == version and not input_outdated("amy", version)
+    bump_list_version("amy")
+    assert input_outdated("amy", version)
+
+
+def test_rebuild_from_outdated_inputs_is_not_stored(db, monkeypatch):
+    bump_list_version("amy")
+    version = get_input_version("amy")
+    rows = [{"_id": 1, "name": "rice", "food_type": "Grain", "calories": 1300.0, "time_in_day": "empty",
+             "parts": [{"_id": 1, "grams": 1000.0, "amount": "1000"}]}]
+
+    # The list changes right after the pool snapshot is taken (the $group snapshot itself needs mongod)
+    def snapshot_then_edit(user_id):
+        bump_list_version(user_id)
+        return PoolSnapshot(rows, 0, version)
+
+    monkeypatch.setattr(algorithm, "fetch_pool_snapshot", snapshot_then_edit)
+    assert build_meal_plan("amy").get("outdated")
+    assert db.weeklymeals.find_one(plan_filter("amy")) is None
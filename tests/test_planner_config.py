@@ -0,0 +1,62 @@
+import pytest
+
+import algorithm
+from planner import DEFAULT_PLANNER_CONFIG
+from planner_config import compile_config, merge_settings
+
+
+def test_overrides_change_only_the_meals_given():
+    settings = merge_settings(DEFAULT_PLANNER_CONFIG, {
+        "calorie_goals": {"Lunch": 450},
+        "meal_composition": {"Dinner": {"Protein": 1, "Vegetable": 2}},
+    })
+    assert settings["calorie_goals"]["Lunch"] == 450
+    assert settings["calorie_goals"]["Breakfast"] == DEFAULT_PLANNER_CONFIG.calorie_goals["Breakfast"]
+    # A new composition without splits shares the meal's calories evenly
+    assert settings["meal_calorie_splits"]["Dinner"] == {"Protein": 0.5, "Vegetable": 0.5}
+    config = compile_config(**settings)
+    assert config.category_budgets["Dinner"]["Protein"] == settings["calorie_goals"]["Dinner"] / 2
+
+
+@pytest.mark.parametrize("overrides, message", [
+    ([], "must be an object"),
+    ({"calorie_goals": {"Brunch": 300}}, "bad calorie goal for 'Brunch'"),
+    ({"calorie_goals": {"Lunch": -1}}, "bad calorie goal"),
+    ({"calorie_goals": {"Lunch": "lots"}}, "bad calorie goal"),
+    ({"meal_composition": {"Lunch": {}}}, "bad meal composition"),
+    ({"meal_composition": {"Lunch": {"Protein": 0}}}, "positive integers"),
+    ({"meal_composition": {"Lunch": {"Protein": 1.5}}}, "positive integers"),
+    ({"meal_calorie_splits": {"Lunch": {"Protein": -0.2}}}, "non-negative numbers"),
+    ({"meal_calorie_splits": {"Lunch": "half"}}, "bad calorie split"),
+    ({"optimize_ms": -1}, "optimize_ms must be between"),
+    ({"optimize_ms": 60000}, "optimize_ms must be between"),
+    ({"optimize_ms": True}, "optimize_ms must be between"),
+])
+def test_bad_overrides_are_rejected(overrides, message):
+    with pytest.raises(ValueError, match=message):
+        merge_settings(DEFAULT_PLANNER_CONFIG, overrides)
+
+
+def test_settings_route_rejects_bad_settings_without_saving(client, db):
+    response = client.put("/api/v1/planner-settings", json={"calorie_goals": {"Lunch": -5}})
+    assert response.status_code == 400 and "bad calorie goal" in response.get_json()["error"]
+    assert db.planner_settings.count_documents({}) == 0
+    assert client.get("/api/v1/planner-settings").get_json()["settings_version"] == 0
+
+
+def test_search_budget_is_per_user(client, db, monkeypatch):
+    monkeypatch.setattr(algorithm, "PLAN_OPTIMIZE_MS", 5.0)
+    monkeypatch.setattr(algorithm, "request_plan_rebuild", lambda username: None)
+    assert client.get("/api/v1/planner-settings").get_json()["optimize_ms"] is None
+    assert algorithm.optimize_budget(DEFAULT_PLANNER_CONFIG) == 5.0
+
+    response = client.put("/api/v1/planner-settings", json={"optimize_ms": 250})
+    assert response.get_json()["optimize_ms"] == 250
+    version = response.get_json()["settings_version"]
+    algorithm._planner_configs.clear()
+    assert algorithm.optimize_budget(algorithm.get_planner_config("amy", version)) == 250
+    # Other users keep the server default
+    assert algorithm.optimize_budget(algorithm.get_planner_config("someone", 0)) == 5.0
+
+    response = client.put("/api/v1/planner-settings", json={"optimize_ms": None})
+    assert response.get_json()["optimize_ms"] is None
@@ -0,0 +1,53 @@
+import pytest
+
+import algorithm
+from algorithm import build_food_pool, fetch_pool_snapshot, update_current_list_amounts
+
+# mongomock has no $trim, so the $group merge runs against a real mongod
+
+
+@pytest.fixture
+def food_db(mongod, monkeypatch):
+    monkeypatch.setattr(algorithm, "food_db", mongod)
+    return mongod
+
+
+def test_duplicates_merge_by_name_and_breakfast(food_db):
+    food_db.current_list.insert_many([
+        {"username": "amy", "name": "Rice", "grams": 200.0, "calories": 260.0, "food_type": "Grain", "time_in_day": "empty"},
+        {"username": "amy", "name": " rice ", "grams": 300.0, "calories": 390.0, "food_type": "Grain", "time_in_day": "empty"},
+        {"username": "amy", "name": "rice", "grams": 100.0, "calories": 130.0, "food_type": "Grain", "time_in_day": "Breakfast"},
+        {"username": "amy", "name": "apple", "amount": "2 apples", "calories": 190.0, "food_type": "Fruit"},
+        {"username": "bob", "name": "rice", "grams": 900.0, "calories": 1170.0, "food_type": "Grain"},
+    ])
+    food_db.list_versions.insert_one({"username": "amy", "version": 4, "settings_version": 2, "input_version": 3})
+    snapshot = fetch_pool_snapshot("amy")
+    rows = snapshot.items
+    assert (snapshot.settings_version, snapshot.input_version) == (2, 3)
+    by_key = {(row["name"].strip().lower(), row["time_in_day"]): row for row in rows}
+    assert set(by_key) == {("rice", "empty"), ("rice", "breakfast"), ("apple", "empty")}
+    merged = by_key[("rice", "empty")]
+    assert merged["calories"] == 650.0
+    assert sorted(part["grams"] for part in merged["parts"]) == [200.0, 300.0]
+    # Rows without a grams field keep their amount for parsing
+    assert by_key[("apple", "empty")]["parts"][0]["grams"] is None
+
+    pool = build_food_pool(rows)
+    rice = next(f for f in pool if f["foodName"].strip().lower() == "rice" and not f["isBreakfast"])
+    assert rice["original_grams"] == 500.0
+    assert rice["cal_per_gram"] == pytest.approx(1.3)
+
+
+def test_used_grams_are_taken_from_merged_entries_in_turn(food_db):
+    food_db.current_list.insert_many([
+        {"username": "amy", "name": "rice", "grams": 200.0, "calories": 260.0},
+        {"username": "amy", "name": "Rice", "grams": 300.0, "calories": 390.0},
+    ])
+    pool = build_food_pool(fetch_pool_snapshot("amy").items)
+    pool[0]["remaining_grams"] = 250.0
+    update_current_list_amounts("amy", pool)
+    assert sorted(doc["grams"] for doc in food_db.current_list.find()) == [0.0, 250.0]
+
+
+def test_empty_list(food_db):
+    assert fetch_pool_snapshot("amy") == ([], 0, 0)
@@ -0,0 +1,64 @@
+import pytest
+
+from quantity import migrate_grams, parse_quantity
+
+
+@pytest.mark.parametrize("amount, food, grams", [
+    ("500", "chicken breast", 500.0),
+    ("500 g", "rice", 500.0),
+    ("2 lbs", "beef", 907.184),
+    ("32 oz", "yogurt", 907.184),
+    ("1 kg", "flour", 1000.0),
+    ("1 gallon", "milk", 3899.0723),
+    ("1 1/2 cups", "milk", 370.8),
+    ("1/2 cup", "oats", 49.2),
+    ("1 dozen", "eggs", 600.0),
+    ("3 heads", "broccoli", 1800.0),
+    ("2 cans", "beans", 800.0),
+    ("3 apples", "apple", 546.0),
+    ("4 each", "Sweet Potatoes", 520.0),
+    ("4 pcs", "chicken breast", 700.0),
+    ("6 x", "eggs", 300.0),
+    # A bare number is grams, even for foods bought by the piece
+    ("20", "chicken breast", 20.0),
+    ("10", "spinach", 10.0),
+    ("4", "Sweet Potatoes", 4.0),
+    ("2.5", "banana", 2.5),
+    ("2 x 500g", "rice", 1000.0),
+    ("3x1 lb", "chicken", 1360.776),
+    ("2 x 3 each", "apple", 1092.0),
+    ("2 x 500", "rice", 1000.0),
+    (250, "rice", 250.0),
+    ("some", "rice", 0.0),
+])
+def test_parse_quantity(amount, food, grams):
+    assert parse_quantity(amount, food) == pytest.approx(grams, rel=1e-3)
+
+
+def test_migrate_grams_scales_calories(db):
+    db.current_list.insert_many([
+        {"username": "amy", "name": "milk", "amount": "1 gallon", "calories": 42.0},
+        {"username": "bob", "name": "rice", "amount": "200 g", "calories": 260.0},
+        {"username": "cal", "name": "rice", "amount": "100 g", "grams": 100.0, "calories": 130.0},
+    ])
+    assert migrate_grams(db.current_list) == {"amy", "bob"}
+    milk = db.current_list.find_one({"name": "milk"})
+    # The old parse read "1 gallon" as 1 g
+    assert milk["grams"] == pytest.approx(3899.07, rel=1e-3)
+    assert milk["calories"] == pytest.approx(42.0 * milk["grams"])
+    assert db.current_list.find_one({"username": "bob"})["calories"] == 260.0
+
+
+def test_migrate_grams_keeps_bare_numbers_as_grams(db):
+    db.current_list.insert_many([
+        {"username": "amy", "name": "chicken breast", "amount": "20", "calories": 33.0},
+        {"username": "amy", "name": "spinach", "amount": "10", "calories": 2.3},
+        {"username": "amy", "name": "sweet potato", "amount": "4 each", "calories": 3.44},
+    ])
+    migrate_grams(db.current_list)
+    rows = {row["name"]: row for row in db.current_list.find()}
+    assert (rows["chicken breast"]["grams"], rows["chicken breast"]["calories"]) == (20.0, 33.0)
+    assert (rows["spinach"]["grams"], rows["spinach"]["calories"]) == (10.0, 2.3)
+    # Counts with a count word are converted, and their calories follow
+    assert rows["sweet potato"]["grams"] == 520.0
+    assert rows["sweet potato"]["calories"] == pytest.approx(3.44 * 130)
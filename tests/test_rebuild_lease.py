@@ -0,0 +1,116 @@
+import threading
+import time
+from datetime import timedelta, timezone
+
+import pytest
+
+import rebuild_lease
+from rebuild_lease import LEASES, acquire_lease, release_lease, renew_lease, run_with_lease
+
+
+def lease(db, username="amy"):
+    return db[LEASES].find_one({"_id": username})
+
+
+def expire(db, username="amy"):
+    db[LEASES].update_one({"_id": username}, {"$set": {"expires_at": rebuild_lease._now() - timedelta(seconds=1)}})
+
+
+def test_acquire_and_release(mongod):
+    token = acquire_lease(mongod, "amy")
+    assert token and lease(mongod)["holder"] == token and not lease(mongod)["dirty"]
+    assert release_lease(mongod, "amy", token) is False
+    assert lease(mongod)["holder"] is None
+    # A released lease can be taken again
+    assert acquire_lease(mongod, "amy")
+
+
+def test_contention_marks_the_lease_dirty(mongod):
+    token = acquire_lease(mongod, "amy")
+    assert acquire_lease(mongod, "amy") is None
+    assert lease(mongod)["dirty"] and lease(mongod)["holder"] == token
+    # The holder is told to rebuild again and keeps the lease for it
+    assert release_lease(mongod, "amy", token) is True
+    assert lease(mongod)["holder"] == token and not lease(mongod)["dirty"]
+    assert release_lease(mongod, "amy", token) is False
+
+
+def test_expired_lease_is_taken_over(mongod):
+    stale = acquire_lease(mongod, "amy")
+    expire(mongod)
+    token = acquire_lease(mongod, "amy")
+    assert token and token != stale
+    # The old holder can neither release nor renew the new holder's lease
+    assert release_lease(mongod, "amy", stale) is False
+    assert lease(mongod)["holder"] == token
+
+
+def test_users_have_separate_leases(mongod):
+    assert acquire_lease(mongod, "amy") and acquire_lease(mongod, "bob")
+
+
+def test_run_with_lease_reruns_once_for_waiting_workers(mongod):
+    runs = []
+
+    def rebuild():
+        runs.append(len(runs))
+        if len(runs) == 1:
+            # Two more workers ask while the first rebuild runs
+            assert run_with_lease(mongod, "amy", lambda: runs.append("other")) is False
+            assert run_with_lease(mongod, "amy", lambda: runs.append("other")) is False
+
+    assert run_with_lease(mongod, "amy", rebuild) is True
+    assert runs == [0, 1]
+    assert lease(mongod)["holder"] is None
+
+
+def test_failed_rebuild_frees_the_lease(mongod):
+    with pytest.raises(ZeroDivisionError):
+        run_with_lease(mongod, "amy", lambda: 1 / 0)
+    assert lease(mongod)["holder"] is None
+
+
+def test_concurrent_workers_never_overlap(mongod):
+    running, overlaps, runs = [0], [0], [0]
+    lock = threading.Lock()
+
+    def rebuild():
+        with lock:
+            running[0] += 1
+            runs[0] += 1
+            overlaps[0] += running[0] > 1
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    workers = [threading.Thread(target=run_with_lease, args=(mongod, "amy", rebuild)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert overlaps[0] == 0
+    assert 1 <= runs[0] <= 2
+    assert lease(mongod)["holder"] is None
+
+
+def test_lease_is_renewed_during_a_long_rebuild(mongod, monkeypatch):
+    monkeypatch.setattr(rebuild_lease, "LEASE_SECONDS", 0.3)
+    expired = []
+
+    def rebuild():
+        # Outlast the lease several times over; it must never run out meanwhile
+        for _ in range(5):
+            time.sleep(0.2)
+            expired.append(lease(mongod)["expires_at"].replace(tzinfo=timezone.utc) <= rebuild_lease._now())
+
+    assert run_with_lease(mongod, "amy", rebuild) is True
+    assert expired == [False] * 5
+    assert lease(mongod)["holder"] is None
+
+
+def test_renew_needs_the_current_token(mongod):
+    stale = acquire_lease(mongod, "amy")
+    expire(mongod)
+    token = acquire_lease(mongod, "amy")
+    assert renew_lease(mongod, "amy", stale) is False
+    assert renew_lease(mongod, "amy", token) is True
@@ -0,0 +1,60 @@
+import pytest
+
+import algorithm
+from algorithm import DAYS, PoolSnapshot, build_meal_plan, bump_list_version, get_input_version, replan_from_day
+from plan_store import find_weekly_doc, set_plan_slice
+
+FOODS = [("Chicken Breast", "Protein", 1.65), ("Broccoli", "Vegetable", 0.34), ("Rice", "Grain", 1.3),
+         ("Apple", "Fruit", 0.52), ("Milk", "Dairy", 0.42), ("Eggs", "Protein", 1.43)]
+
+
+@pytest.fixture
+def grocery_list(db, monkeypatch):
+    """A fixed grocery list in place of the pool snapshot (whose $group needs mongod)."""
+    rows = [{"_id": n, "name": name, "food_type": category, "calories": 2000 * per_gram, "time_in_day": "empty",
+             "parts": [{"_id": n, "grams": 2000.0}]} for n, (name, category, per_gram) in enumerate(FOODS)]
+    bump_list_version("amy")
+    settings = {"version": 0}
+    monkeypatch.setattr(algorithm, "fetch_pool_snapshot",
+                        lambda user_id: PoolSnapshot(rows, settings["version"], get_input_version(user_id)))
+    return settings
+
+
+def stored_plan():
+    return find_weekly_doc("amy", ["plan", "checkpoints"])
+
+
+def test_build_records_a_checkpoint_before_every_day(grocery_list):
+    build_meal_plan("amy")
+    checkpoints = stored_plan()["checkpoints"]
+    assert list(checkpoints["days"]) == DAYS
+    assert checkpoints["days"]["Monday"] == checkpoints["pool_grams"] == [2000.0] * len(FOODS)
+    # The pool only shrinks from day to day
+    for earlier, later in zip(DAYS, DAYS[1:]):
+        assert all(a >= b for a, b in zip(checkpoints["days"][earlier], checkpoints["days"][later]))
+
+
+def test_replan_keeps_earlier_days_and_matches_a_full_rebuild(grocery_list, client):
+    build_meal_plan("amy")
+    before = stored_plan()["plan"]
+    response = client.post("/api/v1/plan/replan/thursday")
+    assert response.get_json()["replanned_days"] == DAYS[3:]
+    after = stored_plan()["plan"]
+    # Nothing changed, so resuming from Thursday's checkpoint plans the same days again
+    assert after == before
+
+
+def test_new_settings_replan_the_whole_week(grocery_list):
+    build_meal_plan("amy")
+    grocery_list["version"] = 1
+    result = replan_from_day("amy", "Thursday")
+    assert "replanned_days" not in result and list(result["plan"]) == DAYS
+
+
+def test_replan_leaves_earlier_edits_alone(grocery_list):
+    build_meal_plan("amy")
+    edited = {"items": [{"foodName": "Rice", "foodCategory": "Grain", "grams": 1, "calories": 1.3}],
+              "total_calories": 1.3, "calorie_goal": 650}
+    set_plan_slice("amy", "Tuesday.Lunch", edited)
+    replan_from_day("amy", "Thursday")
+    assert stored_plan()["plan"]["Tuesday"]["Lunch"]["items"] == edited["items"]
@@ -0,0 +1,42 @@
+import algorithm
+from algorithm import DAYS, push_weekly_plan
+from conftest import make_plan
+from plan_store import set_plan_slice
+
+
+def week_calories(db):
+    week = db.nutrition_rollups.find_one({"username": "amy", "period": "week"})
+    return week and week["calories"]
+
+
+def test_plan_writes_leave_rollups_to_the_dashboard(client, db, monkeypatch):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    assert week_calories(db) is None
+
+    assert client.get("/dashboard").status_code == 200
+    assert week_calories(db) == 21 * 150.0
+
+    runs = []
+    rollup_plan = algorithm.rollup_plan
+    monkeypatch.setattr(algorithm, "rollup_plan", lambda *args: (runs.append(args), rollup_plan(*args)))
+    client.get("/dashboard")
+    assert runs == []
+
+    lunch = make_plan(["Monday"], calories=50.0)["Monday"]["Lunch"]
+    set_plan_slice("amy", "Monday.Lunch", lunch)
+    client.get("/dashboard")
+    assert len(runs) == 1 and week_calories(db) == 20 * 150.0 + 50.0
+
+
+def test_plan_changed_while_rolling_up_stays_stale(db, monkeypatch):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    rollup_plan = algorithm.rollup_plan
+
+    def rollup_during_a_write(*args):
+        rollup_plan(*args)
+        push_weekly_plan("amy", make_plan(DAYS[:1]), [])
+
+    monkeypatch.setattr(algorithm, "rollup_plan", rollup_during_a_write)
+    algorithm.refresh_stale_rollups("amy")
+    # The second write's mark survives, so the next dashboard read rolls it up
+    assert "rollups_stale" in db.weeklymeals.find_one({"username": "amy"})
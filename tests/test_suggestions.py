@@ -0,0 +1,45 @@
+import datetime
+
+from history_search import index_history_items
+from suggestions import STATS, record_purchases, suggest
+
+WEEK = datetime.datetime(2026, 3, 2)
+
+
+def archive(db, week_start, names):
+    """What archiving does: add the week to grocery_history, then to the search table and the stats."""
+    items = [{"name": name, "food_type": "Protein", "date_added": week_start} for name in names]
+    db.grocery_history.update_one({"username": "amy", "week_start": week_start},
+                                  {"$push": {"items": {"$each": items}}}, upsert=True)
+    index_history_items(db.grocery_history, "amy", [(week_start, items)])
+    record_purchases(db.grocery_history, "amy", [(week_start, items)])
+
+
+def stats(db, key):
+    return db[STATS].find_one({"username": "amy", "key": key})
+
+
+def test_a_week_archived_in_two_batches_counts_once(db):
+    archive(db, WEEK, ["Tofu"])
+    archive(db, WEEK + datetime.timedelta(days=7), ["Tofu"])
+    archive(db, WEEK + datetime.timedelta(days=7), ["Tofu", "Eggs"])
+    tofu = stats(db, "tofu")
+    assert tofu["weeks"] == 2 and tofu["purchases"] == 3
+    assert stats(db, "eggs")["weeks"] == 1
+
+
+def test_archiving_the_same_week_again_does_not_make_a_staple(db):
+    archive(db, WEEK, ["Tofu"])
+    for _ in range(2):
+        # A re-run, or compaction overlapping the archive
+        record_purchases(db.grocery_history, "amy", [(WEEK, [{"name": "Tofu", "food_type": "Protein"}])])
+    assert stats(db, "tofu")["weeks"] == 1
+    assert suggest(db.grocery_history, "amy", [], [])["staples"] == []
+
+
+def test_stats_from_before_week_starts_are_rebuilt(db):
+    archive(db, WEEK, ["Tofu"])
+    archive(db, WEEK + datetime.timedelta(days=7), ["Tofu"])
+    db[STATS].update_many({}, {"$unset": {"week_starts": ""}, "$set": {"weeks": 9}})
+    archive(db, WEEK + datetime.timedelta(days=14), ["Tofu"])
+    assert stats(db, "tofu")["weeks"] == 3
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+from algorithm import DAYS, current_week_start, push_weekly_plan
+from conftest import make_plan
+from plan_codec import PLAN_FORMAT, encode_plan
+from plan_store import adjacent_weeks
+
+
+def store_past_week(db, weeks_ago):
+    week_start = current_week_start() - timedelta(weeks=weeks_ago)
+    plan, table = encode_plan(make_plan(DAYS[:1]))
+    db.weeklymeals.insert_one({"username": "amy", "week_start": week_start, "plan": plan,
+                               "plan_format": PLAN_FORMAT, "foods": table.foods,
+                               "updated_at": datetime.now(timezone.utc)})
+    return week_start.strftime("%Y-%m-%d")
+
+
+def test_adjacent_weeks_skip_weeks_without_a_plan(db):
+    three, five = store_past_week(db, 3), store_past_week(db, 5)
+    week = current_week_start() - timedelta(weeks=3)
+    earlier, later = adjacent_weeks("amy", week)
+    assert earlier.strftime("%Y-%m-%d") == five and later is None
+    assert adjacent_weeks("amy", current_week_start())[0].strftime("%Y-%m-%d") == three
+
+
+def test_current_week_links_to_the_latest_past_week(client, db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    three = store_past_week(db, 3)
+    page = client.get("/week").get_data(as_text=True)
+    assert f'href="/week?start={three}" class="week-nav-btn">‹ Prev' in page
+    assert 'class="week-nav-btn">Next ›' not in page
+
+
+def test_past_weeks_are_read_only_and_cached_for_good(client, db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    three, five = store_past_week(db, 3), store_past_week(db, 5)
+
+    oldest = client.get(f"/week?start={five}")
+    assert "immutable" in oldest.headers["Cache-Control"]
+    assert f'href="/week?start={three}" class="week-nav-btn">Next ›' in oldest.get_data(as_text=True)
+    assert client.get(f"/week?start={five}", headers={"If-None-Match": oldest.headers["ETag"]}).status_code == 304
+
+    # The newest past week links to the current week, which is a past week by next Monday
+    newest = client.get(f"/week?start={three}")
+    assert "immutable" not in newest.headers.get("Cache-Control", "")
+
+
+def test_a_future_or_bad_start_shows_the_current_week(client, db):
+    push_weekly_plan("amy", make_plan(DAYS), [])
+    future = (current_week_start() + timedelta(weeks=2)).strftime("%Y-%m-%d")
+    current = client.get("/week?format=json").get_json()["week_start"]
+    assert client.get(f"/week?start={future}&format=json").get_json()["week_start"] == current
+    assert client.get("/week?start=soon&format=json").get_json()["week_start"] == current
@@ -0,0 +1,61 @@
+import copy
+import subprocess
+import sys
+
+import pytest
+
+import what_if
+from algorithm import PoolSnapshot
+from what_if import compare_variants
+
+ROWS = [
+    {"_id": 1, "name": "chicken", "food_type": "Protein", "calories": 16500.0, "time_in_day": "empty",
+     "parts": [{"_id": 1, "grams": 10000.0, "amount": "10000"}]},
+    {"_id": 2, "name": "rice", "food_type": "Grain", "calories": 13000.0, "time_in_day": "empty",
+     "parts": [{"_id": 2, "grams": 10000.0, "amount": "10000"}]},
+]
+
+
+class InlineExecutor:
+    """Runs the variants in this process on copies of their arguments, as pickling would, and keeps them."""
+    def __init__(self):
+        self.calls = []
+
+    def map(self, fn, *iterables):
+        calls = [copy.deepcopy(args) for args in zip(*iterables)]
+        self.calls.extend(calls)
+        return [fn(*args) for args in calls]
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    inline = InlineExecutor()
+    monkeypatch.setattr(what_if, "_get_executor", lambda: inline)
+    # The $group snapshot itself needs mongod
+    monkeypatch.setattr(what_if, "fetch_pool_snapshot", lambda user_id: PoolSnapshot(ROWS, 0, 0))
+    return inline
+
+
+def test_variants_share_one_search_budget(db, executor, monkeypatch):
+    monkeypatch.setattr(what_if, "WHAT_IF_OPTIMIZE_MS", 40)
+    results = compare_variants("amy", [{"name": "cut", "calorie_goals": {"Lunch": 400}}, {}, {}, {}])
+    assert [result["name"] for result in results] == ["cut", "Variant 2", "Variant 3", "Variant 4"]
+    assert [budget for _, _, budget in executor.calls] == [10.0] * 4
+    # Smaller lunches leave more food over
+    assert sum(results[0]["leftover_grams"].values()) > sum(results[1]["leftover_grams"].values())
+
+
+def test_bad_variants_are_rejected(db, executor):
+    with pytest.raises(ValueError, match="Variant 2"):
+        compare_variants("amy", [{}, {"calorie_goals": {"Lunch": -1}}])
+    with pytest.raises(ValueError):
+        compare_variants("amy", [{}] * (what_if.MAX_VARIANTS + 1))
+
+
+def test_worker_module_does_not_load_the_app():
+    # What a spawned worker imports to run plan_variant
+    check = ("import sys, what_if_worker; "
+             "print(sorted({'app', 'algorithm', 'grocery', 'pymongo'} & set(sys.modules)))")
+    out = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True,
+                         cwd=what_if.__file__.rsplit("/", 1)[0])
+    assert out.stdout.strip() == "[]"
@@ -0,0 +1,66 @@
+from __future__ import annotations
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from algorithm import fetch_pool_snapshot, build_food_pool, get_planner_config
+from planner_config import PlannerConfig, merge_settings
+from what_if_worker import POOL_FIELDS, plan_variant
+'''
+This module plans "what if" variants of the planner settings (different calorie goals, meal compositions or calorie splits, applied on top of the user's own settings) side by side so a user can compare them before changing anything. The user's grocery pool is read from Mongo once; every variant is planned on its own copy of that snapshot in a small process pool, and nothing is written back. The worker processes only import what_if_worker.py, which stays clear of Mongo and the app. The local search after the greedy pass shares one budget, WHAT_IF_OPTIMIZE_MS, between all the variants of a request.
+'''
+
+WHAT_IF_WORKERS = int(os.getenv("WHAT_IF_WORKERS", "2"))
+# milliseconds of local search per comparison, split evenly between its variants (0 = greedy plans only)
+WHAT_IF_OPTIMIZE_MS = float(os.getenv("WHAT_IF_OPTIMIZE_MS", "0"))
+MAX_VARIANTS = 8
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Process pool shared by all requests in this worker, started on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, so children don't inherit the parent's open MongoClient sockets
+            _executor = ProcessPoolExecutor(
+                max_workers=WHAT_IF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def normalize_variant(index: int, variant: Any, base: PlannerConfig) -> dict[str, Any]:
+    """Validate a variant and merge it over the user's settings (raises ValueError)."""
+    label = f"Variant {index + 1}"
+    settings = merge_settings(base, variant, label)
+    return {"name": str(variant.get("name") or label), **settings}
+
+
+def compare_variants(user_id: str, variants: list[Any]) -> list[dict[str, Any]]:
+    """
+    Plan every variant on one snapshot of the user's grocery pool and return
+    the results in the order given. Nothing is stored.
+    """
+    if not isinstance(variants, list) or not variants:
+        raise ValueError("Expected a non-empty list of variants")
+    if len(variants) > MAX_VARIANTS:
+        raise ValueError(f"At most {MAX_VARIANTS} variants can be compared at once")
+    pool_snapshot = fetch_pool_snapshot(user_id)
+    base = get_planner_config(user_id, pool_snapshot.settings_version)
+    normalized = [normalize_variant(index, variant, base) for index, variant in enumerate(variants)]
+
+    snapshot = [
+        {field: food[field] for field in POOL_FIELDS}
+        for food in build_food_pool(pool_snapshot.items)
+    ]
+    if not snapshot:
+        return []
+    optimize_ms = WHAT_IF_OPTIMIZE_MS / len(normalized)
+    executor = _get_executor()
+    return list(executor.map(plan_variant, [snapshot] * len(normalized), normalized,
+                             [optimize_ms] * len(normalized)))
@@ -0,0 +1,36 @@
+from __future__ import annotations
+from typing import Any
+
+from optimizer import plan_error
+from planner import DAYS, plan_days
+from planner_config import compile_config
+'''
+This module holds the code what_if.py runs in its worker processes. Spawned workers import it (and only the planner modules it needs) to unpickle plan_variant, so it must not import the app, algorithm.py or anything else that connects to Mongo at import time.
+'''
+
+# Fields of a pool entry the planner reads; the rest (Mongo ids) stays behind
+POOL_FIELDS = ("foodName", "foodCategory", "isBreakfast", "original_grams",
+               "remaining_grams", "cal_per_gram", "remaining_calories")
+
+
+def plan_variant(pool: list[dict[str, Any]], variant: dict[str, Any], optimize_ms: float = 0) -> dict[str, Any]:
+    """
+    Plan a week for one variant (runs in a worker process on its own copy of
+    the pool), with `optimize_ms` of local search after the greedy pass.
+    """
+    config = compile_config(
+        variant["calorie_goals"], variant["meal_composition"], variant["meal_calorie_splits"])
+    plan, missing_by_day, _ = plan_days(pool, DAYS, optimize_ms, config)
+    weekly_calories = sum(slot["total_calories"] for meals in plan.values() for slot in meals.values())
+    return {
+        **variant,
+        "plan": plan,
+        "weekly_calories": round(weekly_calories, 1),
+        "average_daily_calories": round(weekly_calories / len(DAYS), 1),
+        "calorie_error": plan_error(plan),
+        "missing_categories": sorted({cat for missing in missing_by_day.values() for cat in missing}),
+        "leftover_grams": {
+            food["foodName"]: round(food["remaining_grams"])
+            for food in pool if food["remaining_grams"] >= 1
+        },
+    }